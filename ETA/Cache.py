@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+''' on-disk cache of ingested TaskTables.
+
+Each cache entry is a directory holding one .npy file per array column
+(loaded memory-mapped, copy-on-write) and a pickle for the ids, categories and object columns.
+An entry is named after the input path, the time_fields and the TaskTimes class that built it
+(along with its DERIVE_VERSION, so changed derivations do not read stale derived columns),
+and remembers the size and mtime of the input file. If the file changed, the entry is rebuilt.
+
+The cache directory defaults to the ETA_CACHE_DIR environment variable, or ./.eta_cache.
+Setting ETA_CACHE_DIR to an empty string turns caching off.
+
+>>> import datetime, tempfile
+>>> from ETA.Columns import TaskTableBuilder
+>>> builder = TaskTableBuilder(['finish_time'])
+>>> builder.add({'_id': 'a', 'finish_time': '2020-08-05T11:51:19.168Z', 'distro': 'rhel62-small', 'depends_on': []})
+>>> table = builder.build()
+>>> tmp = tempfile.mkdtemp()
+>>> source = os.path.join(tmp, 'tasks.json')
+>>> with open(source, 'w') as f:
+...     _ = f.write('[]')
+>>> cache = TableCache(source, ['finish_time'], 'TaskTimes', os.path.join(tmp, 'cache'))
+>>> cache.load() is None
+True
+>>> cache.save(table)
+>>> cache.load()['a']
+{'_id': 'a', 'finish_time': datetime.datetime(2020, 8, 5, 11, 51, 19, 168000), 'distro': 'rhel62-small', 'depends_on': []}
+>>> with open(source, 'w') as f:
+...     _ = f.write('[ ]')
+>>> cache.load() is None
+True
+'''
+
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+from ETA.Columns import CategoricalColumn, DeltaColumn, ObjectColumn, TaskTable, TimeColumn
+
+FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = './.eta_cache'
+
+def default_cache_dir():
+    ''' returns the cache directory from ETA_CACHE_DIR, or None if caching is turned off '''
+    cache_dir = os.environ.get('ETA_CACHE_DIR', DEFAULT_CACHE_DIR)
+    return cache_dir or None
+
+class TableCache:
+    ''' cache entry for one (input file, time_fields, kind) combination.
+    kind names whatever derived the table, e.g. the TaskTimes subclass and its DERIVE_VERSION. '''
+
+    def __init__(self, in_json, time_fields, kind, cache_dir):
+        self.in_json = os.path.abspath(in_json)
+        key = repr((self.in_json, list(time_fields), kind)).encode()
+        self.path = os.path.join(cache_dir, hashlib.sha1(key).hexdigest())
+
+    def _source_stamp(self):
+        stat = os.stat(self.in_json)
+        return {'format': FORMAT_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def load(self):
+        ''' returns the cached TaskTable, or None on a miss '''
+        meta_path = os.path.join(self.path, 'meta.pickle')
+        try:
+            with open(meta_path, 'rb') as f:
+                meta = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if meta['stamp'] != self._source_stamp():
+            logging.info('cache for {} is stale'.format(self.in_json))
+            return None
+        columns = {}
+        for field, kind, extra in meta['columns']:
+            if kind == 'object':
+                columns[field] = ObjectColumn(extra)
+                continue
+            array = np.load(os.path.join(self.path, '{}.npy'.format(extra['file'])), mmap_mode='c')
+            if kind == 'time':
+                columns[field] = TimeColumn(array)
+            elif kind == 'delta':
+                columns[field] = DeltaColumn(array)
+            else:
+                columns[field] = CategoricalColumn(array, extra['categories'])
+        logging.info('loaded {} from cache {}'.format(self.in_json, self.path))
+        return TaskTable(meta['ids'], columns, meta['categorical_fields'])
+
+    def save(self, table):
+        ''' writes table to the cache, replacing any previous entry atomically '''
+        parent = os.path.dirname(self.path)
+        os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=parent)
+        columns = []
+        for i, (field, column) in enumerate(table.columns.items()):
+            if isinstance(column, ObjectColumn):
+                columns.append((field, 'object', column.values))
+                continue
+            extra = {'file': str(i)}
+            if isinstance(column, DeltaColumn):
+                kind, array = 'delta', column.values
+            elif isinstance(column, TimeColumn):
+                kind, array = 'time', column.values
+            else:
+                kind, array = 'categorical', column.codes
+                extra['categories'] = column.categories
+            np.save(os.path.join(tmp_path, '{}.npy'.format(i)), array)
+            columns.append((field, kind, extra))
+        meta = {
+            'stamp': self._source_stamp(),
+            'ids': table.ids,
+            'categorical_fields': table.categorical_fields,
+            'columns': columns,
+            }
+        with open(os.path.join(tmp_path, 'meta.pickle'), 'wb') as f:
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(tmp_path, self.path)
+
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
+
+if __name__ == '__main__':
+    _test()
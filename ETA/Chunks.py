@@ -1,23 +1,12 @@
 #!/usr/bin/env python3
 
-import bisect
 import datetime
+import logging
 
-# stolen from https://docs.python.org/3/library/bisect.html
+import numpy as np
 
-def _find_le(a, x):
-    'Find rightmost value less than or equal to x'
-    i = bisect.bisect_right(a, x)
-    if i:
-        return a[i-1]
-    raise ValueError
-
-def _find_ge(a, x):
-    'Find leftmost value greater than or equal to x'
-    i = bisect.bisect_left(a, x)
-    if i != len(a):
-        return a[i]
-    raise ValueError
+OUT_OF_BOUNDS_MODES = ('raise', 'clip', 'drop')
+EPOCH = datetime.datetime(1970, 1, 1)
 
 
 class ChunkTimes:
@@ -126,6 +115,55 @@ class ChunkTimes:
             ...     print('should have failed')
             ...     print(f)
 
+        index_task_on_chunktime_sweep(self, tasks, start='start_time', end='finish_time', group_by=None)
+            returns chunks dict where count of tasks is stored under a chunktime fencepost value
+            for count of tasks active during the fencepost value, that is if the fencepost value is
+            between start and end, in one O(tasks + posts) pass.
+            With group_by set to a field name, returns {field value: chunks dict} instead.
+            >>> running = [{'start_time': datetime.datetime(1999, 12, 31, 15, 0),
+            ...             'finish_time': datetime.datetime(1999, 12, 31, 21, 0), 'distro': 'a'},
+            ...            {'start_time': datetime.datetime(1999, 12, 31, 20, 0),
+            ...             'finish_time': datetime.datetime(2000, 1, 1, 0, 0), 'distro': 'b'}]
+            >>> list(willenium.index_task_on_chunktime_sweep(running).values())
+            [1, 2, 1]
+            >>> by_distro = willenium.index_task_on_chunktime_sweep(running, group_by='distro')
+            >>> {distro: list(counts.values()) for distro, counts in by_distro.items()}
+            {'a': [1, 1, 0], 'b': [0, 1, 1]}
+
+        fencepost_indices(self, times, side='before', out_of_bounds='raise')
+            array version of index_tasks_before_chunktime (side='before')
+            and index_tasks_after_chunktime (side='after').
+            Takes a datetime64 column, returns one index into chunk_list per time.
+            out_of_bounds is 'raise', 'clip' (to the first or last fencepost) or 'drop' (index -1).
+            Missing (NaT) times are out of bounds, and get index -1 when clipped as well.
+            >>> times = np.array(['1999-12-31T20:00', '1999-12-31T22:00', '1999-12-31T18:00'], dtype='datetime64[ms]')
+            >>> willenium.fencepost_indices(times)
+            array([1, 2, 1])
+            >>> willenium.fencepost_indices(times, side='after')
+            array([1, 1, 0])
+            >>> late = np.array(['1999-12-31T20:00', '2001-12-31T20:00', '1999-12-30T20:00'], dtype='datetime64[ms]')
+            >>> willenium.fencepost_indices(late, out_of_bounds='drop')
+            array([ 1, -1, -1])
+            >>> willenium.fencepost_indices(late, out_of_bounds='clip')
+            array([1, 2, 0])
+            >>> willenium.fencepost_indices(late)
+            Traceback (most recent call last):
+            ...
+            ValueError: 2 of 3 times out of bounds (1 before begin_time 1999-12-31 16:00:00, 1 after end_time 2000-01-01 00:00:00)
+            >>> unset = np.array(['1999-12-31T20:00', 'NaT', '2001-12-31T20:00'], dtype='datetime64[ms]')
+            >>> willenium.fencepost_indices(unset, out_of_bounds='drop'), willenium.fencepost_indices(unset, out_of_bounds='clip')
+            (array([ 1, -1, -1]), array([ 1, -1,  2]))
+            >>> willenium.fencepost_indices(unset)
+            Traceback (most recent call last):
+            ...
+            ValueError: 2 of 3 times out of bounds (0 before begin_time 1999-12-31 16:00:00, 1 after end_time 2000-01-01 00:00:00, 1 missing)
+
+        bucket_offsets(self, indices)
+            CSR layout of fencepost_indices output: the positions in bucket k are order[offsets[k]:offsets[k+1]].
+            >>> order, offsets = willenium.bucket_offsets(np.array([1, 2, 1, -1]))
+            >>> [order[offsets[k]:offsets[k+1]].tolist() for k in range(len(willenium.chunk_list))]
+            [[], [0, 2], [1]]
+
         '''
 
     def __init__(self, begin_time, end_time, chunk=datetime.timedelta(minutes=5)):
@@ -150,6 +188,7 @@ class ChunkTimes:
             current_chunk += self.chunk
         # modify end time
         self.end_time = self.chunk_list[-1]
+        self.chunk_array = np.array(self.chunk_list, dtype='datetime64[us]')
 
     def index_tasks_before_chunktime(self, tasks, time_field='finish_time'):
         ''' Takes in a list of tasks.
@@ -162,7 +201,7 @@ class ChunkTimes:
         All task times must be later than the first fencepost in chunk_list and earlier than the last.
         '''
 
-        return self._fencepost_assigner_generator(_find_ge)(self, tasks, time_field)
+        return self._assign_to_fenceposts(tasks, time_field, 'before')
 
     def index_tasks_after_chunktime(self, tasks, time_field='finish_time'):
         ''' returns chunks dict where tasks are stored under a chunktime fencepost value
@@ -174,7 +213,7 @@ class ChunkTimes:
         All task times must be later than the first fencepost in chunk_list and earlier than the last.
         '''
 
-        return self._fencepost_assigner_generator(_find_le)(self, tasks, time_field)
+        return self._assign_to_fenceposts(tasks, time_field, 'after')
 
     def index_task_on_chunktime(self, tasks, start='start_time', end='finish_time'):
         ''' returns chunks dict where count of tasks is stored under a chunktime fencepost value
@@ -183,21 +222,9 @@ class ChunkTimes:
         tasks is an iterable of task dicts.
 
         All task times must be later than the first fencepost in chunk_list and earlier than the last.
+        Same as index_task_on_chunktime_sweep.
         '''
-        active_tasks = [task['_id'] for task in tasks]
-        count_dict = {x:0 for x in self.chunk_list}
-        for post in count_dict:
-            for task in tasks:
-                if task['_id'] not in active_tasks:
-                    continue
-                if post < task[start]:
-                    continue
-                if task[end] < post:
-                    active_tasks.remove(task['_id'])
-                # so we know task[start] <= post <= task[end]
-                count_dict[post] += 1
-
-        return count_dict
+        return self.index_task_on_chunktime_sweep(tasks, start, end)
 
     def index_task_on_chunktime_search(self, tasks, start='start_time', end='finish_time'):
         ''' returns chunks dict where count of tasks is stored under a chunktime fencepost value
@@ -207,44 +234,123 @@ class ChunkTimes:
 
         All task times must be later than the first fencepost in chunk_list and earlier than the last.
         '''
-        counts = [0] * len(self.chunk_list)
-        for task in tasks:
-            leftmost_idx = bisect.bisect_left(self.chunk_list, task[start])
-            rightmost_idx = bisect.bisect_right(self.chunk_list, task[end])
-            active_idx = leftmost_idx
-            while active_idx < rightmost_idx:
-                counts[active_idx] += 1
-                active_idx += 1
-
-        count_dict = {}
-        for chunk in self.chunk_list:
-            count_dict[chunk] = counts.pop(0)
-        return count_dict
-
-
-
-    def _fencepost_assigner_generator(self, find_fencepost):
-        '''find_fencepost should be a function that takes a list and a value,
-        and returns a value from the list.
-        This curries that into a general fencepost assignment function.
-        #TODO: remove unneeded closure'''
-        def f(self, tasks, time_field):
-            fencepost_dict = {x:[] for x in self.chunk_list}
-            for task in tasks:
-                time_value = task[time_field]
-                self._check_in_bounds(time_value)
-                fencepost = find_fencepost(self.chunk_list, time_value)
-                fencepost_dict[fencepost].append(task)
-            return fencepost_dict
-        return f
-
-    def _check_in_bounds(self, item):
-        ''' checks if an item is between begin_time and end_time.
-        item should be a datetime.datetime object'''
-        if item < self.begin_time:
-            raise ValueError("{} is earlier than begin_time {}".format(item,self.begin_time))
-        elif self.end_time < item:
-            raise ValueError("{} is later than end_time {}".format(item,self.end_time))
+        return self.index_task_on_chunktime_sweep(tasks, start, end)
+
+    def index_task_on_chunktime_sweep(self, tasks, start='start_time', end='finish_time', group_by=None):
+        ''' returns chunks dict where count of tasks is stored under a chunktime fencepost value
+        for count of tasks active during the fencepost value, that is if the fencepost value is
+        between start and end. The value of that key is a datetime.datetime field in the task.
+        tasks is an iterable of task dicts.
+
+        If group_by is a field name, returns {field value: chunks dict}, one count per group,
+        still from a single pass.
+        '''
+        tasks = list(tasks)
+        starts = np.array([task[start] for task in tasks], dtype='datetime64[us]')
+        ends = np.array([task[end] for task in tasks], dtype='datetime64[us]')
+        if group_by is None:
+            counts = self.count_active(starts, ends)
+            return dict(zip(self.chunk_list, counts.tolist()))
+        group_values = {}
+        groups = np.array([group_values.setdefault(task[group_by], len(group_values)) for task in tasks],
+                dtype=np.int64)
+        counts = self.count_active(starts, ends, groups, len(group_values))
+        return {value: dict(zip(self.chunk_list, counts[code].tolist())) for value, code in group_values.items()}
+
+    def count_active(self, starts, ends, groups=None, group_count=None):
+        ''' difference-array count of intervals [starts, ends] covering each fencepost.
+        starts and ends are datetime64 arrays. Returns an int array with one count per fencepost,
+        or, if groups (integer codes 0..group_count-1, one per interval) is given,
+        a (group_count, posts) array. Intervals with a missing (NaT) start or end are not counted.
+
+        >>> chunk_times = ChunkTimes(datetime.datetime(2000, 1, 1), datetime.datetime(2000, 1, 1, 2), datetime.timedelta(hours=1))
+        >>> starts = np.array(['2000-01-01T00:30', '2000-01-01T00:30', 'NaT'], dtype='datetime64[ms]')
+        >>> ends = np.array(['2000-01-01T01:30', 'NaT', '2000-01-01T01:30'], dtype='datetime64[ms]')
+        >>> chunk_times.count_active(starts, ends)
+        array([0, 1, 0])
+        '''
+        starts = np.asarray(starts, dtype='datetime64[us]')
+        ends = np.asarray(ends, dtype='datetime64[us]')
+        posts = len(self.chunk_array)
+        first_post = np.searchsorted(self.chunk_array, starts, side='left')
+        past_last_post = np.searchsorted(self.chunk_array, ends, side='right')
+        covers = (first_post < past_last_post) & ~np.isnat(starts) & ~np.isnat(ends)
+        if groups is None:
+            groups = np.zeros(len(first_post), dtype=np.int64)
+            group_count = None
+        elif group_count is None:
+            group_count = int(groups.max()) + 1 if len(groups) else 0
+        rows = 1 if group_count is None else group_count
+        width = posts + 1
+        diff = (np.bincount(groups[covers] * width + first_post[covers], minlength=rows * width)
+                - np.bincount(groups[covers] * width + past_last_post[covers], minlength=rows * width))
+        counts = np.cumsum(diff.reshape(rows, width), axis=1)[:, :posts]
+        if group_count is None:
+            return counts[0]
+        return counts
+
+    def fencepost_indices(self, times, side='before', out_of_bounds='raise'):
+        ''' vectorized fencepost assignment for a whole column of times (datetime64 array).
+        side='before' puts t in fencepost t1 for t0 < t <= t1, like index_tasks_before_chunktime,
+        side='after' puts t in fencepost t1 for t1 <= t < t2, like index_tasks_after_chunktime.
+        Returns an int array of indices into chunk_list.
+
+        Times before begin_time or after end_time are handled according to out_of_bounds:
+        'raise' raises one ValueError counting all of them, 'clip' assigns them to the first or last fencepost,
+        'drop' gives them index -1.
+        Missing times (NaT) count as out of bounds, and get index -1 under both 'clip' and 'drop'.
+        '''
+        if side not in ('before', 'after'):
+            raise ValueError("side must be 'before' or 'after', not {!r}".format(side))
+        if out_of_bounds not in OUT_OF_BOUNDS_MODES:
+            raise ValueError('out_of_bounds must be one of {}, not {!r}'.format(OUT_OF_BOUNDS_MODES, out_of_bounds))
+        times = np.asarray(times, dtype='datetime64[us]')
+        too_early = times < self.chunk_array[0]
+        too_late = times > self.chunk_array[-1]
+        # NaT compares False both ways, and is never in bounds
+        missing = np.isnat(times)
+        early_count = int(too_early.sum())
+        late_count = int(too_late.sum())
+        missing_count = int(missing.sum())
+        if early_count or late_count or missing_count:
+            message = '{} of {} times out of bounds ({} before begin_time {}, {} after end_time {}{})'.format(
+                    early_count + late_count + missing_count, len(times), early_count, self.begin_time,
+                    late_count, self.end_time, ', {} missing'.format(missing_count) if missing_count else '')
+            if out_of_bounds == 'raise':
+                raise ValueError(message)
+            logging.warning('{}, {}'.format(message, 'clipped' if out_of_bounds == 'clip' else 'dropped'))
+
+        if side == 'before':
+            indices = np.searchsorted(self.chunk_array, times, side='left')
+        else:
+            indices = np.searchsorted(self.chunk_array, times, side='right') - 1
+        if out_of_bounds == 'drop':
+            indices[too_early | too_late] = -1
+        else:
+            np.clip(indices, 0, len(self.chunk_array) - 1, out=indices)
+        # missing times cannot be clipped to a fencepost, so they are dropped under 'clip' too
+        indices[missing] = -1
+        return indices
+
+    def bucket_offsets(self, indices):
+        ''' CSR layout of fencepost indices, as returned by fencepost_indices.
+        Returns (order, offsets): the positions assigned to fencepost k are order[offsets[k]:offsets[k+1]],
+        in their original relative order. Positions with index -1 are left out.
+        '''
+        indices = np.asarray(indices, dtype=np.int64)
+        kept = np.flatnonzero(indices >= 0)
+        order = kept[np.argsort(indices[kept], kind='stable')]
+        counts = np.bincount(indices[kept], minlength=len(self.chunk_list))
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        return order, offsets
+
+    def _assign_to_fenceposts(self, tasks, time_field, side):
+        ''' dict-of-lists wrapper around fencepost_indices for lists of task dicts '''
+        tasks = list(tasks)
+        times = np.array([task[time_field] for task in tasks], dtype='datetime64[us]')
+        order, offsets = self.bucket_offsets(self.fencepost_indices(times, side))
+        return {post: [tasks[i] for i in order[offsets[k]:offsets[k+1]]]
+                for k, post in enumerate(self.chunk_list)}
 
 def chunked_mean_slowdown(time_chunked_tasks):
     ''' calculates average slowdown across each chunk given
@@ -263,6 +369,252 @@ def chunked_mean_slowdown(time_chunked_tasks):
         slowdowns[chunk] = latency_sum / perfect_world_latency_sum
     return slowdowns
 
+def chunked_mean_slowdown_arrays(chunk_times, indices, latencies, perfect_world_latencies):
+    ''' array version of chunked_mean_slowdown.
+    indices are fencepost indices as returned by chunk_times.fencepost_indices (-1 is skipped),
+    latencies and perfect_world_latencies are timedelta64 arrays with one entry per task.
+    Returns {fencepost: slowdown}, nan for fenceposts without tasks.
+
+    >>> chunk_times = ChunkTimes(datetime.datetime(2000, 1, 1, 0), datetime.datetime(2000, 1, 1, 2), datetime.timedelta(hours=1))
+    >>> latencies = np.array([30, 90, 60, 10], dtype='timedelta64[m]')
+    >>> ideal = np.array([30, 30, 20, 10], dtype='timedelta64[m]')
+    >>> slowdowns = chunked_mean_slowdown_arrays(chunk_times, np.array([1, 1, 2, -1]), latencies, ideal)
+    >>> [round(slowdown, 3) for slowdown in slowdowns.values()]
+    [nan, 2.0, 3.0]
+    '''
+    indices = np.asarray(indices, dtype=np.int64)
+    kept = indices >= 0
+    posts = len(chunk_times.chunk_list)
+    latency_sums = np.bincount(indices[kept], weights=latencies[kept] / np.timedelta64(1, 's'), minlength=posts)
+    ideal_sums = np.bincount(indices[kept],
+            weights=perfect_world_latencies[kept] / np.timedelta64(1, 's'), minlength=posts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slowdowns = latency_sums / ideal_sums
+    return dict(zip(chunk_times.chunk_list, slowdowns.tolist()))
+
+class _Fenwick:
+    ''' binary indexed tree over a fixed number of integer slots: O(log n) point updates and prefix sums '''
+
+    def __init__(self, size):
+        self.tree = [0] * (size + 1)
+
+    def add(self, slot, delta):
+        slot += 1
+        while slot < len(self.tree):
+            self.tree[slot] += delta
+            slot += slot & -slot
+
+    def prefix(self, slot):
+        ''' sum of slots 0..slot inclusive '''
+        total = 0
+        slot += 1
+        while slot > 0:
+            total += self.tree[slot]
+            slot -= slot & -slot
+        return total
+
+class SlidingWindow:
+    ''' streaming counterpart of ChunkTimes for live monitoring.
+
+    Keeps the last window of time in chunk-sized buckets, aligned to multiples of chunk since epoch,
+    in a ring buffer, so memory depends only on window / chunk.
+    Finished tasks are added one at a time with add(); for each chunk it tracks how many tasks finished,
+    their total wait (task[start] - task[wait_from]), and how many tasks were running at the fencepost
+    (start <= fencepost <= end, as in ChunkTimes.count_active). Tasks only count as running once they have
+    been added, i.e. once they finish.
+
+    Running counts are kept as a difference array in a Fenwick tree plus a base count for everything
+    that started before the window, so add() and running_count() cost O(log(window / chunk)).
+    Moving the window evicts each expired chunk once, also at O(log(window / chunk)) per chunk.
+    Tasks that finish before the oldest chunk in the window are counted in late and otherwise ignored.
+
+    >>> window = SlidingWindow(datetime.timedelta(minutes=20), datetime.timedelta(minutes=5))
+    >>> t = lambda minute: datetime.datetime(2020, 1, 1, 12, 0) + datetime.timedelta(minutes=minute)
+    >>> window.add({'scheduled_time': t(0), 'start_time': t(1), 'finish_time': t(12)})
+    >>> window.add({'scheduled_time': t(2), 'start_time': t(6), 'finish_time': t(8)})
+    >>> window.finished_counts()
+    {datetime.datetime(2020, 1, 1, 11, 55): 0, datetime.datetime(2020, 1, 1, 12, 0): 0, datetime.datetime(2020, 1, 1, 12, 5): 1, datetime.datetime(2020, 1, 1, 12, 10): 1}
+    >>> list(window.running_counts().values())
+    [0, 0, 1, 1]
+    >>> window.mean_wait()
+    datetime.timedelta(seconds=150)
+    >>> window.add({'scheduled_time': t(20), 'start_time': t(21), 'finish_time': t(31)})
+    >>> list(window.running_counts())
+    [datetime.datetime(2020, 1, 1, 12, 15), datetime.datetime(2020, 1, 1, 12, 20), datetime.datetime(2020, 1, 1, 12, 25), datetime.datetime(2020, 1, 1, 12, 30)]
+    >>> list(window.running_counts().values()), window.running_count(t(25))
+    ([0, 0, 1, 1], 1)
+    >>> window.add({'scheduled_time': t(0), 'start_time': t(1), 'finish_time': t(2)})
+    >>> window.late
+    1
+    '''
+
+    def __init__(self, window, chunk=datetime.timedelta(minutes=5),
+            start='start_time', end='finish_time', wait_from='scheduled_time', epoch=EPOCH):
+        if window < chunk:
+            raise ValueError('window {} is shorter than chunk {}'.format(window, chunk))
+        self.chunk = chunk
+        self.size = -(-window // chunk)
+        self.start = start
+        self.end = end
+        self.wait_from = wait_from
+        self.epoch = epoch
+        # absolute chunk index of the newest chunk in the window, None until the first task
+        self.newest = None
+        self.late = 0
+        self.finished = np.zeros(self.size, dtype=np.int64)
+        self.wait_seconds = np.zeros(self.size)
+        self.diffs = np.zeros(self.size, dtype=np.int64)
+        self.diff_tree = _Fenwick(self.size)
+        # running tasks at the oldest fencepost that started before the window
+        self.base = 0
+        # difference for the chunk right after newest, from tasks ending in the newest chunk
+        self.next_diff = 0
+
+    @property
+    def oldest(self):
+        return self.newest - self.size + 1
+
+    def _chunk_index(self, time):
+        ''' index of the last fencepost at or before time '''
+        return (time - self.epoch) // self.chunk
+
+    def _fencepost(self, index):
+        return self.epoch + index * self.chunk
+
+    def _add_diff(self, index, delta):
+        if index < self.oldest:
+            self.base += delta
+        elif index > self.newest:
+            self.next_diff += delta
+        else:
+            slot = index % self.size
+            self.diffs[slot] += delta
+            self.diff_tree.add(slot, delta)
+
+    def advance(self, time):
+        ''' moves the window forward so its newest chunk contains time, evicting expired chunks.
+        Called by add(), but also useful to age out chunks when no tasks are finishing.'''
+        newest = self._chunk_index(time)
+        if self.newest is None:
+            self.newest = newest
+            return
+        if newest <= self.newest:
+            return
+        new_oldest = newest - self.size + 1
+        for index in range(self.oldest, min(new_oldest, self.newest + 1)):
+            slot = index % self.size
+            self.base += int(self.diffs[slot])
+            self.diff_tree.add(slot, -int(self.diffs[slot]))
+            self.diffs[slot] = 0
+            self.finished[slot] = 0
+            self.wait_seconds[slot] = 0
+        next_index, next_diff = self.newest + 1, self.next_diff
+        self.newest = newest
+        self.next_diff = 0
+        self._add_diff(next_index, next_diff)
+
+    def add(self, task):
+        ''' adds one finished task, a dict with datetime.datetime values for start, end and wait_from '''
+        end_index = self._chunk_index(task[self.end])
+        self.advance(task[self.end])
+        if end_index < self.oldest:
+            self.late += 1
+            return
+        slot = end_index % self.size
+        self.finished[slot] += 1
+        self.wait_seconds[slot] += (task[self.start] - task[self.wait_from]).total_seconds()
+        # first fencepost at or after start
+        start_index = -((self.epoch - task[self.start]) // self.chunk)
+        if start_index <= end_index:
+            self._add_diff(start_index, 1)
+            self._add_diff(end_index + 1, -1)
+
+    def running_count(self, time):
+        ''' number of added tasks running at the last fencepost at or before time, which must be in the window '''
+        index = self._chunk_index(time)
+        if self.newest is None or not self.oldest <= index <= self.newest:
+            raise ValueError('{} is outside the window'.format(time))
+        first, last = self.oldest % self.size, index % self.size
+        count = self.base + self.diff_tree.prefix(last)
+        if first:
+            count -= self.diff_tree.prefix(first - 1)
+        if first > last:
+            count += self.diff_tree.prefix(self.size - 1)
+        return count
+
+    def _in_window_order(self, array):
+        return np.roll(array, -(self.oldest % self.size))
+
+    def fenceposts(self):
+        ''' datetime.datetime fenceposts of the window, oldest first '''
+        if self.newest is None:
+            return []
+        return [self._fencepost(index) for index in range(self.oldest, self.newest + 1)]
+
+    def chunk_times(self):
+        ''' ChunkTimes covering the current window, for use with the batch tools and plots '''
+        return ChunkTimes(self._fencepost(self.oldest), self._fencepost(self.newest), self.chunk)
+
+    def finished_counts(self):
+        ''' {fencepost: number of tasks finishing in the chunk starting there} '''
+        return dict(zip(self.fenceposts(), self._in_window_order(self.finished).tolist()))
+
+    def wait_totals(self):
+        ''' {fencepost: total wait of tasks finishing in the chunk starting there, as datetime.timedelta} '''
+        return {post: datetime.timedelta(seconds=seconds)
+                for post, seconds in zip(self.fenceposts(), self._in_window_order(self.wait_seconds).tolist())}
+
+    def running_counts(self):
+        ''' {fencepost: number of added tasks running at the fencepost} '''
+        counts = self.base + np.cumsum(self._in_window_order(self.diffs))
+        return dict(zip(self.fenceposts(), counts.tolist()))
+
+    def mean_wait(self):
+        ''' mean wait of all tasks finishing in the window, as datetime.timedelta '''
+        finished = int(self.finished.sum())
+        if not finished:
+            return datetime.timedelta(0)
+        return datetime.timedelta(seconds=float(self.wait_seconds.sum()) / finished)
+
+class GroupedSlidingWindow:
+    ''' one SlidingWindow per value of a task field, e.g. one rolling view per distro.
+    All windows move together, so fenceposts line up across groups.
+
+    >>> windows = GroupedSlidingWindow('distro', datetime.timedelta(minutes=10), datetime.timedelta(minutes=5))
+    >>> t = lambda minute: datetime.datetime(2020, 1, 1, 12, 0) + datetime.timedelta(minutes=minute)
+    >>> windows.add({'distro': 'a', 'scheduled_time': t(0), 'start_time': t(4), 'finish_time': t(6)})
+    >>> windows.add({'distro': 'b', 'scheduled_time': t(0), 'start_time': t(1), 'finish_time': t(16)})
+    >>> {distro: window.mean_wait() for distro, window in windows.windows.items()}
+    {'a': datetime.timedelta(0), 'b': datetime.timedelta(seconds=60)}
+    '''
+
+    def __init__(self, field, window, chunk=datetime.timedelta(minutes=5), **kwargs):
+        self.field = field
+        self.window = window
+        self.chunk = chunk
+        self.kwargs = kwargs
+        self.latest = None
+        self.windows = {}
+
+    def add(self, task):
+        key = task[self.field]
+        if key not in self.windows:
+            self.windows[key] = SlidingWindow(self.window, self.chunk, **self.kwargs)
+            if self.latest is not None:
+                self.windows[key].advance(self.latest)
+        end = task[self.windows[key].end]
+        if self.latest is None or end > self.latest:
+            self.latest = end
+            for window in self.windows.values():
+                window.advance(end)
+        self.windows[key].add(task)
+
+    def advance(self, time):
+        ''' moves every window forward so its newest chunk contains time '''
+        if self.latest is None or time > self.latest:
+            self.latest = time
+        for window in self.windows.values():
+            window.advance(time)
 
 
 def _test():
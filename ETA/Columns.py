@@ -0,0 +1,637 @@
+#!/usr/bin/env python3
+''' columnar storage for task data.
+
+A TaskTable holds every task field as one column instead of one dict per task:
+time fields are datetime64[ms] arrays, categorical fields (distro, version, ...)
+are dictionary-encoded integer codes, and everything else (depends_on, priority, ...)
+is a plain list. _id is kept as an index from task id to row number.
+
+TaskTable behaves like the old {_task_id:task_dict} mapping.
+Looking up a task returns a TaskRow, a dict-like view that reads from and writes to the columns,
+so code that does task['begin_wait'] = ... keeps working.
+
+>>> import datetime
+>>> builder = TaskTableBuilder(['start_time'])
+>>> builder.add({'_id': 'a', 'start_time': datetime.datetime(2020, 1, 1), 'distro': 'rhel62-small', 'depends_on': []})
+>>> builder.add({'_id': 'b', 'start_time': datetime.datetime(2020, 1, 2), 'distro': 'rhel62-large', 'depends_on': [{'_id': 'a'}]})
+>>> table = builder.build()
+>>> len(table), 'a' in table, 'c' in table
+(2, True, False)
+>>> table['b']
+{'_id': 'b', 'start_time': datetime.datetime(2020, 1, 2, 0, 0), 'distro': 'rhel62-large', 'depends_on': [{'_id': 'a'}]}
+>>> table['a']['begin_wait'] = datetime.datetime(2019, 12, 31)
+>>> 'begin_wait' in table['a'], 'begin_wait' in table['b']
+(True, False)
+>>> table['a']['begin_wait']
+datetime.datetime(2019, 12, 31, 0, 0)
+>>> [table.ids[i] for i in table.select({'distro': ['rhel62-large']})]
+['b']
+>>> [table.ids[i] for i in table.select({'begin_wait': []})]
+['a']
+>>> [table.ids[i] for i in table.select({'distro': ['rhel62-large', 'rhel62-small'], 'begin_wait': []})]
+['a']
+>>> table['b']['distro'] = 'rhel62-small'
+>>> [table.ids[i] for i in table.select({'distro': ['rhel62-small']})]
+['a', 'b']
+>>> table['a'][DEPENDENCY_ONLY] = True
+>>> [table.ids[i] for i in table.select()], [table.ids[i] for i in table.select({DEPENDENCY_ONLY: []})]
+(['b'], ['a'])
+'''
+
+import collections.abc
+import datetime
+
+import numpy as np
+
+CATEGORICAL_FIELDS = ('distro', 'version', 'task_group', 'generated_by')
+# set on tasks that are only in a table as dependencies of others, e.g. by ETA.Dataset
+DEPENDENCY_ONLY = 'dependency_only'
+
+class _Missing:
+    ''' marks a field that a task does not have '''
+    def __repr__(self):
+        return 'MISSING'
+
+    def __reduce__(self):
+        # unpickle to the module-level singleton so "is MISSING" keeps working
+        return 'MISSING'
+
+MISSING = _Missing()
+
+##
+# time parsing
+
+def parse_ISO_column(values):
+    ''' converts a sequence of ISO 8601 UTC strings, as stored in the tasks DB
+    (with or without fractional seconds), into a datetime64[ms] array in one call.
+    datetime.datetime values and MISSING are accepted too, MISSING becomes NaT.
+    Raises ValueError on a malformed string.
+
+    >>> parse_ISO_column(['2020-08-05T11:51:19.168Z', '2020-08-04T11:53:00Z'])
+    array(['2020-08-05T11:51:19.168', '2020-08-04T11:53:00.000'],
+          dtype='datetime64[ms]')
+    '''
+    strings = np.asarray(values)
+    if strings.dtype.kind == 'U':
+        # numpy parses ISO 8601 natively, but refuses the UTC designator
+        return np.char.rstrip(strings, 'Z').astype('datetime64[ms]')
+    converted = []
+    for value in values:
+        if value is MISSING:
+            value = np.datetime64('NaT')
+        elif isinstance(value, str):
+            value = np.datetime64(value.rstrip('Z'), 'ms')
+        converted.append(value)
+    return np.array(converted, dtype='datetime64[ms]')
+
+##
+# columns
+# every column type supports the same small interface:
+# get(row) returns the value or MISSING, set(row, value), present() returns a boolean mask,
+# isin(values) returns a boolean mask and take(rows) returns values suitable for pandas.
+
+class TimeColumn:
+    ''' datetime64[ms] column, NaT marks a missing value '''
+    dtype = 'datetime64[ms]'
+    scalar_types = (datetime.datetime, np.datetime64)
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=self.dtype)
+
+    @classmethod
+    def empty(cls, size):
+        return cls(np.full(size, np.datetime64('NaT'), dtype=cls.dtype))
+
+    def accepts(self, value):
+        return isinstance(value, self.scalar_types)
+
+    def get(self, row):
+        value = self.values[row]
+        if np.isnat(value):
+            return MISSING
+        return value.item()
+
+    def set(self, row, value):
+        if value is MISSING:
+            self.values[row] = np.datetime64('NaT')
+        else:
+            self.values[row] = value
+
+    def present(self):
+        return ~np.isnat(self.values)
+
+    def isin(self, values):
+        allowed = np.array([v for v in values if self.accepts(v)], dtype=self.dtype)
+        return np.isin(self.values, allowed)
+
+    def take(self, rows):
+        return self.values[rows]
+
+    def subset(self, rows):
+        return type(self)(self.values[rows])
+
+class DeltaColumn(TimeColumn):
+    ''' timedelta64[ms] column, NaT marks a missing value '''
+    dtype = 'timedelta64[ms]'
+    scalar_types = (datetime.timedelta, np.timedelta64)
+
+class CategoricalColumn:
+    ''' dictionary-encoded column. codes index into categories, -1 marks a missing value '''
+
+    def __init__(self, codes, categories):
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.categories = list(categories)
+        self.lookup = {value: code for code, value in enumerate(self.categories)}
+
+    @classmethod
+    def empty(cls, size):
+        return cls(np.full(size, -1, dtype=np.int32), [])
+
+    @staticmethod
+    def accepts(value):
+        return isinstance(value, collections.abc.Hashable)
+
+    def encode(self, value):
+        ''' returns the code for value, adding a new category if needed '''
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(value)
+            self.lookup[value] = code
+        return code
+
+    def get(self, row):
+        code = self.codes[row]
+        if code < 0:
+            return MISSING
+        return self.categories[code]
+
+    def set(self, row, value):
+        if value is MISSING:
+            self.codes[row] = -1
+        else:
+            self.codes[row] = self.encode(value)
+
+    def present(self):
+        return self.codes >= 0
+
+    def isin(self, values):
+        allowed = [self.lookup[v] for v in values if self.accepts(v) and v in self.lookup]
+        return np.isin(self.codes, allowed)
+
+    def take(self, rows):
+        # the trailing None is picked up by code -1
+        decoded = np.array(self.categories + [None], dtype=object)
+        return decoded[self.codes[rows]]
+
+    def subset(self, rows):
+        return CategoricalColumn(self.codes[rows], self.categories)
+
+class ObjectColumn:
+    ''' fallback column of arbitrary python objects '''
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    @classmethod
+    def empty(cls, size):
+        return cls([MISSING] * size)
+
+    @staticmethod
+    def accepts(value):
+        return True
+
+    def get(self, row):
+        return self.values[row]
+
+    def set(self, row, value):
+        self.values[row] = value
+
+    def present(self):
+        return np.fromiter((v is not MISSING for v in self.values), dtype=bool, count=len(self.values))
+
+    def isin(self, values):
+        return np.fromiter((v is not MISSING and v in values for v in self.values),
+                dtype=bool, count=len(self.values))
+
+    def take(self, rows):
+        return [None if self.values[i] is MISSING else self.values[i] for i in rows]
+
+    def subset(self, rows):
+        return ObjectColumn([self.values[i] for i in rows])
+
+def _column_for_value(field, value, size, categorical_fields):
+    ''' picks a column type for a field that does not exist yet '''
+    if isinstance(value, TimeColumn.scalar_types):
+        return TimeColumn.empty(size)
+    if isinstance(value, DeltaColumn.scalar_types):
+        return DeltaColumn.empty(size)
+    if field in categorical_fields and CategoricalColumn.accepts(value):
+        return CategoricalColumn.empty(size)
+    return ObjectColumn.empty(size)
+
+##
+# table
+
+class TaskRow(collections.abc.MutableMapping):
+    ''' dict-like view of one row of a TaskTable.
+    Reads and writes go straight to the table's columns.
+    copy() returns a plain dict snapshot.'''
+    __slots__ = ('_table', '_row')
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, field):
+        value = self._table.get_value(self._row, field)
+        if value is MISSING:
+            raise KeyError(field)
+        return value
+
+    def __setitem__(self, field, value):
+        self._table.set_value(self._row, field, value)
+
+    def __delitem__(self, field):
+        if field not in self:
+            raise KeyError(field)
+        self._table.set_value(self._row, field, MISSING)
+
+    def __contains__(self, field):
+        return self._table.get_value(self._row, field) is not MISSING
+
+    def __iter__(self):
+        for field in self._table.fields:
+            if field in self:
+                yield field
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def copy(self):
+        return dict(self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class TaskTable(collections.abc.Mapping):
+    ''' column-oriented container of tasks, keyed on _id.
+
+    Attributes
+    ---
+    ids: list of task ids, in row order
+    index: {_task_id:row}
+    fields: list of field names, in the order they were first seen
+    columns: {field:column}
+
+    The set of tasks is fixed once the table is built, but fields can be added and changed
+    through TaskRow views or set_value.
+    '''
+
+    def __init__(self, ids, columns, categorical_fields=CATEGORICAL_FIELDS):
+        self.ids = list(ids)
+        self.index = {_id: row for row, _id in enumerate(self.ids)}
+        self.columns = dict(columns)
+        self.fields = ['_id'] + list(self.columns)
+        self.categorical_fields = categorical_fields
+        # lazily built secondary indexes, see present() and rows_with()
+        self._present = {}
+        self._inverted = {}
+
+    def __getitem__(self, _id):
+        return TaskRow(self, self.index[_id])
+
+    def __contains__(self, _id):
+        return _id in self.index
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, row):
+        ''' returns TaskRow view for row number '''
+        return TaskRow(self, row)
+
+    def rows(self, rows=None):
+        ''' generator of TaskRow views for the given row numbers, or all rows'''
+        if rows is None:
+            rows = range(len(self.ids))
+        for row in rows:
+            yield TaskRow(self, int(row))
+
+    def get_value(self, row, field):
+        ''' returns the value of field for row, or MISSING '''
+        if field == '_id':
+            return self.ids[row]
+        column = self.columns.get(field)
+        if column is None:
+            return MISSING
+        return column.get(row)
+
+    def set_value(self, row, field, value):
+        ''' sets field for row, creating or widening the column as needed '''
+        if field == '_id':
+            raise ValueError('_id is the table index and cannot be changed')
+        column = self.columns.get(field)
+        if column is None:
+            if value is MISSING:
+                return
+            column = _column_for_value(field, value, len(self.ids), self.categorical_fields)
+            self.columns[field] = column
+            self.fields.append(field)
+        elif value is not MISSING and not column.accepts(value):
+            # e.g. np.nan stored in a time field: fall back to python objects
+            values = [column.get(i) for i in range(len(self.ids))]
+            column = ObjectColumn(values)
+            self.columns[field] = column
+            self._present.pop(field, None)
+        column.set(row, value)
+        if field in self._present:
+            self._present[field][row] = value is not MISSING
+        self._inverted.pop(field, None)
+
+    def set_column(self, field, column):
+        ''' replaces (or adds) the whole column for field '''
+        if field not in self.columns:
+            self.fields.append(field)
+        self.columns[field] = column
+        self._present.pop(field, None)
+        self._inverted.pop(field, None)
+
+    def dependency_edges(self, field='depends_on'):
+        ''' returns (dependents, dependencies), parallel arrays of row numbers
+        with one entry per item of each task's depends_on list.
+        dependencies is -1 where the dependency is not in the table.'''
+        dependents = []
+        dependencies = []
+        column = self.columns.get(field)
+        if column is not None:
+            for row in range(len(self.ids)):
+                depends_on = column.get(row)
+                if depends_on is MISSING or not depends_on:
+                    continue
+                for dependency in depends_on:
+                    dependents.append(row)
+                    dependencies.append(self.index.get(dependency['_id'], -1))
+        return np.array(dependents, dtype=np.int64), np.array(dependencies, dtype=np.int64)
+
+    def present(self, field):
+        ''' boolean mask of rows that have field.
+        The mask is cached and kept up to date by set_value, so treat it as read-only.'''
+        if field == '_id':
+            return np.ones(len(self.ids), dtype=bool)
+        mask = self._present.get(field)
+        if mask is None:
+            column = self.columns.get(field)
+            if column is None:
+                return np.zeros(len(self.ids), dtype=bool)
+            mask = column.present()
+            self._present[field] = mask
+        return mask
+
+    def _inverted_index(self, field):
+        ''' returns (rows, offsets) for a categorical field:
+        rows holding code c are rows[offsets[c+1]:offsets[c+2]], in row order.
+        Built on first use and dropped whenever the field is written.'''
+        index = self._inverted.get(field)
+        if index is None:
+            column = self.columns[field]
+            shifted = column.codes + 1
+            rows = np.argsort(shifted, kind='stable')
+            counts = np.bincount(shifted, minlength=len(column.categories) + 1)
+            offsets = np.concatenate(([0], np.cumsum(counts)))
+            index = (rows, offsets)
+            self._inverted[field] = index
+        return index
+
+    def rows_with(self, field, values):
+        ''' returns sorted row numbers whose categorical field value is in values '''
+        column = self.columns[field]
+        rows, offsets = self._inverted_index(field)
+        codes = sorted({column.lookup[v] for v in values if column.accepts(v) and v in column.lookup})
+        if len(codes) == 1:
+            return rows[offsets[codes[0]+1]:offsets[codes[0]+2]]
+        return np.sort(np.concatenate([rows[offsets[c+1]:offsets[c+2]] for c in codes] + [rows[:0]]))
+
+    def isin(self, field, values):
+        ''' boolean mask of rows whose value for field is in values '''
+        if field == '_id':
+            return np.fromiter((x in values for x in self.ids), dtype=bool, count=len(self.ids))
+        column = self.columns.get(field)
+        if column is None:
+            return np.zeros(len(self.ids), dtype=bool)
+        if not isinstance(values, (list, tuple, set, frozenset)):
+            # anything else keeps plain "in" semantics, e.g. substring matching on a str
+            return ObjectColumn([column.get(i) for i in range(len(self.ids))]).isin(values)
+        return column.isin(values)
+
+    def select(self, screen=None):
+        ''' returns row numbers (in row order) of tasks matching screen, of the form {str:[]}.
+        Tasks must have every field in screen, and if the value for a field is nonempty,
+        the task's value must be in it.
+        Rows flagged DEPENDENCY_ONLY are left out unless screen names that field.
+
+        Value lists on categorical fields are answered from inverted indexes and intersected,
+        so a screen on e.g. a single version only touches that version's rows.
+        The remaining fields are checked against presence masks for the surviving rows.'''
+        rows = self._select(screen)
+        if DEPENDENCY_ONLY in self.columns and DEPENDENCY_ONLY not in (screen or {}):
+            rows = rows[~self.present(DEPENDENCY_ONLY)[rows]]
+        return rows
+
+    def _select(self, screen):
+        if not screen:
+            return np.arange(len(self.ids))
+        candidates = None
+        other_fields = []
+        for field in screen:
+            allowed = screen[field]
+            if (allowed and isinstance(self.columns.get(field), CategoricalColumn)
+                    and isinstance(allowed, (list, tuple, set, frozenset))):
+                rows = self.rows_with(field, allowed)
+                if candidates is None:
+                    candidates = rows
+                else:
+                    candidates = np.intersect1d(candidates, rows, assume_unique=True)
+            else:
+                other_fields.append(field)
+        if candidates is None:
+            mask = np.ones(len(self.ids), dtype=bool)
+            for field in other_fields:
+                if screen[field]:
+                    mask &= self.isin(field, screen[field])
+                else:
+                    mask &= self.present(field)
+            return np.flatnonzero(mask)
+        for field in other_fields:
+            if screen[field]:
+                candidates = candidates[self.isin(field, screen[field])[candidates]]
+            else:
+                candidates = candidates[self.present(field)[candidates]]
+        return candidates
+
+    def subset(self, rows):
+        ''' returns a new TaskTable holding only the given row numbers '''
+        columns = {field: column.subset(rows) for field, column in self.columns.items()}
+        return TaskTable([self.ids[i] for i in rows], columns, self.categorical_fields)
+
+    def dataframe(self, rows=None):
+        ''' returns a pandas dataframe built column by column '''
+        import pandas as pd
+        if rows is None:
+            rows = np.arange(len(self.ids))
+        data = {'_id': [self.ids[i] for i in rows]}
+        for field, column in self.columns.items():
+            data[field] = column.take(rows)
+        return pd.DataFrame(data)
+
+class TaskTableBuilder:
+    ''' accumulates task dicts one at a time and builds a TaskTable.
+    Fields in time_fields may hold ISO strings or datetime.datetime values;
+    they are parsed a chunk of chunk_rows tasks at a time with parse_ISO_column.
+    A task with an _id that was already added replaces the earlier one.'''
+
+    def __init__(self, time_fields, categorical_fields=CATEGORICAL_FIELDS, chunk_rows=1 << 16):
+        self.time_fields = list(time_fields)
+        self.categorical_fields = categorical_fields
+        self.chunk_rows = chunk_rows
+        self._ids = []
+        self._index = {}
+        self._values = {}
+        self._categories = {field: CategoricalColumn.empty(0) for field in categorical_fields}
+        # time fields: parsed arrays of chunk_rows each, plus raw values not yet parsed
+        self._time_chunks = {field: [] for field in self.time_fields}
+        self._time_pending = {field: [] for field in self.time_fields}
+        self._field_order = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, task):
+        _id = task['_id']
+        row = self._index.get(_id)
+        if row is None:
+            row = len(self._ids)
+            self._index[_id] = row
+            self._ids.append(_id)
+            for values in self._values.values():
+                values.append(MISSING)
+            for values in self._time_pending.values():
+                values.append(MISSING)
+        for field, value in task.items():
+            if field == '_id':
+                continue
+            self._field_order.setdefault(field, None)
+            if field in self._time_pending:
+                self._set_time(row, field, value)
+                continue
+            values = self._values.get(field)
+            if values is None:
+                values = [MISSING] * len(self._ids)
+                self._values[field] = values
+            if field in self._categories and CategoricalColumn.accepts(value):
+                value = self._categories[field].encode(value)
+            values[row] = value
+        if len(self._ids) % self.chunk_rows == 0:
+            self._flush_times()
+
+    def _set_time(self, row, field, value):
+        parsed_rows = len(self._time_chunks[field]) * self.chunk_rows
+        if row < parsed_rows:
+            # replacing a task whose chunk was already parsed
+            chunk = self._time_chunks[field][row // self.chunk_rows]
+            chunk[row % self.chunk_rows] = parse_ISO_column([value])[0]
+        else:
+            self._time_pending[field][row - parsed_rows] = value
+
+    def _flush_times(self):
+        for field, pending in self._time_pending.items():
+            if pending:
+                self._time_chunks[field].append(parse_ISO_column(pending))
+            self._time_pending[field] = []
+
+    def build(self):
+        self._flush_times()
+        columns = {}
+        for field in self._field_order:
+            if field in self._time_chunks:
+                columns[field] = TimeColumn(np.concatenate(self._time_chunks[field]))
+                continue
+            values = self._values[field]
+            if field in self._categories and all(isinstance(v, int) or v is MISSING for v in values):
+                codes = [-1 if v is MISSING else v for v in values]
+                columns[field] = CategoricalColumn(codes, self._categories[field].categories)
+            elif field in self._categories:
+                # unhashable values slipped into a categorical field, keep them as objects
+                categories = self._categories[field].categories
+                columns[field] = ObjectColumn([categories[v] if isinstance(v, int) else v for v in values])
+            else:
+                columns[field] = ObjectColumn(values)
+        return TaskTable(self._ids, columns, self.categorical_fields)
+
+def concat_tables(tables):
+    ''' stacks TaskTables row-wise into a new table. Fields missing from some tables are missing in their rows,
+    categorical columns are re-encoded over the union of categories, and a field whose column type differs
+    between tables becomes an ObjectColumn. If an _id appears more than once the last one wins.
+
+    >>> first, second = TaskTableBuilder(['finish_time']), TaskTableBuilder(['finish_time'])
+    >>> first.add({'_id': 'a', 'finish_time': '2020-08-05T11:51:19Z', 'distro': 'small'})
+    >>> first.add({'_id': 'b', 'finish_time': '2020-08-05T11:52:19Z', 'distro': 'large'})
+    >>> second.add({'_id': 'b', 'finish_time': '2020-08-06T11:51:19Z', 'distro': 'small', 'priority': 3})
+    >>> table = concat_tables([first.build(), second.build()])
+    >>> [dict(task) for task in table.rows()]
+    [{'_id': 'a', 'finish_time': datetime.datetime(2020, 8, 5, 11, 51, 19), 'distro': 'small'}, {'_id': 'b', 'finish_time': datetime.datetime(2020, 8, 6, 11, 51, 19), 'distro': 'small', 'priority': 3}]
+    '''
+    tables = list(tables)
+    if not tables:
+        return TaskTable([], {}, CATEGORICAL_FIELDS)
+    fields = {}
+    for table in tables:
+        for field in table.columns:
+            fields.setdefault(field, None)
+    columns = {}
+    for field in fields:
+        parts = [table.columns.get(field) for table in tables]
+        kinds = {type(part) for part in parts if part is not None}
+        if len(kinds) == 1 and kinds <= {TimeColumn, DeltaColumn}:
+            kind = kinds.pop()
+            columns[field] = kind(np.concatenate([
+                (kind.empty(len(table)) if part is None else part).values for table, part in zip(tables, parts)]))
+        elif kinds == {CategoricalColumn}:
+            merged = CategoricalColumn.empty(0)
+            codes = []
+            for table, part in zip(tables, parts):
+                if part is None:
+                    codes.append(np.full(len(table), -1, dtype=np.int32))
+                    continue
+                # -1 maps to itself through the trailing entry
+                remap = np.array([merged.encode(value) for value in part.categories] + [-1], dtype=np.int32)
+                codes.append(remap[part.codes])
+            columns[field] = CategoricalColumn(np.concatenate(codes), merged.categories)
+        else:
+            values = []
+            for table, part in zip(tables, parts):
+                if part is None:
+                    values.extend([MISSING] * len(table))
+                else:
+                    values.extend(part.get(row) for row in range(len(table)))
+            columns[field] = ObjectColumn(values)
+    ids = [task_id for table in tables for task_id in table.ids]
+    combined = TaskTable(ids, columns, tables[0].categorical_fields)
+    if len(combined.index) == len(ids):
+        return combined
+    # the index maps each _id to its last row
+    return combined.subset(np.array(sorted(combined.index.values()), dtype=np.int64))
+
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
+
+if __name__ == '__main__':
+    _test()
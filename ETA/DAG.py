@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+''' array-based algorithms for dependency graphs.
+
+Graphs are given as integer vertex ids 0..n-1 and parallel edge arrays (sources, targets).
+For tasks there is usually an edge from each task to each of its dependencies.
+Every algorithm here runs in O(V+E), processing the graph one topological level at a time
+with numpy instead of one vertex at a time.
+
+>>> # 0 depends on 1 and 2, 1 and 2 both depend on 3
+>>> sources, targets = [0, 0, 1, 2], [1, 2, 3, 3]
+>>> [level.tolist() for level in topological_levels(4, sources, targets)]
+[[0], [1, 2], [3]]
+>>> weights = np.array([[1, 1], [5, 1], [2, 3], [0, 0]])  # two weights per vertex
+>>> lengths, paths = critical_path(4, sources, targets, weights[sources], 0, 3)
+>>> lengths
+array([6., 4.])
+>>> paths
+[[0, 1, 3], [0, 2, 3]]
+>>> index = ReachabilityIndex(4, sources, targets)
+>>> index.reaches(0, 3), index.reaches(1, 2)
+(True, False)
+>>> index.descendants(0).tolist(), index.ancestors(3).tolist()
+([1, 2, 3], [0, 1, 2])
+>>> index.descendant_counts().tolist()
+[3, 1, 1, 0]
+>>> # a virtual sink 4 that 1 and 2 lead to, leaving the base edges alone
+>>> overlay = OverlayGraph(4, sources, targets)
+>>> sink = overlay.add_vertices(1)[0]
+>>> overlay.add_edges([1, 2], [sink, sink])
+>>> overlay.size, overlay.sources.tolist(), overlay.targets.tolist()
+(5, [0, 0, 1, 2, 1, 2], [1, 2, 3, 3, 4, 4])
+>>> sources, targets
+([0, 0, 1, 2], [1, 2, 3, 3])
+'''
+
+import numpy as np
+
+# int.bit_count is new in python 3.10
+_popcount = getattr(int, 'bit_count', None) or (lambda bits: bin(bits).count('1'))
+
+def csr(n, sources):
+    ''' compressed sparse row layout of the edges.
+    Returns (indptr, order): edges leaving vertex v are order[indptr[v]:indptr[v+1]],
+    as positions in the original edge arrays, in their original relative order.'''
+    sources = np.asarray(sources, dtype=np.int64)
+    order = np.argsort(sources, kind='stable')
+    counts = np.bincount(sources, minlength=n)
+    indptr = np.concatenate(([0], np.cumsum(counts)))
+    return indptr, order
+
+def _edges_leaving(indptr, order, vertices):
+    ''' positions of all edges leaving any of vertices, gathered without a python loop '''
+    starts = indptr[vertices]
+    lengths = indptr[vertices + 1] - starts
+    total = lengths.sum()
+    if not total:
+        return order[:0]
+    # offset of each edge within its vertex's slice
+    within = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return order[np.repeat(starts, lengths) + within]
+
+def topological_levels(n, sources, targets, visit=None):
+    ''' generator of arrays of vertices in topological order (Kahn's algorithm, one level at a time).
+    Every edge source comes out in an earlier level than its target.
+    If visit is given it is called as visit(level, edge_positions) for the edges leaving each level
+    before the next level is computed.
+    Raises ValueError if the graph has a cycle.'''
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    indptr, order = csr(n, sources)
+    indegree = np.bincount(targets, minlength=n)
+    level = np.flatnonzero(indegree == 0)
+    seen = 0
+    while level.size:
+        seen += level.size
+        yield level
+        edges = _edges_leaving(indptr, order, level)
+        if visit:
+            visit(level, edges)
+        reached = targets[edges]
+        np.subtract.at(indegree, reached, 1)
+        level = np.unique(reached[indegree[reached] == 0])
+    if seen < n:
+        raise ValueError('dependency graph has a cycle through {} tasks'.format(n - seen))
+
+def weak_components(n, sources, targets):
+    ''' labels vertices by weakly connected component, ignoring edge direction.
+    Returns an int array, equal labels for vertices in the same component.
+    Minimum labels are propagated along the edges with pointer jumping,
+    so a chain of length L takes about log(L) rounds.'''
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    # labels[v] is always a vertex of v's component, no larger than v
+    labels = np.arange(n)
+    while True:
+        lowest = np.minimum(labels[sources], labels[targets])
+        new = labels.copy()
+        np.minimum.at(new, sources, lowest)
+        np.minimum.at(new, targets, lowest)
+        new = new[new]
+        if (new == labels).all():
+            return labels
+        labels = new
+
+class ReachabilityIndex:
+    ''' precomputed transitive closure of a DAG, for O(1) reachability queries.
+
+    Vertices are laid out one weakly connected component after another, in topological order within each,
+    and every vertex gets two bitsets (python ints) over the positions in its component:
+    the vertices it reaches (descendants) and the vertices that reach it (ancestors).
+    Building takes one pass over the edges per direction, skipping edges to vertices
+    already known to be reachable. Memory is at most (component size)**2 / 4 bytes per component.
+    Raises ValueError if the graph has a cycle.'''
+
+    def __init__(self, n, sources, targets):
+        self.n = n
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        level = np.zeros(n, dtype=np.int64)
+        for depth, vertices in enumerate(topological_levels(n, sources, targets)):
+            level[vertices] = depth
+        _, component = np.unique(weak_components(n, sources, targets), return_inverse=True)
+        self.component = component.reshape(-1)
+        self.order = np.lexsort((level, self.component))
+        position = np.empty(n, dtype=np.int64)
+        position[self.order] = np.arange(n)
+        self.component_start = np.searchsorted(self.component[self.order], np.arange(self.component.max() + 1 if n else 0))
+        self.bit = (position - self.component_start[self.component]).tolist()
+        self._sources = sources
+        self._targets = targets
+        self._descendants = self._closure(sources, targets, self.order[::-1].tolist())
+        self._ancestors = None
+
+    def _closure(self, sources, targets, vertex_order):
+        ''' bitsets of the vertices reachable from each vertex along the edges,
+        vertex_order being a reverse topological order for them '''
+        indptr, edges = csr(self.n, sources)
+        indptr = indptr.tolist()
+        following = targets[edges].tolist()
+        bit = self.bit
+        reached = [0] * self.n
+        for vertex in vertex_order:
+            bits = 0
+            for other in following[indptr[vertex]:indptr[vertex + 1]]:
+                if not bits >> bit[other] & 1:
+                    bits |= reached[other] | 1 << bit[other]
+            reached[vertex] = bits
+        return reached
+
+    def _vertices(self, bits, vertex):
+        if not bits:
+            return np.empty(0, dtype=np.int64)
+        packed = np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+        positions = np.flatnonzero(np.unpackbits(packed, bitorder='little'))
+        return self.order[self.component_start[self.component[vertex]] + positions]
+
+    def _ancestor_bits(self):
+        if self._ancestors is None:
+            self._ancestors = self._closure(self._targets, self._sources, self.order.tolist())
+        return self._ancestors
+
+    def reaches(self, source, target):
+        ''' whether there is a path of one or more edges from source to target '''
+        if self.component[source] != self.component[target]:
+            return False
+        return bool(self._descendants[source] >> self.bit[target] & 1)
+
+    def descendants(self, vertex):
+        ''' vertices reachable from vertex, in topological order '''
+        return self._vertices(self._descendants[vertex], vertex)
+
+    def ancestors(self, vertex):
+        ''' vertices that reach vertex, in topological order '''
+        return self._vertices(self._ancestor_bits()[vertex], vertex)
+
+    def descendant_counts(self):
+        ''' number of descendants of every vertex, as an int array '''
+        return np.fromiter(map(_popcount, self._descendants), dtype=np.int64, count=self.n)
+
+    def ancestor_counts(self):
+        ''' number of ancestors of every vertex, as an int array '''
+        return np.fromiter(map(_popcount, self._ancestor_bits()), dtype=np.int64, count=self.n)
+
+class OverlayGraph:
+    ''' a base graph with extra virtual vertices and edges layered on top, base arrays untouched.
+    Virtual vertices are numbered after the base vertices, and the combined edge arrays list
+    the base edges first, then the extra edges in the order they were added.
+    Lets one base graph be shared by many analyses, each with its own scaffolding
+    (virtual sources and sinks, implicit dependencies).'''
+
+    def __init__(self, n, sources, targets):
+        self.base_size = n
+        self.size = n
+        self.base_sources = np.asarray(sources, dtype=np.int64)
+        self.base_targets = np.asarray(targets, dtype=np.int64)
+        self._extra_sources = []
+        self._extra_targets = []
+        self._edges = None
+
+    def add_vertices(self, count):
+        ''' adds count virtual vertices, returns their ids as an array '''
+        vertices = np.arange(self.size, self.size + count)
+        self.size += count
+        return vertices
+
+    def add_edges(self, sources, targets):
+        sources = np.asarray(sources, dtype=np.int64).reshape(-1)
+        targets = np.asarray(targets, dtype=np.int64).reshape(-1)
+        if len(sources) != len(targets):
+            raise ValueError('sources and targets differ in length')
+        if len(sources) and max(sources.max(), targets.max()) >= self.size:
+            raise ValueError('edge to a vertex that has not been added')
+        self._extra_sources.append(sources)
+        self._extra_targets.append(targets)
+        self._edges = None
+
+    def _combined(self):
+        if self._edges is None:
+            self._edges = (np.concatenate([self.base_sources] + self._extra_sources),
+                           np.concatenate([self.base_targets] + self._extra_targets))
+        return self._edges
+
+    @property
+    def sources(self):
+        return self._combined()[0]
+
+    @property
+    def targets(self):
+        return self._combined()[1]
+
+    def out_degree(self):
+        return np.bincount(self.sources, minlength=self.size)
+
+    def in_degree(self):
+        return np.bincount(self.targets, minlength=self.size)
+
+def longest_paths(n, sources, targets, weights, source=None):
+    ''' longest path lengths over a DAG, for several edge weightings in a single topological sweep.
+    weights is an array of shape (edges,) or (edges, k).
+    If source is given paths start there, otherwise they may start at any vertex.
+    Returns lengths of shape (n, k), -inf for vertices not reachable from source.'''
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    weights = np.asarray(weights, dtype=float).reshape(len(sources), -1)
+    if source is None:
+        lengths = np.zeros((n, weights.shape[1]))
+    else:
+        lengths = np.full((n, weights.shape[1]), -np.inf)
+        lengths[source] = 0
+
+    def relax(level, edges):
+        candidates = lengths[sources[edges]] + weights[edges]
+        for k in range(weights.shape[1]):
+            np.maximum.at(lengths[:, k], targets[edges], candidates[:, k])
+
+    for _ in topological_levels(n, sources, targets, relax):
+        pass
+    return lengths
+
+def critical_path(n, sources, targets, weights, source, target):
+    ''' longest source -> target path for each column of weights, see longest_paths.
+    Returns (lengths, paths): lengths has one entry per weighting,
+    paths is one list of vertices from source to target per weighting.
+    Raises ValueError if target is not reachable from source.'''
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    weights = np.asarray(weights, dtype=float).reshape(len(sources), -1)
+    lengths = longest_paths(n, sources, targets, weights, source)
+    if np.isneginf(lengths[target]).any():
+        raise ValueError('vertex {} is not reachable from {}'.format(target, source))
+    paths = []
+    for k in range(weights.shape[1]):
+        # an edge is on some longest path if it realizes its target's length
+        tight = lengths[sources, k] + weights[:, k] == lengths[targets, k]
+        predecessor = np.full(n, -1, dtype=np.int64)
+        predecessor[targets[tight][::-1]] = sources[tight][::-1]
+        path = [target]
+        while path[-1] != source:
+            path.append(int(predecessor[path[-1]]))
+        paths.append(path[::-1])
+    return lengths[target], paths
+
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
+
+if __name__ == '__main__':
+    _test()
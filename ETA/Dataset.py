@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+''' task data spread over a directory of dumps, e.g. one file per day or per project.
+
+PartitionedDataset keeps a manifest (.eta_manifest.json in the directory) with the finish_time range,
+task count and distros/versions of every file. A query for a time range and screen_by
+only loads the files that can match, several at a time, each through its own parse cache (see ETA.Cache).
+Tasks outside the time range are dropped, and dependencies of the remaining tasks that live
+in other files are pulled in, walking back through earlier files (up to lookback before the query)
+until all are found. Those dependencies are flagged ETA.Columns.DEPENDENCY_ONLY: they are there
+for derived fields like begin_wait, but get_tasks and the reports leave them out.
+Queries are task sources for ETA.TaskTimes and its subclasses:
+
+    dataset = PartitionedDataset('./daily_dumps')
+    tasks = metrics.DepWaitTaskTimes(dataset.query(begin, end, {'distro': ['rhel62-large']}), time_fields)
+
+>>> import datetime, json, os, tempfile
+>>> tmp = tempfile.mkdtemp()
+>>> days = {'01': [('compile', 'large', [])],
+...         '02': [('test', 'small', ['compile']), ('lint', 'large', [])],
+...         '03': [('deploy', 'small', ['test'])]}
+>>> for day, tasks in days.items():
+...     with open(os.path.join(tmp, '2021-01-{}.json'.format(day)), 'w') as f:
+...         json.dump([{'_id': _id, 'distro': distro, 'finish_time': '2021-01-{}T12:00:00Z'.format(day),
+...                     'depends_on': [{'_id': dep} for dep in deps]} for _id, distro, deps in tasks], f)
+>>> dataset = PartitionedDataset(tmp, cache_dir=os.path.join(tmp, 'cache'), processes=1)
+>>> query = dataset.query(datetime.datetime(2021, 1, 2), datetime.datetime(2021, 1, 3), {'distro': ['small']})
+>>> table = query.task_table(['finish_time'])
+>>> table.ids, [table.ids[row] for row in table.select()]
+(['compile', 'test'], ['test'])
+>>> # the first query described every file, from now on the others are skipped
+>>> [os.path.basename(path) for path in dataset.partitions(query.begin, query.end, query.screen_by)]
+['2021-01-02.json']
+>>> table = query.task_table(['finish_time'])
+>>> table.ids, table['compile'][DEPENDENCY_ONLY]
+(['test', 'compile'], True)
+>>> # finish_time is parsed for the time range and the manifest even if it is not one of the time_fields
+>>> os.remove(dataset.manifest_path)
+>>> fresh = PartitionedDataset(tmp, cache_dir=os.path.join(tmp, 'cache'), processes=1)
+>>> query = fresh.query(datetime.datetime(2021, 1, 2), datetime.datetime(2021, 1, 3), {'distro': ['small']})
+>>> table = query.task_table([])
+>>> table.ids, table['test']['finish_time'], fresh.manifest['2021-01-02.json']['last']
+(['compile', 'test'], '2021-01-02T12:00:00Z', '2021-01-02T12:00:00.000')
+>>> dataset.manifest['2021-01-03.json']['values']
+{'distro': ['small']}
+'''
+
+import concurrent.futures
+import datetime
+import glob
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+from ETA.Columns import DEPENDENCY_ONLY, MISSING, CategoricalColumn, ObjectColumn, TimeColumn, concat_tables, parse_ISO_column
+
+MANIFEST_NAME = '.eta_manifest.json'
+# categorical fields whose values are recorded in the manifest for pruning
+MANIFEST_FIELDS = ('distro', 'version')
+TIME_FIELD = 'finish_time'
+# how far before the start of a query to look for dependencies
+LOOKBACK = datetime.timedelta(days=7)
+
+def _load_partition(job):
+    ''' parses one file with ETA.TaskTimes, in a worker process '''
+    from ETA import TaskTimes
+    path, time_fields, cache_dir = job
+    return TaskTimes(path, time_fields, cache_dir).tasks
+
+def _stamp(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+class PartitionedDataset:
+    ''' a directory of task dumps matching pattern, see module docstring.
+    cache_dir is passed on to ETA.TaskTimes for every file, processes caps concurrent loads
+    (1 loads in this process).'''
+
+    def __init__(self, directory, pattern='*.json', cache_dir=None, processes=None, time_field=TIME_FIELD):
+        self.directory = directory
+        self.paths = sorted(glob.glob(os.path.join(directory, pattern)))
+        self.cache_dir = cache_dir
+        self.processes = processes
+        self.time_field = time_field
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # forget files that changed since they were described
+        return {name: entry for name, entry in manifest.items()
+                if os.path.exists(os.path.join(self.directory, name))
+                and entry['stamp'] == _stamp(os.path.join(self.directory, name))}
+
+    def _write_manifest(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _describe(self, path, table):
+        entry = {'stamp': _stamp(path), 'tasks': len(table), 'first': None, 'last': None, 'values': {}}
+        times = self.times(table)
+        if times is not None and len(table):
+            times = times[~np.isnat(times)]
+            if len(times):
+                entry['first'] = str(times.min())
+                entry['last'] = str(times.max())
+        for field in MANIFEST_FIELDS:
+            column = table.columns.get(field)
+            if isinstance(column, CategoricalColumn):
+                used = np.unique(column.codes[column.codes >= 0])
+                entry['values'][field] = sorted(str(column.categories[code]) for code in used)
+        return entry
+
+    def times(self, table):
+        ''' time_field of every row of table as a datetime64[ms] array (NaT where missing), or None without the field.
+        The field is parsed here if it was not among the time_fields the table was loaded with.'''
+        column = table.columns.get(self.time_field)
+        if column is None:
+            return None
+        if isinstance(column, TimeColumn):
+            return column.values
+        return parse_ISO_column([column.get(row) for row in range(len(table))])
+
+    def load(self, paths, time_fields):
+        ''' loads the given files concurrently, returns their TaskTables in the same order
+        and records them in the manifest '''
+        jobs = [(path, list(time_fields), self.cache_dir) for path in paths]
+        if self.processes == 1 or len(jobs) < 2:
+            tables = [_load_partition(job) for job in jobs]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.processes) as executor:
+                tables = list(executor.map(_load_partition, jobs))
+        for path, table in zip(paths, tables):
+            self.manifest[os.path.basename(path)] = self._describe(path, table)
+        if paths:
+            self._write_manifest()
+        return tables
+
+    def partitions(self, begin=None, end=None, screen_by=None):
+        ''' files that may hold tasks finishing between begin and end that pass screen_by.
+        Files not in the manifest yet are always included.'''
+        begin = None if begin is None else np.datetime64(begin, 'ms')
+        end = None if end is None else np.datetime64(end, 'ms')
+        selected = []
+        for path in self.paths:
+            entry = self.manifest.get(os.path.basename(path))
+            if entry is None:
+                selected.append(path)
+                continue
+            if entry['first'] is None and (begin is not None or end is not None):
+                continue
+            if begin is not None and np.datetime64(entry['last'], 'ms') < begin:
+                continue
+            if end is not None and np.datetime64(entry['first'], 'ms') > end:
+                continue
+            if not self._may_pass(entry, screen_by):
+                continue
+            selected.append(path)
+        return selected
+
+    def _may_pass(self, entry, screen_by):
+        for field, allowed in (screen_by or {}).items():
+            values = entry['values'].get(field)
+            if field not in MANIFEST_FIELDS or values is None:
+                continue
+            if not values:
+                return False
+            if allowed and isinstance(allowed, (list, tuple, set, frozenset)):
+                if not set(values) & {str(value) for value in allowed}:
+                    return False
+        return True
+
+    def query(self, begin=None, end=None, screen_by=None, lookback=LOOKBACK):
+        ''' task source for ETA.TaskTimes covering tasks finishing between begin and end that pass screen_by,
+        plus all of their dependencies that finished no more than lookback before begin '''
+        return DatasetQuery(self, begin, end, screen_by, lookback)
+
+    def task_table(self, time_fields):
+        ''' the whole dataset as one TaskTable, so a PartitionedDataset is itself a task source '''
+        return self.query().task_table(time_fields)
+
+class DatasetQuery:
+    ''' one query on a PartitionedDataset, see PartitionedDataset.query '''
+
+    def __init__(self, dataset, begin=None, end=None, screen_by=None, lookback=LOOKBACK):
+        self.dataset = dataset
+        self.begin = begin
+        self.end = end
+        self.screen_by = screen_by
+        self.lookback = lookback
+
+    def _selected_rows(self, table):
+        rows = table.select(self.screen_by)
+        if self.begin is None and self.end is None:
+            return rows
+        times = self.dataset.times(table)
+        if times is None:
+            return rows[:0]
+        if self.begin is not None:
+            rows = rows[times[rows] >= np.datetime64(self.begin, 'ms')]
+        if self.end is not None:
+            rows = rows[times[rows] <= np.datetime64(self.end, 'ms')]
+        return rows
+
+    def _ends_after(self, path, cutoff):
+        entry = self.dataset.manifest.get(os.path.basename(path))
+        if entry is None:
+            return True
+        return entry['last'] is not None and np.datetime64(entry['last'], 'ms') >= cutoff
+
+    def _starts_by(self, path, latest):
+        ''' whether path may hold a task finishing no later than latest, None meaning any time '''
+        entry = self.dataset.manifest.get(os.path.basename(path))
+        if entry is None or latest is None:
+            return True
+        return entry['first'] is not None and np.datetime64(entry['first'], 'ms') <= latest
+
+    @staticmethod
+    def _finished(times, row):
+        ''' row of times as returned by PartitionedDataset.times, or None if unknown '''
+        if times is None or np.isnat(times[row]):
+            return None
+        return times[row]
+
+    def task_table(self, time_fields):
+        ''' the tasks of the query, followed by the dependencies found for them.
+        Those are flagged DEPENDENCY_ONLY, so TaskTable.select and with it TaskTimes.get_tasks skip them,
+        while derived fields like begin_wait still see them.'''
+        dataset = self.dataset
+        paths = dataset.partitions(self.begin, self.end, self.screen_by)
+        tables = dataset.load(paths, time_fields)
+        finish_times = [dataset.times(table) for table in tables]
+        selected = [np.zeros(len(table), dtype=bool) for table in tables]
+        for table, mask in zip(tables, selected):
+            mask[self._selected_rows(table)] = True
+        queried = [mask.copy() for mask in selected]
+        logging.info('{} of {} partitions match, {} tasks selected'.format(
+            len(paths), len(dataset.paths), sum(int(mask.sum()) for mask in selected)))
+
+        # the rest are searched for dependencies, latest first.
+        # A dependency finished before its dependent did, so only files starting by then can hold it,
+        # and they are loaded a batch at a time to stop as soon as everything is found.
+        loaded = set(paths)
+        remaining = [path for path in reversed(dataset.paths) if path not in loaded]
+        if self.begin is not None and self.lookback is not None:
+            cutoff = np.datetime64(self.begin, 'ms') - np.timedelta64(self.lookback)
+            remaining = [path for path in remaining if self._ends_after(path, cutoff)]
+        batch_size = 1 if dataset.processes == 1 else (dataset.processes or os.cpu_count() or 1)
+        where = {}
+        for t, table in enumerate(tables):
+            for row, task_id in enumerate(table.ids):
+                where[task_id] = (t, row)
+        frontier = [(t, row) for t, mask in enumerate(selected) for row in np.flatnonzero(mask).tolist()]
+        # missing dependency _id: latest finish of a task depending on it, None if unknown
+        missing = {}
+        while frontier or missing:
+            for t, row in frontier:
+                depends_on = tables[t].get_value(row, 'depends_on')
+                if not isinstance(depends_on, list):
+                    continue
+                finished = self._finished(finish_times[t], row)
+                for dependency in depends_on:
+                    task_id = dependency['_id']
+                    if task_id not in missing:
+                        missing[task_id] = finished
+                    elif missing[task_id] is not None:
+                        missing[task_id] = None if finished is None else max(missing[task_id], finished)
+            frontier = []
+            for task_id in list(missing):
+                if task_id in where:
+                    del missing[task_id]
+                    t, row = where[task_id]
+                    if not selected[t][row]:
+                        selected[t][row] = True
+                        frontier.append((t, row))
+            if frontier or not missing:
+                continue
+            latest = None if None in missing.values() else max(missing.values())
+            remaining = [path for path in remaining if self._starts_by(path, latest)]
+            if not remaining:
+                break
+            batch, remaining = remaining[:batch_size], remaining[batch_size:]
+            for table in dataset.load(batch, time_fields):
+                tables.append(table)
+                finish_times.append(dataset.times(table))
+                selected.append(np.zeros(len(table), dtype=bool))
+                queried.append(selected[-1].copy())
+                for row, task_id in enumerate(table.ids):
+                    where.setdefault(task_id, (len(tables) - 1, row))
+        if missing:
+            logging.info('{} dependencies not found in any searched partition'.format(len(missing)))
+        parts = []
+        for table, mask, query_mask in zip(tables, selected, queried):
+            rows = np.flatnonzero(mask)
+            part = table.subset(rows)
+            if not query_mask[rows].all():
+                part.set_column(DEPENDENCY_ONLY, ObjectColumn(
+                    [MISSING if in_query else True for in_query in query_mask[rows].tolist()]))
+            parts.append(part)
+        return concat_tables(parts)
+
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
+
+if __name__ == '__main__':
+    _test()
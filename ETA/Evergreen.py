@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+''' client for the evergreen REST v2 API.
+
+One pooled requests.Session is shared by all calls. Lists follow the Link: rel="next" pagination,
+independent requests (e.g. the tasks of many builds) run on a capped thread pool,
+and failed requests are retried with exponential backoff.
+Responses are cached on disk under the ETA cache directory (see ETA.Cache) for ttl seconds,
+so repeating an investigation over the same patches does not touch the network.
+
+LocalEvergreen serves canned pages over http on localhost for tests.
+
+>>> import tempfile
+>>> routes = {'/rest/v2/projects/mms/patches': [[{'patch_id': 'a'}, {'patch_id': 'b'}], [{'patch_id': 'c'}]]}
+>>> with LocalEvergreen(routes) as server:
+...     client = EvergreenClient({}, server.url + '/rest/v2', cache_dir=tempfile.mkdtemp())
+...     first = [patch['patch_id'] for patch in client.patches('mms')]
+...     again = [patch['patch_id'] for patch in client.patches('mms')]
+>>> first, again, server.hits
+(['a', 'b', 'c'], ['a', 'b', 'c'], 2)
+>>> routes = {'/rest/v2/versions/a/builds': [{'_id': 'b1'}, {'_id': 'b2'}],
+...         '/rest/v2/builds/b1/tasks': [{'task_id': 't1'}], '/rest/v2/builds/b2/tasks': [{'task_id': 't2'}]}
+>>> with LocalEvergreen(routes) as server:
+...     client = EvergreenClient({}, server.url + '/rest/v2', cache_dir=False)
+...     client.versions_tasks(['a'])
+{'a': [{'task_id': 't1'}, {'task_id': 't2'}]}
+'''
+
+import concurrent.futures
+import hashlib
+import http.server
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import requests
+import requests.adapters
+
+from ETA.Cache import default_cache_dir
+
+API_URL = 'https://evergreen.mongodb.com/rest/v2/'
+TTL = 60 * 60
+MAX_WORKERS = 8
+RETRIES = 4
+BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class EvergreenClient:
+    ''' Evergreen REST client.
+    auth is the header dict with Api-User and Api-Key, see read_credentials.
+    cache_dir defaults to the ETA cache directory, False turns the response cache off.
+    ttl is the number of seconds a cached response stays fresh, max_workers caps concurrent requests.'''
+
+    def __init__(self, auth, base_url=API_URL, cache_dir=None, ttl=TTL,
+            max_workers=MAX_WORKERS, retries=RETRIES, backoff=BACKOFF):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.cache_dir = os.path.join(cache_dir, 'evergreen') if cache_dir else None
+        # nested map() calls each get their own threads, the semaphore keeps requests in flight under the cap
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self.session = requests.Session()
+        self.session.headers.update(auth)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _url(self, path, params=None):
+        url = urllib.parse.urljoin(self.base_url, path.lstrip('/'))
+        if params:
+            url += ('&' if '?' in url else '?') + urllib.parse.urlencode(params)
+        return url
+
+    def _cache_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode()).hexdigest() + '.json')
+
+    def _load_cached(self, url):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._cache_path(url)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['url'] != url or time.time() - entry['fetched'] > self.ttl:
+            return None
+        return entry
+
+    def _save_cached(self, entry):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._cache_path(entry['url']))
+
+    def _fetch(self, url):
+        ''' GET url with retries. Returns the cache entry {url, fetched, body, next}. '''
+        entry = self._load_cached(url)
+        if entry:
+            return entry
+        for attempt in range(self.retries + 1):
+            try:
+                with self._slots:
+                    response = self.session.get(url, timeout=60)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise
+                logging.warning('{} failed ({}), retrying'.format(url, e))
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    response.raise_for_status()
+                    break
+                logging.warning('{} returned {}, retrying'.format(url, response.status_code))
+            time.sleep(self.backoff * 2 ** attempt)
+        entry = {
+            'url': url,
+            'fetched': time.time(),
+            'body': response.json(),
+            'next': response.links.get('next', {}).get('url'),
+            }
+        self._save_cached(entry)
+        return entry
+
+    def get(self, path, params=None):
+        ''' decoded json body of one GET request, path relative to base_url '''
+        return self._fetch(self._url(path, params))['body']
+
+    def get_pages(self, path, params=None, limit=None):
+        ''' generator of the items of a paginated list, following Link headers,
+        stopping after limit items if limit is given.
+        Pages are chained by their next links, so they are fetched one after another.'''
+        url = self._url(path, params)
+        count = 0
+        while url:
+            entry = self._fetch(url)
+            for item in entry['body']:
+                if limit is not None and count >= limit:
+                    return
+                count += 1
+                yield item
+            url = entry['next']
+
+    def map(self, function, items):
+        ''' function(item) for every item on at most max_workers threads, results in item order '''
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(function, items))
+
+    def patches(self, project, limit=3000):
+        ''' most recent patches of project, newest first '''
+        return list(self.get_pages('projects/{}/patches'.format(project), limit=limit))
+
+    def build_tasks(self, build_id):
+        return list(self.get_pages('builds/{}/tasks'.format(build_id)))
+
+    def version_tasks(self, version_id):
+        ''' all tasks of a version (a patch's version id is its patch id), builds fetched concurrently '''
+        builds = self.get('versions/{}/builds'.format(version_id))
+        tasks = []
+        for build_tasks in self.map(self.build_tasks, [build['_id'] for build in builds]):
+            tasks.extend(build_tasks)
+        return tasks
+
+    def versions_tasks(self, version_ids):
+        ''' {version_id: tasks} for many versions, fetched concurrently '''
+        version_ids = list(version_ids)
+        return dict(zip(version_ids, self.map(self.version_tasks, version_ids)))
+
+def read_credentials(cred_file='~/.evergreen.yml'):
+    ''' auth headers from an evergreen cli config file '''
+    import yaml
+    cred_file = os.path.expanduser(cred_file)
+    if not os.path.exists(cred_file):
+        raise ValueError('credential file {} does not exist'.format(cred_file))
+    with open(cred_file, 'r') as f:
+        data = yaml.safe_load(f)
+    return {'Api-Key': data['api_key'], 'Api-User': data['user']}
+
+class LocalEvergreen:
+    ''' stand-in evergreen server on localhost for tests, used as a context manager.
+    routes maps a path to a json body, or to a list of pages which are linked with Link headers.
+    hits counts the requests served.'''
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.hits = 0
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urllib.parse.urlparse(self.path)
+                page = int(urllib.parse.parse_qs(parsed.query).get('page', ['0'])[0])
+                with stand_in._lock:
+                    stand_in.hits += 1
+                if parsed.path not in stand_in.routes:
+                    self.send_error(404)
+                    return
+                body = stand_in.routes[parsed.path]
+                paged = isinstance(body, list) and body and isinstance(body[0], list)
+                if paged:
+                    pages, body = body, body[page]
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                if paged and page + 1 < len(pages):
+                    self.send_header('Link', '<{}{}?page={}>; rel="next"'.format(stand_in.url, parsed.path, page + 1))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
+
+if __name__ == '__main__':
+    _test()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+''' opt-in instrumentation for the analysis pipeline: stage timers, named counters
+and optional cProfile and tracemalloc capture, reported as json.
+
+Instrumentation is off by default, and then each hook costs a single check.
+Set the ETA_INSTRUMENT environment variable to a report path to turn it on for a whole run;
+the report is written when the process exits ({pid} in the path is replaced by the process id).
+ETA_INSTRUMENT_PROFILE=cpu adds the top functions from cProfile, =memory the memory growth
+of every stage and the peak from tracemalloc, =cpu,memory both.
+From code, enable() and write_report() do the same, e.g. runner.py --instrument writes one report per dataset.
+
+Stages nest: a stage entered inside another is reported as 'outer/inner'.
+Work done in pool workers is recorded with capture() in the worker and added to the parent's run
+with merge(), nested under the stage the parent is in.
+
+>>> enable()
+>>> with stage('ingest'):
+...     count('bad_date_tasks', 3)
+...     with stage('parse'):
+...         pass
+>>> with stage('ingest'):
+...     count('bad_date_tasks')
+>>> data = report()
+>>> sorted(data['stages']), data['counters']
+(['ingest', 'ingest/parse'], {'bad_date_tasks': 4})
+>>> data['stages']['ingest']['calls'], data['stages']['ingest/parse']['calls']
+(2, 1)
+>>> with capture() as captured:
+...     with stage('parse'):
+...         count('bad_date_tasks')
+>>> with stage('ingest'):
+...     merge(captured)
+>>> data = report()
+>>> data['stages']['ingest/parse']['calls'], data['counters']
+(2, {'bad_date_tasks': 5})
+>>> disable()
+>>> with stage('ignored'):
+...     count('ignored')
+>>> report() is None
+True
+'''
+
+import atexit
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+ENV_VAR = 'ETA_INSTRUMENT'
+PROFILE_ENV_VAR = 'ETA_INSTRUMENT_PROFILE'
+# functions listed in the report when profiling
+PROFILE_TOP = 30
+
+_NULL_STAGE = contextlib.nullcontext()
+# the current _Run, None while instrumentation is off
+_run = None
+
+class _Run:
+    ''' everything recorded since enable() '''
+
+    def __init__(self, path=None, profile=False, memory=False):
+        self.path = path
+        self.started = time.time()
+        self.started_counter = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.stack = []
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.profiler = None
+        if profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+class _Stage:
+    ''' context manager timing one stage of a run '''
+
+    __slots__ = ('run', 'name', 'path', 'started', 'memory')
+
+    def __init__(self, run, name):
+        self.run = run
+        self.name = name
+
+    def __enter__(self):
+        self.run.stack.append(self.name)
+        self.path = '/'.join(self.run.stack)
+        self.memory = tracemalloc.get_traced_memory()[0] if self.run.memory else 0
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.started
+        entry = self.run.stages.get(self.path)
+        if entry is None:
+            entry = self.run.stages[self.path] = {'calls': 0, 'seconds': 0.0}
+            if self.run.memory:
+                entry['memory_growth_mb'] = 0.0
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        if self.run.memory:
+            entry['memory_growth_mb'] += (tracemalloc.get_traced_memory()[0] - self.memory) / 2**20
+        self.run.stack.pop()
+        return False
+
+def enabled():
+    return _run is not None
+
+def enable(path=None, profile=False, memory=False):
+    ''' starts recording, discarding anything recorded before.
+    path is where write_report() writes by default.'''
+    global _run
+    disable()
+    _run = _Run(path, profile, memory)
+
+def disable():
+    ''' stops recording, without writing a report '''
+    global _run
+    if _run is None:
+        return
+    if _run.profiler:
+        _run.profiler.disable()
+    if _run.memory:
+        tracemalloc.stop()
+    _run = None
+
+def stage(name):
+    ''' context manager timing the stage name, a no-op while disabled '''
+    if _run is None:
+        return _NULL_STAGE
+    return _Stage(_run, name)
+
+def timed(name):
+    ''' decorator running every call of a function as the stage name '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _run is None:
+                return function(*args, **kwargs)
+            with _Stage(_run, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name, amount=1):
+    ''' adds amount to the counter name '''
+    if _run is not None:
+        _run.counters[name] = _run.counters.get(name, 0) + int(amount)
+
+@contextlib.contextmanager
+def capture():
+    ''' records into a run of its own for the duration, whether or not instrumentation is on,
+    e.g. in a pool worker. The with target is a dict, filled with the stages and counters
+    recorded once the block is done, to be passed back to merge() in the parent.'''
+    global _run
+    outer = _run
+    _run = _Run()
+    captured = {}
+    try:
+        yield captured
+    finally:
+        captured['stages'] = _run.stages
+        captured['counters'] = _run.counters
+        _run = outer
+
+def merge(captured):
+    ''' adds the stages and counters from capture() to the current run,
+    stages nested under the current stage. Seconds from several workers add up.'''
+    if _run is None:
+        return
+    prefix = '/'.join(_run.stack)
+    for name, entry in captured['stages'].items():
+        path = prefix + '/' + name if prefix else name
+        merged = _run.stages.setdefault(path, {'calls': 0, 'seconds': 0.0})
+        for key, value in entry.items():
+            merged[key] = merged.get(key, 0) + value
+    for name, amount in captured['counters'].items():
+        count(name, amount)
+
+def _profile_summary(profiler):
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({'function': '{}:{}({})'.format(os.path.basename(filename), line, function),
+                     'calls': calls, 'total_seconds': round(total, 6), 'cumulative_seconds': round(cumulative, 6)})
+    rows.sort(key=lambda row: row['cumulative_seconds'], reverse=True)
+    return rows[:PROFILE_TOP]
+
+def report():
+    ''' the current run as a json-serializable dict, or None while disabled '''
+    if _run is None:
+        return None
+    data = {
+        'pid': os.getpid(),
+        'argv': sys.argv,
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(_run.started)),
+        'seconds': round(time.perf_counter() - _run.started_counter, 6),
+        'stages': {name: {key: round(value, 6) if isinstance(value, float) else value for key, value in entry.items()}
+                   for name, entry in _run.stages.items()},
+        'counters': dict(_run.counters),
+        }
+    if _run.memory:
+        data['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 3)
+    if _run.profiler:
+        _run.profiler.disable()
+        data['profile'] = _profile_summary(_run.profiler)
+        _run.profiler.enable()
+    return data
+
+def write_report(path=None):
+    ''' writes report() as json to path, by default the one given to enable() '''
+    data = report()
+    path = path or (_run.path if _run else None)
+    if data is None or not path:
+        return
+    path = path.replace('{pid}', str(os.getpid()))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+    logging.info('instrumentation report written to {}'.format(path))
+
+def profile_options():
+    ''' (profile, memory) as asked for by ETA_INSTRUMENT_PROFILE '''
+    options = os.environ.get(PROFILE_ENV_VAR, '').split(',')
+    return 'cpu' in options, 'memory' in options
+
+def _enable_from_environment():
+    path = os.environ.get(ENV_VAR)
+    if not path:
+        return
+    enable(path, *profile_options())
+    atexit.register(write_report)
+
+_enable_from_environment()
+
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
+
+if __name__ == '__main__':
+    _test()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+''' direct ingest from the evergreen tasks collection, replacing get_task_data.sh.
+
+A MongoSource turns a screen_by-style filter and a time range into an aggregation pipeline,
+so filtering and projection happen on the server, and hands out tasks one cursor batch at a time.
+Pass it to ETA.TaskTimes (or a subclass) in place of a json path.
+BSON dates arrive as datetime.datetime, so no time strings are parsed on the way in.
+
+pymongo is only needed for connect(); anything with an aggregate(pipeline, **options) method
+returning an iterable of dicts works as a collection, e.g. InMemoryCollection for tests.
+
+>>> import datetime
+>>> collection = InMemoryCollection([
+...     {'_id': 'compile', 'distro': 'rhel62-large', 'finish_time': datetime.datetime(2021, 1, 15, 1), 'secret': 1},
+...     {'_id': 'lint', 'distro': 'rhel62-small', 'finish_time': datetime.datetime(2021, 1, 15, 2)},
+...     {'_id': 'old', 'distro': 'rhel62-large', 'finish_time': datetime.datetime(2020, 1, 1)},
+...     ])
+>>> source = MongoSource(collection, screen_by={'distro': ['rhel62-large']},
+...         begin=datetime.datetime(2021, 1, 14, 23, 30), end=datetime.datetime(2021, 1, 15, 12),
+...         fields=['distro', 'finish_time'])
+>>> source.pipeline
+[{'$match': {'finish_time': {'$gt': datetime.datetime(2021, 1, 14, 23, 30), '$lt': datetime.datetime(2021, 1, 15, 12, 0)}, 'distro': {'$in': ['rhel62-large']}}}, {'$project': {'distro': 1, 'finish_time': 1}}]
+>>> list(source.iter_tasks())
+[{'_id': 'compile', 'distro': 'rhel62-large', 'finish_time': datetime.datetime(2021, 1, 15, 1, 0)}]
+>>> from ETA import TaskTimes
+>>> TaskTimes(source, ['finish_time'], cache_dir=False).screen_by
+{'distro': ['rhel62-large']}
+'''
+
+import logging
+
+try:
+    import pymongo
+except ImportError:
+    pymongo = None
+
+# the fields get_tasks.js projects
+DEFAULT_FIELDS = (
+        'create_time',
+        'dispatch_time',
+        'scheduled_time',
+        'start_time',
+        'finish_time',
+        'priority',
+        'distro',
+        'depends_on',
+        'version',
+        'display_only',
+        'generated_by',
+        'task_group',
+        )
+BATCH_SIZE = 10000
+
+def build_pipeline(screen_by=None, begin=None, end=None, time_field='finish_time', fields=DEFAULT_FIELDS):
+    ''' aggregation pipeline selecting tasks with begin < time_field < end that pass screen_by.
+    screen_by has the form used by TaskTimes.get_tasks: an empty value requires the field,
+    a list, tuple or set restricts it to those values.
+    Other screen values can't be expressed as a query, so only the field's presence is pushed down;
+    a TaskTimes built on a MongoSource takes over its screen_by and applies the full screen afterwards.
+
+    >>> build_pipeline({'distro': [], 'version': ('v1', 'v2')}, fields=['distro'])
+    [{'$match': {'distro': {'$exists': True}, 'version': {'$in': ['v1', 'v2']}}}, {'$project': {'distro': 1, 'version': 1}}]
+    '''
+    match = {}
+    time_range = {}
+    if begin is not None:
+        time_range['$gt'] = begin
+    if end is not None:
+        time_range['$lt'] = end
+    if time_range:
+        match[time_field] = time_range
+    projection = {field: 1 for field in fields}
+    for field, allowed in (screen_by or {}).items():
+        if allowed and isinstance(allowed, (list, tuple, set, frozenset)):
+            match[field] = {'$in': list(allowed)}
+        else:
+            match[field] = {'$exists': True}
+        projection[field] = 1
+    if time_range:
+        projection[time_field] = 1
+    pipeline = []
+    if match:
+        pipeline.append({'$match': match})
+    pipeline.append({'$project': projection})
+    return pipeline
+
+class MongoSource:
+    ''' task source for ETA.TaskTimes backed by an aggregation over a tasks collection.
+    Results are streamed batch_size documents at a time, never collected into one array. '''
+
+    def __init__(self, collection, screen_by=None, begin=None, end=None,
+            time_field='finish_time', fields=DEFAULT_FIELDS, batch_size=BATCH_SIZE):
+        self.collection = collection
+        self.screen_by = screen_by
+        self.batch_size = batch_size
+        self.pipeline = build_pipeline(screen_by, begin, end, time_field, fields)
+
+    def iter_tasks(self):
+        ''' generator of task dicts straight from the server cursor '''
+        logging.info('running aggregation {}'.format(self.pipeline))
+        cursor = self.collection.aggregate(self.pipeline, batchSize=self.batch_size, allowDiskUse=True)
+        try:
+            yield from cursor
+        finally:
+            close = getattr(cursor, 'close', None)
+            if close:
+                close()
+
+def connect(uri, database='mci', collection='tasks', **kwargs):
+    ''' returns a MongoSource on database.collection at uri, reading from a secondary when there is one.
+    Remaining arguments are passed on to MongoSource.'''
+    if pymongo is None:
+        raise ImportError('pymongo is required to read from mongodb, try pipenv install pymongo')
+    client = pymongo.MongoClient(uri, readPreference='secondaryPreferred', tz_aware=False)
+    return MongoSource(client[database][collection], **kwargs)
+
+class InMemoryCollection:
+    ''' stand-in for a pymongo collection holding a list of documents.
+    Understands the stages build_pipeline produces: $match with $gt, $gte, $lt, $lte, $in and $exists,
+    and inclusive $project. '''
+
+    _OPERATORS = {
+        '$gt': lambda value, operand: value is not None and value > operand,
+        '$gte': lambda value, operand: value is not None and value >= operand,
+        '$lt': lambda value, operand: value is not None and value < operand,
+        '$lte': lambda value, operand: value is not None and value <= operand,
+        '$in': lambda value, operand: value in operand,
+        }
+
+    def __init__(self, documents):
+        self.documents = list(documents)
+
+    def _matches(self, document, match):
+        for field, condition in match.items():
+            if not isinstance(condition, dict):
+                condition = {'$in': [condition]}
+            for operator, operand in condition.items():
+                if operator == '$exists':
+                    if (field in document) != bool(operand):
+                        return False
+                elif field not in document or not self._OPERATORS[operator](document[field], operand):
+                    return False
+        return True
+
+    def _project(self, document, projection):
+        return {k: v for k, v in document.items() if k == '_id' or projection.get(k)}
+
+    def aggregate(self, pipeline, **options):
+        documents = iter(self.documents)
+        for stage in pipeline:
+            (operator, argument), = stage.items()
+            if operator == '$match':
+                documents = filter(lambda d, match=argument: self._matches(d, match), documents)
+            elif operator == '$project':
+                documents = map(lambda d, projection=argument: self._project(d, projection), documents)
+            else:
+                raise ValueError('unsupported stage {}'.format(operator))
+        return documents
+
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
+
+if __name__ == '__main__':
+    _test()
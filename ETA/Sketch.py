@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+''' mergeable quantile sketches for task durations.
+
+QuantileSketch is a DDSketch-style sketch: values are counted in logarithmic buckets, so any quantile
+comes back within relative_accuracy of the true value (1% by default), using a few hundred buckets
+for everything between a second and a month. Two sketches with the same accuracy merge exactly
+by adding bucket counts, whatever order the data came in.
+Sketches serialize to plain json, so daily results can be saved and merged later
+instead of re-reading a month of task dumps.
+
+Groups of sketches are nested dicts {metric: {group: QuantileSketch}}, see DepWaitTaskTimes.quantile_sketches.
+
+>>> day_one, day_two = QuantileSketch(), QuantileSketch()
+>>> day_one.add_array(np.arange(1, 501))
+>>> for value in range(501, 1001):
+...     day_two.add(value)
+>>> month = QuantileSketch.from_dict(json.loads(json.dumps(day_one.to_dict())))
+>>> month.merge(day_two)
+>>> [round(month.quantile(q)) for q in (0, 0.5, 0.9, 0.99, 1)]  # within 1% of 1, 500, 900, 990, 1000
+[1, 498, 907, 983, 1000]
+>>> month.add(float('nan'))
+>>> month.add_array(np.array([np.nan]))
+>>> month.count, month.zero_count, round(month.mean(), 1)
+(1000, 0, 500.5)
+'''
+
+import json
+import math
+
+import numpy as np
+
+RELATIVE_ACCURACY = 0.01
+MAX_BUCKETS = 4096
+
+class QuantileSketch:
+    ''' quantile sketch with relative error guarantee, see module docstring.
+    Zero and negative values are kept too, negatives in a mirrored set of buckets.
+    If more than max_buckets buckets are needed, the lowest ones are collapsed together,
+    which only affects the accuracy of the smallest values.'''
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, max_buckets=MAX_BUCKETS):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('relative_accuracy must be between 0 and 1')
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _bucket(self, magnitude):
+        return math.ceil(math.log(magnitude) / self._log_gamma)
+
+    def _bucket_value(self, bucket):
+        return 2 * self.gamma ** bucket / (self.gamma + 1)
+
+    def add(self, value, weight=1):
+        ''' adds value weight times, NaN is skipped as in add_array '''
+        value = float(value)
+        if math.isnan(value):
+            return
+        if value > 0:
+            bucket = self._bucket(value)
+            self.positive[bucket] = self.positive.get(bucket, 0) + weight
+        elif value < 0:
+            bucket = self._bucket(-value)
+            self.negative[bucket] = self.negative.get(bucket, 0) + weight
+        else:
+            self.zero_count += weight
+        self.count += weight
+        self.total += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self._collapse()
+
+    def add_array(self, values):
+        ''' adds every value of a numpy array at once '''
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        for store, magnitudes in ((self.positive, values[values > 0]), (self.negative, -values[values < 0])):
+            if not len(magnitudes):
+                continue
+            buckets, counts = np.unique(np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64),
+                    return_counts=True)
+            for bucket, count in zip(buckets.tolist(), counts.tolist()):
+                store[bucket] = store.get(bucket, 0) + count
+        self.zero_count += int((values == 0).sum())
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._collapse()
+
+    def _collapse(self):
+        for store in (self.positive, self.negative):
+            if len(store) <= self.max_buckets:
+                continue
+            buckets = sorted(store)
+            keep = buckets[len(buckets) - self.max_buckets:]
+            folded = sum(store.pop(bucket) for bucket in buckets[:len(buckets) - self.max_buckets])
+            store[keep[0]] += folded
+
+    def merge(self, other):
+        ''' adds the counts of other into this sketch '''
+        if other.gamma != self.gamma:
+            raise ValueError('cannot merge sketches with different relative accuracy')
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for bucket, count in other_store.items():
+                store[bucket] = store.get(bucket, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._collapse()
+
+    def quantile(self, q):
+        ''' estimated q-quantile, q between 0 and 1. Raises ValueError on an empty sketch. '''
+        if not self.count:
+            raise ValueError('quantile of an empty sketch')
+        if not 0 <= q <= 1:
+            raise ValueError('q must be between 0 and 1')
+        rank = q * (self.count - 1)
+        seen = 0
+        for bucket in sorted(self.negative, reverse=True):
+            seen += self.negative[bucket]
+            if seen > rank:
+                return max(-self._bucket_value(bucket), self.min)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for bucket in sorted(self.positive):
+            seen += self.positive[bucket]
+            if seen > rank:
+                return min(self._bucket_value(bucket), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else math.nan
+
+    def to_dict(self):
+        ''' json-serializable form, see from_dict '''
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_buckets': self.max_buckets,
+            'positive': sorted(self.positive.items()),
+            'negative': sorted(self.negative.items()),
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'], data['max_buckets'])
+        sketch.positive = {int(bucket): count for bucket, count in data['positive']}
+        sketch.negative = {int(bucket): count for bucket, count in data['negative']}
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.total = data['total']
+        if sketch.count:
+            sketch.min = data['min']
+            sketch.max = data['max']
+        return sketch
+
+##
+# groups of sketches, {metric: {group: QuantileSketch}}
+
+def merge_groups(*groups):
+    ''' merges several {metric: {group: QuantileSketch}} dicts into a new one '''
+    merged = {}
+    for sketches in groups:
+        for metric, by_group in sketches.items():
+            merged_metric = merged.setdefault(metric, {})
+            for group, sketch in by_group.items():
+                if group not in merged_metric:
+                    merged_metric[group] = QuantileSketch(sketch.relative_accuracy, sketch.max_buckets)
+                merged_metric[group].merge(sketch)
+    return merged
+
+def save_groups(sketches, path):
+    with open(path, 'w') as f:
+        json.dump({metric: {str(group): sketch.to_dict() for group, sketch in by_group.items()}
+                   for metric, by_group in sketches.items()}, f)
+
+def load_groups(path):
+    with open(path) as f:
+        data = json.load(f)
+    return {metric: {group: QuantileSketch.from_dict(sketch) for group, sketch in by_group.items()}
+            for metric, by_group in data.items()}
+
+def load_merged(paths):
+    ''' loads and merges saved groups, e.g. a month of daily files '''
+    return merge_groups(*(load_groups(path) for path in paths))
+
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
+
+if __name__ == '__main__':
+    _test()
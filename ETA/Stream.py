@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+''' incremental reader for task dumps.
+
+Reads the printjson output of get_tasks.js directly, mongo shell wrappers included,
+and yields one task dict at a time. Only one read chunk of raw text plus the task being decoded
+is held in memory, so a dump never has to fit in memory as text and as parsed objects at once.
+
+Both a JSON array of objects and a plain sequence of concatenated objects are accepted.
+
+>>> import io
+>>> dump = io.StringIO("""[
+...     {
+...         "_id" : "compile",
+...         "finish_time" : ISODate("2020-08-05T11:51:19.168Z"),
+...         "priority" : NumberLong(0),
+...         "depends_on" : [ ]
+...     },
+...     {
+...         "_id" : "1",
+...         "finish_time" : ISODate("2020-08-05T11:51:20.936Z"),
+...         "priority" : NumberLong("50"),
+...         "depends_on" : [ { "_id" : "compile" } ]
+...     }
+... ]""")
+>>> for task in iter_tasks(dump, chunk_size=16):
+...     print(task)
+{'_id': 'compile', 'finish_time': '2020-08-05T11:51:19.168Z', 'priority': 0, 'depends_on': []}
+{'_id': '1', 'finish_time': '2020-08-05T11:51:20.936Z', 'priority': 50, 'depends_on': [{'_id': 'compile'}]}
+'''
+
+import json
+import re
+
+CHUNK_SIZE = 1 << 20
+
+# mongo shell wraps some values, e.g. ISODate("..."), NumberLong(3), NumberLong("12345678901")
+_SHELL_WRAPPER = re.compile(r'([:\[,]\s*)(ISODate|ObjectId|NumberLong|NumberInt|NumberDecimal)\(\s*([^()]*?)\s*\)')
+_NUMBER_WRAPPERS = ('NumberLong', 'NumberInt', 'NumberDecimal')
+_WHITESPACE = re.compile(r'[\s,]*')
+
+def _unwrap(match):
+    prefix, wrapper, value = match.groups()
+    if wrapper in _NUMBER_WRAPPERS:
+        value = value.strip('"')
+    return prefix + value
+
+def strip_shell_wrappers(text):
+    ''' replaces mongo shell value wrappers with plain JSON values
+
+    >>> strip_shell_wrappers('{"t" : ISODate("2020-08-05T11:51:19Z"), "n" : NumberLong("7")}')
+    '{"t" : "2020-08-05T11:51:19Z", "n" : 7}'
+    '''
+    return _SHELL_WRAPPER.sub(_unwrap, text)
+
+def iter_tasks(f, chunk_size=CHUNK_SIZE):
+    ''' generator of task dicts decoded from open text file f.
+    Raises ValueError if the input is not a JSON array or sequence of objects.'''
+    decoder = json.JSONDecoder()
+    pending = ''
+    tail = ''
+    eof = False
+    started = False
+    while True:
+        if not eof:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                cleaned, tail = tail, ''
+            else:
+                # wrappers never contain braces, so text up to the last brace can be cleaned safely
+                text = tail + chunk
+                cut = max(text.rfind('}'), text.rfind(']')) + 1
+                cleaned, tail = text[:cut], text[cut:]
+            pending += strip_shell_wrappers(cleaned)
+
+        idx = 0
+        if not started:
+            idx = _WHITESPACE.match(pending, idx).end()
+            if idx < len(pending):
+                if pending[idx] == '[':
+                    idx += 1
+                elif pending[idx] != '{':
+                    raise ValueError('expected a JSON array or objects, found {!r}'.format(pending[idx:idx+20]))
+                started = True
+        while started:
+            idx = _WHITESPACE.match(pending, idx).end()
+            if idx >= len(pending):
+                break
+            if pending[idx] == ']':
+                return
+            try:
+                task, idx = decoder.raw_decode(pending, idx)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # task is split across chunks, read more
+                break
+            yield task
+        if eof:
+            return
+        pending = pending[idx:]
+
+def iter_tasks_from_file(in_json, chunk_size=CHUNK_SIZE):
+    ''' opens in_json and yields its tasks one at a time '''
+    with open(in_json) as f:
+        yield from iter_tasks(f, chunk_size)
+
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
+
+if __name__ == '__main__':
+    _test()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+''' seeded generator of synthetic evergreen task dumps, for tests and benchmarks.
+
+Tasks come out in the shape get_tasks.js projects, one version at a time:
+each version is a DAG of layers (depth, fan_out) whose tasks depend on tasks in earlier layers,
+with a chain of generator tasks (each generated_by the previous one) that other tasks are generated by
+and depend on. Times follow the dependencies: a task starts some wait after it was scheduled and
+its dependencies finished. A fraction of tasks are display tasks or have unset (1970) dates,
+as in real dumps. The same seed always gives the same dump.
+
+write_dump writes plain JSON, or with shell=True the printjson output of the mongo shell,
+ISODate(...) and NumberLong(...) included.
+
+    python -m ETA.Synthetic out.json --tasks 100000 --shell
+    python -m ETA.Synthetic --test
+
+>>> tasks = list(generate_tasks(20, versions=2, seed=1, display_fraction=0, bad_date_fraction=0))
+>>> len(tasks), len({task['version'] for task in tasks})
+(20, 2)
+>>> sorted(tasks[0])
+['_id', 'create_time', 'depends_on', 'dispatch_time', 'distro', 'finish_time', 'priority', 'scheduled_time', 'start_time', 'task_group', 'version']
+>>> by_id = {task['_id']: task for task in tasks}
+>>> all(by_id[dep['_id']]['finish_time'] <= task['start_time'] for task in tasks for dep in task['depends_on'])
+True
+>>> import io
+>>> out = io.StringIO()
+>>> write_dump(out, tasks[:1], shell=True)
+>>> out.getvalue().startswith('[\\n\\t{\\n\\t\\t"_id" : "mms_generate_0_')
+True
+>>> '"create_time" : ISODate("2021-01-' in out.getvalue(), '"priority" : NumberLong(0)' in out.getvalue()
+(True, True)
+'''
+
+import argparse
+import datetime
+import json
+import math
+import random
+
+DISTROS = ('rhel62-small', 'rhel62-large', 'rhel76-small', 'windows-64-vs2019-large', 'macos-1014')
+VARIANTS = ('enterprise_rhel_62', 'enterprise_windows', 'linux_64', 'macos')
+TASK_GROUPS = ('', '', '', 'tg_compile', 'tg_integration')
+BEGIN = datetime.datetime(2021, 1, 14, 23, 30)
+UNSET_DATE = datetime.datetime(1970, 1, 1)
+TIME_FIELDS = ('create_time', 'dispatch_time', 'scheduled_time', 'start_time', 'finish_time')
+
+def _iso(time):
+    return time.isoformat(timespec='milliseconds') + 'Z'
+
+def generate_tasks(task_count=1000, versions=None, distros=DISTROS, depth=6, fan_out=3, generator_chain=2,
+        generated_fraction=0.1, display_fraction=0.01, bad_date_fraction=0.005, missing_dep_fraction=0.001,
+        seed=0, begin=BEGIN, span=datetime.timedelta(days=1)):
+    ''' generator of task_count synthetic task dicts, see module docstring.
+    versions defaults to one version per 200 tasks. Versions are created at random times in [begin, begin + span].
+    depth is the number of dependency layers per version, fan_out the most dependencies per task,
+    generator_chain the number of chained generator tasks per version.
+    The fractions are per task: generated by a generator task, display only, with unset dates,
+    or with a dependency on a task that is not in the dump.'''
+    rng = random.Random(seed)
+    if versions is None:
+        versions = max(1, task_count // 200)
+    distros = list(distros)
+    # per-distro mean wait in seconds, so some distros are visibly worse than others
+    mean_wait = {distro: rng.choice((30, 120, 600, 1800)) for distro in distros}
+    remaining = task_count
+    for v in range(versions):
+        size = remaining // (versions - v)
+        remaining -= size
+        revision = '{:040x}'.format(rng.getrandbits(160)) if v else '0' * 40
+        created = begin + datetime.timedelta(seconds=rng.uniform(0, span.total_seconds()))
+        yield from _version_tasks(rng, size, v, revision, created, distros, mean_wait, depth, fan_out,
+                generator_chain, generated_fraction, display_fraction, bad_date_fraction, missing_dep_fraction)
+
+def _version_tasks(rng, size, v, revision, created, distros, mean_wait, depth, fan_out,
+        generator_chain, generated_fraction, display_fraction, bad_date_fraction, missing_dep_fraction):
+    version = 'mms_{}'.format(revision)
+    suffix = '{}_{}'.format(revision, created.strftime('%y_%m_%d_%H_%M_%S'))
+    finishes = {}
+    layers = []
+    generators = []
+    for i in range(size):
+        if i < min(generator_chain, size):
+            name = 'generate_{}'.format(i)
+            layer = 0
+        else:
+            name = '{}_task_{}'.format(rng.choice(VARIANTS), i)
+            layer = 1 + (i * depth) // size if depth > 1 else 1
+        task_id = 'mms_{}_{}'.format(name, suffix)
+        depends_on = []
+        generated_by = None
+        if i < generator_chain and generators:
+            generated_by = generators[-1]
+            depends_on.append(generated_by)
+        elif i >= generator_chain and generators and rng.random() < generated_fraction:
+            generated_by = rng.choice(generators)
+            depends_on.append(generated_by)
+        earlier = [task for lower in layers[:layer] for task in lower[-50:]] if layer else []
+        for _ in range(rng.randint(0, fan_out) if earlier else 0):
+            dependency = rng.choice(earlier)
+            if dependency not in depends_on:
+                depends_on.append(dependency)
+
+        scheduled = created + datetime.timedelta(seconds=rng.uniform(0, 60))
+        ready = max([scheduled] + [finishes[dependency] for dependency in depends_on])
+        distro = rng.choice(distros)
+        start = ready + datetime.timedelta(seconds=rng.expovariate(1 / mean_wait[distro]))
+        finish = start + datetime.timedelta(seconds=math.exp(rng.gauss(6, 1)))
+        finishes[task_id] = finish
+        while len(layers) <= layer:
+            layers.append([])
+        layers[layer].append(task_id)
+        if i < generator_chain:
+            generators.append(task_id)
+
+        task = {
+            '_id': task_id,
+            'create_time': created,
+            'dispatch_time': start - datetime.timedelta(seconds=rng.uniform(0, 2)),
+            'scheduled_time': scheduled,
+            'start_time': start,
+            'finish_time': finish,
+            'priority': 0,
+            'distro': distro,
+            'depends_on': [{'_id': dependency, 'status': 'success', 'unattainable': False} for dependency in depends_on],
+            'version': version,
+            'task_group': rng.choice(TASK_GROUPS),
+            }
+        if rng.random() < missing_dep_fraction:
+            task['depends_on'].append({'_id': 'mms_missing_{}_{}'.format(i, suffix), 'status': 'success', 'unattainable': False})
+        if generated_by:
+            task['generated_by'] = generated_by
+        if rng.random() < display_fraction:
+            task['display_only'] = True
+        if rng.random() < bad_date_fraction:
+            # tasks that never ran keep the zero date
+            task['start_time'] = task['finish_time'] = task['dispatch_time'] = UNSET_DATE
+        for field in TIME_FIELDS:
+            task[field] = _iso(task[field])
+        yield task
+
+def write_dump(f, tasks, shell=False):
+    ''' writes tasks to open text file f as a JSON array, one task at a time.
+    With shell=True, times are wrapped in ISODate() and priorities in NumberLong(),
+    as in the printjson output of get_tasks.js.'''
+    f.write('[')
+    first = True
+    for task in tasks:
+        f.write('\n' if first else ',\n')
+        first = False
+        if not shell:
+            f.write(json.dumps(task))
+            continue
+        lines = []
+        for field, value in task.items():
+            if field in TIME_FIELDS:
+                text = 'ISODate({})'.format(json.dumps(value))
+            elif field == 'priority':
+                text = 'NumberLong({})'.format(value)
+            else:
+                text = json.dumps(value)
+            lines.append('\t\t{} : {}'.format(json.dumps(field), text))
+        f.write('\t{\n' + ',\n'.join(lines) + '\n\t}')
+    f.write('\n]\n')
+
+def main():
+    parser = argparse.ArgumentParser(description='write a synthetic evergreen task dump')
+    parser.add_argument('out', nargs='?')
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--versions', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shell', action='store_true', help='mongo shell printjson format')
+    parser.add_argument('--test', action='store_true', help='run the doctests instead')
+    args = parser.parse_args()
+    if args.test:
+        _test()
+        return
+    if not args.out:
+        parser.error('out is required')
+    with open(args.out, 'w') as f:
+        write_dump(f, generate_tasks(args.tasks, args.versions, seed=args.seed), shell=args.shell)
+
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,24 @@
 #!/usr/bin/env python3
 
 import datetime
-import json
 import logging
+import os
+import numpy as np
 import pandas as pd
 
+from ETA import Instrument
+from ETA.Columns import CategoricalColumn, TaskTableBuilder, TimeColumn
+from ETA.Cache import TableCache, default_cache_dir
+from ETA.Stream import iter_tasks_from_file
+
 def convert_ISO_to_datetime(time_str):
     '''convert standart ISO time in tasks DB to a datetime.datetime object'''
+    if len(time_str) in (20, 24) and time_str[10] == 'T' and time_str[-1] == 'Z':
+        # fast path for the two formats the tasks DB produces
+        try:
+            return datetime.datetime.fromisoformat(time_str[:-1])
+        except ValueError:
+            pass
     try:
         time_object = datetime.datetime.strptime(time_str,'%Y-%m-%dT%H:%M:%S.%fZ')
     except ValueError:
@@ -22,7 +34,8 @@ class TaskTimes:
     ---
     time_fields: list of strings denoting acceptable time fields that all tasks have
 
-    tasks: {_task_id:task_dict}
+    tasks: ETA.Columns.TaskTable, a column-oriented {_task_id:task_dict} mapping.
+        Looking up a task returns a dict-like view backed by the columns.
 
     screen_by: modifier for the central tasks iterator. Default is none, should be set to a dict.
         TaskTime.get_tasks()  will screen out all tasks without the fields in screen_by.keys().
@@ -31,7 +44,7 @@ class TaskTimes:
 
     Methods
     ---
-    ingest_json: loads json from given filename, returns {_task_id:task_dict}
+    ingest_json: loads json from given filename or task source, returns TaskTable of {_task_id:task_dict}
 
     dataframe: returns pandas dataframe with one task per row and task attributes as columns
 
@@ -63,8 +76,10 @@ class TaskTimes:
     ...     print('{}: {}'.format(b, [x['_id'] for x in bins[b].values()]))
     rhel62-small: ['1']
     '''
+    # part of the cache key, bump it whenever derive_fields changes what it adds
+    DERIVE_VERSION = 0
 
-    def __init__(self, in_json, time_fields):
+    def __init__(self, in_json, time_fields, cache_dir=None):
         '''
         TaskTimes is a container for task information, with special handling for datetimes.
 
@@ -73,60 +88,108 @@ class TaskTimes:
         in_json:
             j = './rhel62_08-05-2020.json'
 
-            Path to a valid json file to be ingested
+            Path to a json file to be ingested, either plain JSON
+            or the printjson output of get_tasks.js.
+            May also be a task source, any object with an iter_tasks() method
+            yielding task dicts, e.g. ETA.Mongo.MongoSource, or a task_table(time_fields) method,
+            e.g. ETA.Dataset.PartitionedDataset. Sources are not cached.
 
         time_fields:
             Contains the fields to be converted from string to datetime during ingestion
             TODO: include some kind of schema validation for fields like 'depends_on'
             https://www.peterbe.com/plog/jsonschema-validate-10x-faster-in-python
+        cache_dir:
+            Directory for the parsed-table cache, see ETA.Cache.
+            Defaults to ETA_CACHE_DIR or ./.eta_cache. False turns caching off.
+            The cache holds the ingested tasks along with any fields added by derive_fields,
+            and is keyed on the class and its DERIVE_VERSION.
+
         screen_by: modifier for the central tasks iterator.
+            A task source built with a screen_by of its own, e.g. ETA.Mongo.MongoSource, hands it on,
+            otherwise it starts out as None.
 
         '''
         self.time_fields = time_fields
-        self.tasks = self.ingest_json(in_json)
-        self.screen_by = None
+        source_screen = getattr(in_json, 'screen_by', None)
+        self.screen_by = dict(source_screen) if source_screen else None
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        cache = None
+        if cache_dir and isinstance(in_json, (str, os.PathLike)):
+            # not __module__, which is __main__ when e.g. metrics.py is run as a script
+            kind = '{}:{}'.format(type(self).__qualname__, self.DERIVE_VERSION)
+            cache = TableCache(in_json, time_fields, kind, cache_dir)
+        self.tasks = None
+        if cache:
+            with Instrument.stage('cache_load'):
+                self.tasks = cache.load()
+        if self.tasks is None:
+            with Instrument.stage('ingest'):
+                self.tasks = self.ingest_json(in_json)
+            with Instrument.stage('derive'):
+                self.derive_fields()
+            if cache:
+                with Instrument.stage('cache_save'):
+                    cache.save(self.tasks)
 
-    def ingest_json(self,in_json):
+    def derive_fields(self):
+        ''' hook for subclasses to add calculated fields to self.tasks after ingestion.
+        Whatever it adds is cached along with the ingested tasks.'''
+        pass
 
-        with open(in_json) as f:
-            j = json.load(f)
+    def ingest_json(self,in_json):
+        ''' streams tasks from in_json, which may be plain JSON or the raw printjson output
+        of get_tasks.js (ISODate(...) and NumberLong(...) wrappers included),
+        or a task source with an iter_tasks() method.
+        Each task is validated and converted as it is read.
+        A source may instead provide task_table(time_fields), returning an already built TaskTable
+        without display tasks, e.g. ETA.Dataset.PartitionedDataset.'''
 
-        tasks = {}
-        for item in j:
-            _id = item['_id']
-            tasks[_id] = item
-        bad_time_ids=[]
         # remove display tasks from dependency graph
         display_task_ids = []
-        for _id in tasks:
-            if 'display_only' in tasks[_id] and tasks[_id]['display_only']:
-                display_task_ids.append(_id)
-                continue
-            for field in self.time_fields:
-                field_string = tasks[_id][field]
-                field_ISO = convert_ISO_to_datetime(field_string)
-                if field_ISO < BEGINNING_OF_TIME :
-                    # bad date, remove
-                    bad_time_ids.append(_id)
-                    break
-                tasks[_id][field] = field_ISO
+        if hasattr(in_json, 'task_table'):
+            tasks = in_json.task_table(self.time_fields)
+            task_count = len(tasks)
+        else:
+            builder = TaskTableBuilder(self.time_fields)
+            task_count = 0
+            if hasattr(in_json, 'iter_tasks'):
+                items = in_json.iter_tasks()
+            else:
+                items = iter_tasks_from_file(in_json)
+            for item in items:
+                task_count += 1
+                if 'display_only' in item and item['display_only']:
+                    display_task_ids.append(item['_id'])
+                    continue
+                builder.add(item)
+            tasks = builder.build()
+
+        bad_time = np.zeros(len(tasks), dtype=bool)
+        for field in self.time_fields:
+            if not tasks.present(field).all():
+                raise KeyError(field)
+            # bad date, remove
+            bad_time |= tasks.columns[field].values < np.datetime64(BEGINNING_OF_TIME)
+        bad_time_ids = [tasks.ids[i] for i in np.flatnonzero(bad_time)]
         if bad_time_ids:
             logging.debug("bad date, removing:")
-        logging.warning('{}/{} tasks had bad datetime values'.format(len(bad_time_ids),len(tasks)))
+        logging.warning('{}/{} tasks had bad datetime values'.format(len(bad_time_ids),task_count))
+        Instrument.count('tasks_read', task_count)
+        Instrument.count('display_tasks_dropped', len(display_task_ids))
+        Instrument.count('bad_date_tasks_dropped', len(bad_time_ids))
         bad_ids = bad_time_ids + display_task_ids
         logging.debug(bad_ids)
-        for _id in bad_ids:
-            del tasks[_id]
 
-        return tasks
+        return tasks.subset(np.flatnonzero(~bad_time))
 
     def dataframe(self, task_generator=None):
         ''' this enables the return of the self.tasks dict in the form of a pandas
         dataframe at any point in analysis, after tasks has been modified
         '''
         if not task_generator:
-            task_generator = self.get_tasks()
-        screened_tasks = list(task_generator)
+            return self.tasks.dataframe(self.tasks.select(self.screen_by))
+        screened_tasks = [dict(task) for task in task_generator]
         return pd.DataFrame(screened_tasks)
 
     def get_tasks(self, adhoc_screen=None, mode='polite_merge'):
@@ -142,56 +205,80 @@ class TaskTimes:
         'merge': adhoc_screen is added to default screen_by.
             For colliding keys, adhoc_screen takes precedence.
         '''
+        with Instrument.stage('get_tasks'):
+            screen = self._resolve_screen(adhoc_screen, mode)
+            if not self.tasks:
+                logging.error('tasks list is empty, check input json')
+            rows = self.tasks.select(screen)
+        for row in rows:
+            yield self.tasks.row(int(row))
+        if not len(rows):
+            logging.warning('Returned no task values for screen')
+            logging.warning(screen)
+            logging.warning('sample task')
+            if self.tasks:
+                logging.warning(self.tasks.row(len(self.tasks) - 1))
+
+    def _resolve_screen(self, adhoc_screen, mode):
+        ''' combines adhoc_screen with self.screen_by according to mode, see get_tasks '''
         if mode == 'polite_merge':
             if adhoc_screen and self.screen_by:
-                screen = { **adhoc_screen, **self.screen_by }
+                return { **adhoc_screen, **self.screen_by }
             elif adhoc_screen:
-                screen = adhoc_screen
+                return adhoc_screen
             else:
-                screen = self.screen_by
+                return self.screen_by
         elif mode == 'merge':
             if adhoc_screen and self.screen_by:
-                screen = { **self.screen_by, **adhoc_screen}
+                return { **self.screen_by, **adhoc_screen}
             elif adhoc_screen:
-                screen = adhoc_screen
+                return adhoc_screen
             else:
-                screen = self.screen_by
+                return self.screen_by
         elif mode == 'substitute':
             if adhoc_screen:
-                screen = adhoc_screen
+                return adhoc_screen
             else:
-                screen = self.screen_by
-        else:
-            raise ValueError('unknown mode {}, allowed values are "merge", "polite_merge", "substitute"'.format(mode))
-        returned_none = True
-        if not self.tasks:
-            logging.error('tasks list is empty, check input json')
-        for _id in self.tasks:
-            task = self.tasks[_id]
-            invalid_field = False
-            if screen:
-                for field in screen:
-                    if field not in task:
-                        invalid_field = True
-                        break
-                    elif screen[field]:
-                        if task[field] not in screen[field]:
-                            invalid_field = True
-                            break
-            if not invalid_field:
-                if returned_none:
-                    returned_none = False
-                yield task
-        if returned_none:
-            logging.warning('Returned no task values for screen')
-            logging.warning(screen)
-            logging.warning('sample task')
-            logging.warning(task)
+                return self.screen_by
+        raise ValueError('unknown mode {}, allowed values are "merge", "polite_merge", "substitute"'.format(mode))
+
+    def interval_durations(self, start_key, end_key, adhoc_screen=None, mode='polite_merge'):
+        ''' end_key - start_key for every screened task that has both, computed on whole columns.
+        Returns (rows, durations): row numbers into self.tasks and a timedelta64[ms] array.
+        adhoc_screen and mode work as in get_tasks.'''
+        screen = self._resolve_screen(adhoc_screen, mode)
+        rows = self.tasks.select({**(screen or {}), start_key: [], end_key: []})
+        columns = []
+        for key in (start_key, end_key):
+            column = self.tasks.columns[key]
+            if isinstance(column, TimeColumn):
+                columns.append(column.values[rows])
+            else:
+                columns.append(np.array([column.get(row) for row in rows.tolist()], dtype='datetime64[ms]'))
+        return rows, columns[1] - columns[0]
+
+    def partition_rows(self, field, adhoc_screen=None, mode='polite_merge'):
+        ''' groups the rows of screened tasks by the value of a categorical field in one pass.
+        Returns {value: array of row numbers into self.tasks}, values in order of first appearance.
+        adhoc_screen and mode work as in get_tasks.'''
+        rows = self.tasks.select(self._resolve_screen(adhoc_screen, mode))
+        if not self.tasks.present(field)[rows].all():
+            # same failure as looking up the field on a task that lacks it
+            raise KeyError(field)
+        column = self.tasks.columns[field]
+        codes = column.codes[rows]
+        order = np.argsort(codes, kind='stable')
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        groups = np.split(rows[order], boundaries) if len(rows) else []
+        groups.sort(key=lambda group: group[0])
+        return {column.categories[column.codes[group[0]]]: group for group in groups}
 
     def bin_tasks_by_field(self, field, values=None, task_generator=None):
         ''' instead of simply filtering tasks using a built in screen_by,
         returns tasks binned by allowed values of a given field.'''
         if not task_generator:
+            if isinstance(self.tasks.columns.get(field), CategoricalColumn):
+                return self._bin_columns_by_field(field, values)
             task_generator = self.get_tasks()
         tasks = {}
         if values:
@@ -207,6 +294,17 @@ class TaskTimes:
                     tasks[task[field]] = {task['_id']:task}
         return tasks
 
+    def _bin_columns_by_field(self, field, values=None):
+        ''' bin_tasks_by_field over the screened table, reading a categorical field straight from its column '''
+        tasks = {}
+        if values:
+            tasks = {x:{} for x in values}
+        for value, rows in self.partition_rows(field).items():
+            if values and value not in values:
+                continue
+            tasks[value] = {self.tasks.ids[row]:self.tasks.row(row) for row in rows.tolist()}
+        return tasks
+
 def _test():
     import doctest
     count, _ = doctest.testmod()
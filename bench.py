@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+'''
+times each stage of the analysis pipeline on synthetic dumps (see ETA.Synthetic) of growing size,
+so that scaling regressions show up between commits.
+
+For every size, a seeded dump is generated once into --data-dir and reused by later runs.
+Benchmark dumps have no display tasks, unset dates or missing dependencies, so that every version
+has a complete dependency closure and the slowdown stages analyze all of them.
+The stages then run in order on it, each timed with time.perf_counter and, unless --no-memory,
+with its peak traced allocation (tracemalloc, which also slows every stage down by a similar factor):
+    ingest               parse the dump into a TaskTable, cache off
+    derive               begin_wait, unblocked_time and latency for every task
+    get_tasks            iterate over all tasks, then over one distro
+    depgraph             DepGraph over every task at once
+    version_slowdown     DepGraph.display_version_slowdown on the largest version
+    slowdown_by_version  critical paths of every version, in this process
+    chunks               ChunkTimes over the whole dump, fencepost indices and active counts
+Results go to --out (default bench_results/<commit>.json), keyed by size and stage,
+along with what each stage covered, e.g. the number of versions analyzed.
+Pass an earlier results file to --compare to print the ratio of every timing to it.
+
+    ./bench.py --sizes 1000 100000
+    ./bench.py --compare bench_results/3ad3c09.json
+'''
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import ETA
+import ETA.Chunks
+import ETA.Synthetic
+import metrics
+
+SIZES = [1000, 100000, 1000000]
+TIME_FIELDS = [
+        'create_time',
+        'scheduled_time',
+        'start_time',
+        'finish_time',
+        ]
+DATA_DIR = os.path.join(tempfile.gettempdir(), 'eta_bench')
+OUT_DIR = './bench_results'
+# options for ETA.Synthetic.generate_tasks, see module docstring
+DUMP_OPTIONS = {'display_fraction': 0, 'bad_date_fraction': 0, 'missing_dep_fraction': 0}
+
+class _Underived(metrics.DepWaitTaskTimes):
+    ''' DepWaitTaskTimes that skips derive_fields, so ingest and derive are timed apart '''
+
+    def derive_fields(self):
+        pass
+
+def dump_path(data_dir, size, seed, shell=False):
+    ''' the synthetic dump for size and seed, generated on first use '''
+    path = os.path.join(data_dir, 'synthetic_complete_{}_{}{}.json'.format(size, seed, '_shell' if shell else ''))
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        logging.info('generating {}'.format(path))
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            ETA.Synthetic.write_dump(f, ETA.Synthetic.generate_tasks(size, seed=seed, **DUMP_OPTIONS), shell=shell)
+        os.replace(tmp_path, path)
+    return path
+
+##
+# stages, each takes the state dict shared by the stages of one size
+# and may return a dict of what it covered, stored with its timing
+
+def _ingest(state):
+    state['task_data'] = _Underived(state['path'], TIME_FIELDS, cache_dir=False)
+
+def _derive(state):
+    state['task_data'].update_unblocked_times()
+
+def _get_tasks(state):
+    task_data = state['task_data']
+    count = sum(1 for _ in task_data.get_tasks())
+    distro = task_data.tasks.get_value(0, 'distro')
+    count += sum(1 for _ in task_data.get_tasks({'distro': [distro]}))
+    return {'tasks': count}
+
+def _depgraph(state):
+    tasks = state['task_data'].tasks
+    metrics.DepGraph({task_id: tasks[task_id] for task_id in tasks.ids})
+
+def _version_slowdown(state):
+    task_data = state['task_data']
+    partitions = task_data.partition_rows('version', {'scheduled_time':[],'start_time':[],'finish_time':[]})
+    # the largest version every task of which got a begin_wait, the others cannot be analyzed
+    for rows in sorted(partitions.values(), key=len, reverse=True):
+        version_tasks = {task_data.tasks.ids[row]: dict(task_data.tasks.row(row)) for row in rows.tolist()}
+        if all('begin_wait' in task for task in version_tasks.values()):
+            break
+    with contextlib.redirect_stdout(io.StringIO()):
+        metrics.DepGraph.display_version_slowdown(version_tasks)
+    return {'tasks': len(version_tasks)}
+
+def _slowdown_by_version(state):
+    task_data = state['task_data']
+    # versions with missing dependencies or unset dates are skipped, with a warning each
+    logging.disable(logging.WARNING)
+    try:
+        analyzed = len(task_data.slowdown_by_version(min_tasks=1, processes=1))
+    finally:
+        logging.disable(logging.NOTSET)
+    return {'versions_analyzed': analyzed, 'versions': len(task_data.tasks.columns['version'].categories)}
+
+def _chunks(state):
+    columns = state['task_data'].tasks.columns
+    starts, finishes = columns['start_time'].values, columns['finish_time'].values
+    ran = ~np.isnat(starts) & ~np.isnat(finishes) & (starts.astype('datetime64[Y]') > np.datetime64('2000', 'Y'))
+    starts, finishes = starts[ran], finishes[ran]
+    chunk_times = ETA.Chunks.ChunkTimes(starts.min().astype(datetime.datetime), finishes.max().astype(datetime.datetime))
+    chunk_times.fencepost_indices(finishes, out_of_bounds='drop')
+    return {'max_active': int(chunk_times.count_active(starts, finishes).max())}
+
+STAGES = {
+    'ingest': _ingest,
+    'derive': _derive,
+    'get_tasks': _get_tasks,
+    'depgraph': _depgraph,
+    'version_slowdown': _version_slowdown,
+    'slowdown_by_version': _slowdown_by_version,
+    'chunks': _chunks,
+    }
+
+def run_stage(stage, state, memory=True):
+    ''' runs one stage, returns {'seconds': ..., 'peak_mb': ...} and whatever the stage returned '''
+    if memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        covered = STAGES[stage](state)
+        seconds = time.perf_counter() - started
+        result = {'seconds': round(seconds, 4)}
+        if memory:
+            result['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+    finally:
+        if memory:
+            tracemalloc.stop()
+    result.update(covered or {})
+    return result
+
+def run(sizes=SIZES, stages=list(STAGES), seed=0, data_dir=DATA_DIR, memory=True, shell=False):
+    ''' runs stages on a dump of each size, returns {size: {stage: result}}.
+    The other stages need the derived fields, so ingest and derive always run.'''
+    results = {}
+    for size in sizes:
+        state = {'path': dump_path(data_dir, size, seed, shell)}
+        results[str(size)] = {}
+        for stage in STAGES:
+            if stage not in ('ingest', 'derive') and stage not in stages:
+                continue
+            result = run_stage(stage, state, memory)
+            results[str(size)][stage] = result
+            logging.info('{} tasks, {}: {}'.format(size, stage, result))
+    return results
+
+def _git(*args):
+    try:
+        return subprocess.run(('git',) + args, capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    ''' prints new/old time ratios for every size and stage found in both result dicts '''
+    print('{:>9} {:<20} {:>10} {:>10} {:>7}'.format('tasks', 'stage', 'old s', 'new s', 'ratio'))
+    for size, stages in results['results'].items():
+        for stage, result in stages.items():
+            old = baseline['results'].get(size, {}).get(stage)
+            if not old:
+                continue
+            print('{:>9} {:<20} {:>10.3f} {:>10.3f} {:>7.2f}'.format(
+                size, stage, old['seconds'], result['seconds'], result['seconds'] / max(old['seconds'], 1e-9)))
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES)
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=DATA_DIR, help='where generated dumps are kept')
+    parser.add_argument('--shell', action='store_true', help='benchmark mongo shell printjson dumps')
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc, for cleaner timings')
+    parser.add_argument('--out', help='results file, default {}/<commit>.json'.format(OUT_DIR))
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    commit = _git('rev-parse', '--short', 'HEAD')
+    results = {
+        'commit': commit,
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'seed': args.seed,
+        'shell': args.shell,
+        'memory_traced': not args.no_memory,
+        'results': run(args.sizes, args.stages, args.seed, args.data_dir, not args.no_memory, args.shell),
+        }
+    out = args.out or os.path.join(OUT_DIR, '{}.json'.format(commit or 'unknown'))
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    logging.info('results written to {}'.format(out))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
@@ -15,17 +15,6 @@ function run_aggregation {
 	ssh $db_host rm $js_file $scp_file
 }
 
-function clean_results {
-	in_file=$1
-	out_file=$2
-	# convert the JSON into something more easily read by python
-	sed 's/ISODate(//g' $in_file > munged.json
-	sed 's/)//g' munged.json > munged2.json
-	sed 's/NumberLong(//g' munged2.json > $out_file
-	# clean up
-	rm munged.json munged2.json
-}
-
 # make sure db_host is not a primary!
 DB_HOST=evergreendb-1.10gen-mci.4085.mongodbdns.com
 # should be as relative as possible to ease remote execution
@@ -35,6 +24,7 @@ SCP_FILE='/tmp/result.json'
 OUT_FILE=rhel76_taskGroup.json
 
 run_aggregation "$DB_HOST" "$JS_FILE" "$SCP_FILE"
-clean_results $(basename "$SCP_FILE") "$OUT_FILE"
+# ETA.TaskTimes reads the mongo shell output (ISODate/NumberLong wrappers included) directly
+mv $(basename "$SCP_FILE") "$OUT_FILE"
 
-echo "munged results at "$OUT_FILE""
+echo "results at "$OUT_FILE""
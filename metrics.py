@@ -6,27 +6,42 @@ Contains some basic methods for visualizing dependency graphs and so on, useful
 Contains methods for displaying these statistics in simple, text-only format.
 For more visually pleasing figures, see plots.py.
 '''
+import concurrent.futures
 import datetime
 import logging
+import os
 import igraph
 
 import numpy as np
+import pandas as pd
 
 import ETA
+import ETA.Instrument
+import ETA.Sketch
+from ETA import DAG
 
 logging.basicConfig(level=logging.INFO)
 IN_JSON = 'cruisin.json'
+# (start, end) of the intervals summarized by DepWaitTaskTimes.quantile_sketches
+WAIT_INTERVALS = {
+    'corrected_wait': ('begin_wait', 'start_time'),
+    'raw_wait': ('scheduled_time', 'start_time'),
+    'turnaround': ('scheduled_time', 'finish_time'),
+    }
 
 class DepWaitTaskTimes(ETA.TaskTimes):
     '''
     DepWaitTaskTimes extends ETA.TaskTimes.
     It adds dependency-aware wait time analysis that calculates new fields.
     '''
+    # see ETA.TaskTimes.DERIVE_VERSION
+    DERIVE_VERSION = 1
 
-    def __init__(self, in_json, time_fields):
+    def __init__(self, in_json, time_fields, cache_dir=None):
         '''
         DepWaitTaskTimes extends ETA.TaskTimes. It adds distro-filtering functionality,
         along with advanced dependency-crawling functionality.
+        begin_wait, unblocked_time and latency are calculated once and cached with the tasks.
         '''
         # due to the added functionality,
         # this class requires a lot of different time fields.
@@ -42,44 +57,67 @@ class DepWaitTaskTimes(ETA.TaskTimes):
         if required_fields_missing:
             raise ValueError("required fields missing: {}".format(required_fields_missing))
 
-        super().__init__(in_json,time_fields)
+        super().__init__(in_json,time_fields,cache_dir)
 
-        for task in self.get_tasks():
-            # calculate begin_wait and update task with field
-            self.update_task_unblocked_time(task)
+    def derive_fields(self):
+        ''' adds begin_wait, unblocked_time and latency to every task '''
+        self.update_unblocked_times()
 
     ##
     # calculate additional fields and return value
 
     def calculate_task_perfect_world_latency(self, task):
-        ''' takes in a task and recursively determines the time to finish this task
+        ''' takes in a task and determines the time to finish this task
         assuming the world is perfect, i.e., that every dependency task runs immediately
         and with infinitely scalable concurrent operation. It assumes task runtime will
         be the same, which may or may not be accurate.
         This has side effects on self.tasks,
-        namely it will add 'perfect_world_latency' field to tasks.
+        namely it will add 'perfect_world_latency' field to tasks
+        (for every task at once, see calculate_perfect_world_latencies).
         '''
         sentinel = datetime.timedelta(-1)
         if task == 'missingDep':
             return sentinel
-        if 'perfect_world_latency' in task:
-            return task['perfect_world_latency']
-        else:
-            #calculate it
-            dependency_ids = [x['_id'] for x in task['depends_on']]
-            dependency_times = [self.calculate_task_perfect_world_latency(self.tasks.get(tid,'missingDep')) for tid in dependency_ids]
-            run_time = task['finish_time'] - task['start_time']
-            if dependency_times:
-                time_so_far = max(dependency_times)
-                if time_so_far == sentinel :
-                    #sentinel value, dep was missing
-                    task['perfect_world_latency'] = sentinel
-                    return sentinel
-            else:
-                time_so_far = datetime.timedelta(0)
-            total_time = time_so_far + run_time
-            task['perfect_world_latency'] = total_time
-            return total_time
+        if 'perfect_world_latency' not in task:
+            self.calculate_perfect_world_latencies()
+            if 'perfect_world_latency' not in task:
+                # task is a copy, not a view into self.tasks
+                task['perfect_world_latency'] = self.tasks[task['_id']]['perfect_world_latency']
+        return task['perfect_world_latency']
+
+    @ETA.Instrument.timed('perfect_world_latencies')
+    def calculate_perfect_world_latencies(self):
+        ''' calculates 'perfect_world_latency' for every task in self.tasks in one sweep
+        over the dependency graph, dependencies before dependents, without recursion.
+        A task's perfect world latency is its runtime plus the largest perfect world latency
+        of its dependencies. A missing dependency counts as the sentinel timedelta(-1),
+        and a task whose dependencies all come out as the sentinel gets the sentinel itself
+        (counted as missing_dep_sentinels when instrumented).
+        Raises ValueError if depends_on has a cycle.
+        '''
+        sentinel = np.timedelta64(-1, 'D').astype('timedelta64[ms]').astype(np.int64)
+        size = len(self.tasks)
+        run_time = (self.tasks.columns['finish_time'].values
+                    - self.tasks.columns['start_time'].values).astype(np.int64)
+        dependents, dependencies = self.tasks.dependency_edges()
+        has_dependencies = np.bincount(dependents, minlength=size) > 0
+        # largest dependency latency seen so far, missing dependencies count as the sentinel
+        dependency_max = np.full(size, np.iinfo(np.int64).min)
+        missing = dependencies < 0
+        ETA.Instrument.count('missing_dependency_edges', missing.sum())
+        np.maximum.at(dependency_max, dependents[missing], sentinel)
+        known_dependents, known_dependencies = dependents[~missing], dependencies[~missing]
+
+        latency = np.zeros(size, dtype=np.int64)
+        def relax(level, edges):
+            np.maximum.at(dependency_max, known_dependents[edges], latency[known_dependencies[edges]])
+
+        # edges point from dependency to dependent, so dependencies come out first
+        for level in DAG.topological_levels(size, known_dependencies, known_dependents, relax):
+            latency[level] = np.where(~has_dependencies[level], run_time[level],
+                    np.where(dependency_max[level] == sentinel, sentinel, dependency_max[level] + run_time[level]))
+        ETA.Instrument.count('missing_dep_sentinels', (latency == sentinel).sum())
+        self.tasks.set_column('perfect_world_latency', ETA.Columns.DeltaColumn(latency.astype('timedelta64[ms]')))
 
     ##
     # calculate additional fields to add to tasks and update value in task
@@ -94,6 +132,7 @@ class DepWaitTaskTimes(ETA.TaskTimes):
         # only add field if it is coherent to do so
         if task['start_time'] < task['scheduled_time'] :
             logging.debug('bad time for {}'.format(task))
+            ETA.Instrument.count('bad_time_tasks')
             return False
         if depends_on:
             # we only care about finish times after this job has been scheduled
@@ -106,6 +145,7 @@ class DepWaitTaskTimes(ETA.TaskTimes):
                 else:
                     # incomplete information
                     logging.debug('incomplete info')
+                    ETA.Instrument.count('incomplete_info_tasks')
                     return False
                 if finish_time and latest_finish < finish_time and finish_time < task['start_time']:
                     latest_finish = finish_time
@@ -120,6 +160,46 @@ class DepWaitTaskTimes(ETA.TaskTimes):
         task['latency'] = task['finish_time'] - task['begin_wait']
         return False
 
+    @ETA.Instrument.timed('unblocked_times')
+    def update_unblocked_times(self):
+        ''' update_task_unblocked_time for every task in self.tasks at once,
+        as a grouped max over the dependency edge arrays.
+        The same coherence rules apply: only dependencies finishing after scheduled_time
+        and before start_time count, tasks that start before they are scheduled get no fields,
+        and neither do tasks with a dependency missing from self.tasks (incomplete info).
+        '''
+        columns = self.tasks.columns
+        scheduled = columns['scheduled_time'].values.astype(np.int64)
+        start = columns['start_time'].values.astype(np.int64)
+        finish = columns['finish_time'].values.astype(np.int64)
+        dependents, dependencies = self.tasks.dependency_edges()
+
+        incomplete = np.zeros(len(self.tasks), dtype=bool)
+        incomplete[dependents[dependencies < 0]] = True
+        known = dependencies >= 0
+        dependents, dependency_finish = dependents[known], finish[dependencies[known]]
+        # we only care about finish times after this job has been scheduled
+        counts = (scheduled[dependents] < dependency_finish) & (dependency_finish < start[dependents])
+        latest_finish = scheduled.copy()
+        np.maximum.at(latest_finish, dependents[counts], dependency_finish[counts])
+
+        # only add fields if it is coherent to do so
+        bad_time = start < scheduled
+        coherent = ~bad_time & ~incomplete
+        unblocked = coherent & (latest_finish != scheduled)
+        logging.debug('{} tasks with bad time, {} with incomplete info'.format(
+            bad_time.sum(), (incomplete & ~bad_time).sum()))
+        ETA.Instrument.count('bad_time_tasks', bad_time.sum())
+        ETA.Instrument.count('incomplete_info_tasks', (incomplete & ~bad_time).sum())
+
+        not_a_time = np.iinfo(np.int64).min
+        begin_wait = np.where(coherent, latest_finish, not_a_time)
+        latency = np.where(coherent, finish - latest_finish, not_a_time)
+        self.tasks.set_column('unblocked_time', ETA.Columns.TimeColumn(
+            np.where(unblocked, latest_finish, not_a_time).astype('datetime64[ms]')))
+        self.tasks.set_column('begin_wait', ETA.Columns.TimeColumn(begin_wait.astype('datetime64[ms]')))
+        self.tasks.set_column('latency', ETA.Columns.DeltaColumn(latency.astype('timedelta64[ms]')))
+
     @staticmethod
     def update_task_latency_slowdown(task):
         ''' adds 'latency_slowdown' field to task '''
@@ -187,52 +267,63 @@ class DepWaitTaskTimes(ETA.TaskTimes):
             if field in worst_wait_ids:
                 print('{} {} {}'.format(worst_waits[field],field, worst_wait_ids[field]))
 
-    def display_slowdown_by_version(self, versions=None):
+    def slowdown_by_version(self, versions=None, distros=None, min_tasks=100, processes=None):
         ''' compile a list of complete versions matching some criteria,
-        upon which version slowdown can be calculated. Calculate and display slowdown,
-        by version, in ascending order (better to worse)'''
-
-        #TODO: make is easier to screen out versions containing distros we don't want.
-        # currently, this gets most of them but not all.
-        #(this will probably remove a dependency but might not)
-
-        allowed_distros = []
-        for distro in self.bin_tasks_by_field('distro'):
-            #if 'power8' not in distro and 'zseries' not in distro and 'macos' not in distro and 'windows' not in distro and 'archlinux' not in distro:
-            if True: 
-                if distro not in allowed_distros:
-                    allowed_distros.append(distro)
-
-        generator = self.get_tasks({'scheduled_time':[],'start_time':[],'finish_time':[],})
-
-        tasks_by_version = self.bin_tasks_by_field('version', values=versions, task_generator=generator)
-        slowdowns_by_version = {}
-        for version in tasks_by_version:
-            version_tasks = tasks_by_version[version]
-            skip_version = False
-            for _id in version_tasks:
-                distro = version_tasks[_id]['distro']
-                if distro not in allowed_distros:
-                    skip_version = True
-                    break
-            if skip_version:
-                continue
-
-            # set according to particular question you want to answer
-            if len(version_tasks) < 100:
+        upon which version slowdown can be calculated, and calculate it for all of them.
+        Tasks are partitioned by version once, and versions are processed on a pool of
+        processes (os.cpu_count() by default, processes=1 runs in this process).
+
+        versions: only consider these versions (default all, so an empty list gives an empty report)
+        distros: skip versions with a task on any other distro (default all distros allowed)
+        min_tasks: skip versions with fewer tasks, set according to the question you want to answer
+
+        Returns a pandas dataframe with one row per version, in ascending order of slowdown
+        (better to worse), with columns
+        version, real_latency, idealized_latency (seconds), slowdown, task_count
+        and worst_waits, a {distro: (wait, task_id)} dict of the longest unblocked wait per distro.
+        '''
+        screen = {'scheduled_time':[],'start_time':[],'finish_time':[],}
+        partitions = {}
+        if versions is None:
+            partitions = self.partition_rows('version', screen)
+        elif len(versions):
+            screen['version'] = list(versions)
+            partitions = self.partition_rows('version', screen)
+        jobs = []
+        for version, rows in partitions.items():
+            if len(rows) < min_tasks:
                 continue
-            try:
-                slowdown, _ = DepGraph.display_version_slowdown(version_tasks)
-                slowdowns_by_version[version] = slowdown
-            except ValueError as e:
-                print(e)
+            version_tasks = {self.tasks.ids[row]: dict(self.tasks.row(row)) for row in rows.tolist()}
+            if distros and any(task['distro'] not in distros for task in version_tasks.values()):
                 continue
-        sorted_slowdowns_by_version  = dict(sorted(slowdowns_by_version.items(), key=lambda item: item[1]))
-        for version in sorted_slowdowns_by_version:
+            jobs.append((version, version_tasks, ETA.Instrument.enabled()))
+
+        if processes == 1:
+            results = map(_version_slowdown_report, jobs)
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(processes or os.cpu_count())
+            with executor:
+                results = list(executor.map(_version_slowdown_report, jobs, chunksize=4))
+        reports = []
+        for report, captured in results:
+            if captured:
+                ETA.Instrument.merge(captured)
+            if report:
+                reports.append(report)
+        columns = ['version', 'real_latency', 'idealized_latency', 'slowdown', 'task_count', 'worst_waits']
+        table = pd.DataFrame(reports, columns=columns)
+        return table.sort_values('slowdown', kind='stable').reset_index(drop=True)
+
+    def display_slowdown_by_version(self, versions=None, processes=None):
+        ''' Calculate and display slowdown, by version, in ascending order (better to worse),
+        followed by the worst unblocked wait per distro in that version.
+        See slowdown_by_version.'''
+        table = self.slowdown_by_version(versions, processes=processes)
+        for report in table.itertuples():
             print()
-            print('{}: {}'.format(sorted_slowdowns_by_version[version],version))
-            version_gen = self.get_tasks({'scheduled_time':[],'start_time':[],'finish_time':[],'version':[version]})
-            self.display_worst_unblocked_wait_per_field('distro', generator=version_gen)
+            print('{}: {}'.format(report.slowdown, report.version))
+            for distro, (wait, task_id) in report.worst_waits.items():
+                print('{} {} {}'.format(wait, distro, task_id))
 
     def display_pct_waits_over_thresh_per_field(self, threshold_minutes=10, field='distro'):
         ''' display the percentage of task latency times that are over threshold # of minutes,
@@ -252,6 +343,44 @@ class DepWaitTaskTimes(ETA.TaskTimes):
             print('{PCT}pct, {BAD}/{TOTAL}, {FIELD}'.format(
                 PCT=pct, BAD=tasks_over_threshold, TOTAL=total_tasks, FIELD=field_key))
 
+    def quantile_sketches(self, field='distro', relative_accuracy=ETA.Sketch.RELATIVE_ACCURACY):
+        ''' builds one ETA.Sketch.QuantileSketch of seconds per value of field for each interval in WAIT_INTERVALS
+        (corrected wait, raw wait and turnaround), in one pass over the screened task columns.
+        Returns {metric: {field value: sketch}}, which can be saved with ETA.Sketch.save_groups
+        and merged with sketches from other files with ETA.Sketch.merge_groups.'''
+        sketches = {}
+        for metric, (start, end) in WAIT_INTERVALS.items():
+            rows, durations = self.interval_durations(start, end, {field: []})
+            seconds = durations / np.timedelta64(1, 's')
+            column = self.tasks.columns[field]
+            if isinstance(column, ETA.Columns.CategoricalColumn):
+                codes, labels = column.codes[rows], column.categories
+            else:
+                codes, labels = pd.factorize([column.get(row) for row in rows.tolist()])
+            order = np.argsort(codes, kind='stable')
+            boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+            sketches[metric] = {}
+            for group in (np.split(order, boundaries) if len(order) else []):
+                sketch = ETA.Sketch.QuantileSketch(relative_accuracy)
+                sketch.add_array(seconds[group])
+                sketches[metric][labels[codes[group[0]]]] = sketch
+        return sketches
+
+    def display_wait_percentiles_per_field(self, field='distro', quantiles=(0.5, 0.9, 0.99), sketches=None):
+        ''' display percentiles of corrected wait, raw wait and turnaround per value of field,
+        worst corrected wait first.
+        sketches may be given instead, e.g. a month of daily results merged with ETA.Sketch.load_merged.'''
+        if sketches is None:
+            sketches = self.quantile_sketches(field)
+        header = ' '.join('p{:g}'.format(q * 100) for q in quantiles)
+        for metric, by_group in sketches.items():
+            print('{} ({} tasks)'.format(metric, sum(sketch.count for sketch in by_group.values())))
+            print('{} count {}'.format(header, field))
+            worst_first = sorted(by_group.items(), key=lambda item: item[1].quantile(quantiles[-1]), reverse=True)
+            for group, sketch in worst_first:
+                percentiles = [datetime.timedelta(seconds=round(sketch.quantile(q))) for q in quantiles]
+                print('{} {} {}'.format(' '.join(str(p) for p in percentiles), sketch.count, group))
+
 
 class DepGraph:
     ''' contains data structures and methods for more directly manipulating DAG dependency graphs
@@ -259,47 +388,53 @@ class DepGraph:
     abstract indices for ease of lookup. Requires tasks dict with depends_on elements.
     Main benefit is neighborhood analysis and more advanced graph algorithms and functionality.
     '''
+    @ETA.Instrument.timed('depgraph')
     def __init__(self, tasks, edge_weight_rule=None, verbose=False):
 
         self.verbose = verbose
-        size = len(tasks)
-        self._depends_on_adjacency = np.zeros((size, size))
         self._task_ids = list(tasks.keys())
-        task_list = list(tasks.values())
+        self._vertex_ids = {task_id:i for i, task_id in enumerate(self._task_ids)}
+        size = len(self._task_ids)
 
         self.edge_weight_rule = edge_weight_rule
 
-        # construct DAG adjacency matrix
-        for task in task_list:
+        # collect DAG edges as {(i, j): weight}, i depends on j
+        self._edge_weights = {}
+        for task in tasks.values():
             self._update_adjacent_vertices(task)
+        self._edge_sources = np.array([i for i, _ in self._edge_weights], dtype=np.int64)
+        self._edge_targets = np.array([j for _, j in self._edge_weights], dtype=np.int64)
+        ETA.Instrument.count('depgraph_edges', len(self._edge_weights))
+        self._reachability = None
 
         # convert to igraph for advanced graph algos and visualization
-        self.depends_on_graph = igraph.Graph.Weighted_Adjacency(self._depends_on_adjacency.tolist())
+        self.depends_on_graph = igraph.Graph(n=size, edges=list(self._edge_weights), directed=True)
+        self.depends_on_graph.es['weight'] = list(self._edge_weights.values())
         self.depends_on_graph.vs['label'] = list(range(size))
         if self.verbose:
-            np.set_printoptions(precision=3, suppress=True, linewidth=200)
-            print(self._depends_on_adjacency)
+            for (i, j), weight in self._edge_weights.items():
+                print('{} -> {} {:.3f}'.format(i, j, weight))
             for i,x in enumerate(self._task_ids):
                 print('{} {}'.format(i,x))
 
     def _update_adjacent_vertices(self, task):
-        ''' helper function to construct weighted adjacency matrix from
+        ''' helper function to collect weighted edges from
         info contained in each task['depends_on']'''
 
         _id = task['_id']
         depends_on = [x['_id'] for x in task['depends_on']]
         if depends_on:
+            i = self._vertex_ids[_id]
             for key in depends_on:
-                if key in self._task_ids:
-                    i = self._task_ids.index(_id)
-                    j = self._task_ids.index(key)
+                if key in self._vertex_ids:
+                    j = self._vertex_ids[key]
                     if self.verbose:
                         print('{} depends on {}'.format(_id,key))
                     if self.edge_weight_rule:
                         weight = self.edge_weight_rule(task)
                     else:
                         weight = 1
-                    self._depends_on_adjacency[i][j] = weight
+                    self._edge_weights[(i, j)] = weight
 
     def path_cost(self, path):
         '''given a path (list of vertices),
@@ -310,11 +445,23 @@ class DepGraph:
         for i in range(len(path)-1):
             vertex = path[i]
             next_vertex = path[i+1]
-            cost = self._depends_on_adjacency[vertex][next_vertex]
+            cost = self._edge_weights.get((vertex, next_vertex), 0)
             costs.append(cost)
             total_cost += cost
         return costs, total_cost
 
+    def critical_path(self, vertex_weights, source_id, target_id):
+        '''longest path from source_id to target_id, where leaving a task costs that task's weight.
+        vertex_weights has one row per vertex and one column per weighting;
+        every weighting is solved in the same topological sweep (see ETA.DAG.critical_path).
+        Returns an array of path lengths and a list of task id paths, one per weighting.'''
+        vertex_weights = np.asarray(vertex_weights, dtype=float).reshape(len(self._task_ids), -1)
+        lengths, vertex_paths = DAG.critical_path(len(self._task_ids),
+                self._edge_sources, self._edge_targets, vertex_weights[self._edge_sources],
+                self._vertex_ids[source_id], self._vertex_ids[target_id])
+        paths = [[self._task_ids[i] for i in path] for path in vertex_paths]
+        return lengths, paths
+
     def get_task_id_direct_depends_on(self, task_id):
         ''' this is more a sanity check than anything'''
         return self._neighborhood("out", 1, task_id)
@@ -327,28 +474,58 @@ class DepGraph:
         '''gets the reverse of depends_on'''
         return self._neighborhood("in", 1, task_id)
 
+    @property
+    def reachability(self):
+        ''' DAG.ReachabilityIndex of the depends_on edges, built on first use '''
+        if self._reachability is None:
+            self._reachability = DAG.ReachabilityIndex(len(self._task_ids), self._edge_sources, self._edge_targets)
+        return self._reachability
+
     def _reachable(self, direction, task_id):
-        '''returns task ID list of all tasks reachable from specified task_id (string).
+        '''returns task ID list of all tasks reachable from specified task_id (string),
+        starting with task_id itself, the rest in topological order.
         direction must be one of [ "all", "out", "in" ]'''
-        # note: the longest path to any vertex goes through every vertex in the graph,
-        # hence order=len(self._task_ids)
-        return self._neighborhood(direction, len(self._task_ids), task_id)
+        if direction == 'all':
+            # note: the longest path to any vertex goes through every vertex in the graph,
+            # hence order=len(self._task_ids)
+            return self._neighborhood(direction, len(self._task_ids), task_id)
+        vertex_id = self._vertex_ids[task_id]
+        if direction == 'out':
+            vertices = self.reachability.descendants(vertex_id)
+        elif direction == 'in':
+            vertices = self.reachability.ancestors(vertex_id)
+        else:
+            raise ValueError('direction must be one of "all", "out", "in", not {!r}'.format(direction))
+        return [task_id] + [self._task_ids[i] for i in vertices.tolist()]
+
+    def task_depends_on(self, task_id, dependency_id):
+        '''whether task_id depends on dependency_id, directly or transitively'''
+        return self.reachability.reaches(self._vertex_ids[task_id], self._vertex_ids[dependency_id])
+
+    def depends_on_counts(self):
+        '''{task_id: number of tasks it depends on, directly or transitively} for every task'''
+        return dict(zip(self._task_ids, self.reachability.descendant_counts().tolist()))
+
+    def dependent_counts(self):
+        '''{task_id: number of tasks depending on it, directly or transitively} for every task,
+        e.g. how much of a version is downstream of each compile'''
+        return dict(zip(self._task_ids, self.reachability.ancestor_counts().tolist()))
 
     def _neighborhood(self, direction, order, task_id):
         '''wrapper for igraph Graph.neighborhood() that returns task IDs instead of vertices'''
-        vertex_id = self._task_ids.index(task_id)
+        vertex_id = self._vertex_ids[task_id]
         vertex_list = self.depends_on_graph.neighborhood(vertex_id,order,direction)
         task_id_list = [self._task_ids[i] for i in vertex_list]
         return task_id_list
 
     def get_depends_on_task_id(self, task_id):
-        '''returns all tasks that the specified task depends on.
+        '''returns all tasks that the specified task depends on, and the task itself.
         In other words, returns all verticies of the depends_on graph reachable from
         the vertex identified by task_id.'''
         return self._reachable("out",task_id)
 
     def get_dependent_of_task_id(self, task_id):
-        '''returns every task that is a dependent of the specified task.
+        '''returns every task that is a dependent of the specified task, and the task itself.
         In other words, returns all verticies of the depends_on graph reachable from
         the vertex identified by task_id.'''
         return self._reachable("in",task_id)
@@ -361,7 +538,7 @@ class DepGraph:
         if task_ids:
             if isinstance(task_ids,str):
                 task_ids = [task_ids]
-            vertex_ids = [self._task_ids.index(task_id) for task_id in task_ids]
+            vertex_ids = [self._vertex_ids[task_id] for task_id in task_ids]
             subgraph = self.depends_on_graph.induced_subgraph(vertex_ids)
         else:
             subgraph = self.depends_on_graph
@@ -377,7 +554,36 @@ class DepGraph:
         (or as soon as it was scheduled, if no dependencies exist.)
         This assumes task runtime would be the same.
         '''
-        # make implicit dependency of generated on generator explicit
+        latencies, depgraph = cls.version_critical_paths(tasks)
+        real_latency_seconds = latencies['real_latency']
+        idealized_latency_seconds = latencies['idealized_latency']
+
+        slowdown = real_latency_seconds/idealized_latency_seconds
+        print('{} seconds or {} hours (actual)'.format(
+            real_latency_seconds, real_latency_seconds/60**2))
+
+        print('{} seconds or {} hours (idealized)'.format(
+            idealized_latency_seconds, idealized_latency_seconds/60**2))
+
+        print('{} is slowdown'.format(real_latency_seconds/idealized_latency_seconds))
+
+        return slowdown, depgraph
+
+    @classmethod
+    @ETA.Instrument.timed('critical_paths')
+    def version_critical_paths(cls, tasks):
+        ''' finds the critical path of a version twice in one pass over its dependency graph:
+        idealized, where each task costs its runtime (finish_time - start_time),
+        and real, where each task costs finish_time - begin_wait.
+        Returns ({'idealized_latency': seconds, 'real_latency': seconds,
+                  'idealized_path': [task ids], 'real_path': [task ids]}, depgraph)
+        with paths in execution order. depgraph is the DepGraph of the version's own tasks.
+
+        tasks is only read, never modified: the implicit dependencies of generated tasks on their generator
+        and the dummy source and target the paths run between live in a DAG.OverlayGraph
+        on top of the depgraph edges, so many versions can be analyzed straight from one TaskTable.
+        '''
+        # implicit dependency of generated on generator
         generator_tasks = {}
         for task_id in tasks:
             if 'begin_wait' not in tasks[task_id]:
@@ -388,115 +594,116 @@ class DepGraph:
                     generator_tasks[generated_by].append(task_id)
                 else:
                     generator_tasks[generated_by] = [task_id]
-
         for task_id in generator_tasks:
-            dummy_id = task_id + '_dummygen'
             if task_id not in tasks:
                 raise ValueError('incomplete task list. Dependency does not appear in task list: {}'.format(task_id))
-            dummy_task = tasks[task_id].copy()
-            dummy_task['finish_time'] = dummy_task['start_time']
-            dummy_task['_id'] = dummy_id
-            tasks[dummy_id] = dummy_task
-
-            dummy_dependency = {'_id':dummy_id}
-            for dependent_id in generator_tasks[task_id]:
-                if tasks[dependent_id]['depends_on']:
-                    tasks[dependent_id]['depends_on'].append(dummy_dependency)
 
-        # determine all vertices with outdegree 0 and indegree 0
-        task_ids_with_incoming_edges = set()
-        task_ids_with_outgoing_edges = set()
-        all_task_ids = set(tasks.keys())
-
-        # get max and min time
-        earliest_scheduled = datetime.datetime.max
-        latest_finish = datetime.datetime.min
         #first, sort tasks by scheduled_time
         tasks = dict(sorted(tasks.items(), key=lambda item: item[1]['scheduled_time']))
         for task_id in tasks:
-            # construct intervals
-            scheduled = tasks[task_id]['scheduled_time']
-            finished = tasks[task_id]['finish_time']
-            # check global max and min
-            if latest_finish < finished :
-                latest_finish = finished
-            if scheduled < earliest_scheduled:
-                earliest_scheduled = scheduled
-            # collect topology data
-            if tasks[task_id]['depends_on']:
-                task_ids_with_outgoing_edges.add(task_id)
-                for dep_task_item in tasks[task_id]['depends_on']:
-                    dep_key = dep_task_item['_id']
-                    if dep_key not in all_task_ids:
-                        if 'display' not in dep_key:
-                            raise ValueError('incomplete task list. Dependency does not appear in task list: {}'.format(dep_key))
-                    task_ids_with_incoming_edges.add(dep_key)
-
-        task_ids_with_zero_indegree = all_task_ids - task_ids_with_incoming_edges
-        task_ids_with_zero_outdegree = all_task_ids - task_ids_with_outgoing_edges
-
-        # add dummy tasks as entry points for mincost algorithm
-        source_id = 'dummy_source'
-        source_vertex = {'_id': source_id, 'depends_on':[{'_id':x} for x in task_ids_with_zero_indegree]}
-        source_vertex['start_time'] = earliest_scheduled
-        source_vertex['begin_wait'] = earliest_scheduled 
-        source_vertex['finish_time'] = earliest_scheduled + datetime.timedelta(seconds=1)
-        source_vertex_id = len(tasks)
-        tasks[source_id] = source_vertex
-
-        target_id = 'dummy_target'
-        target_vertex = {'_id': target_id, 'depends_on':[]}
-        target_vertex['start_time'] = latest_finish
-        target_vertex['begin_wait'] = latest_finish
-        target_vertex['finish_time'] = latest_finish + datetime.timedelta(seconds=1)
-        target_vertex_id = len(tasks)
-        tasks[target_id] = target_vertex
-        for task_id in task_ids_with_zero_outdegree:
-            try:
-                tasks[task_id]['depends_on'].append({'_id': target_id})
-            except KeyError:
-                print(task_id)
-                print(tasks[task_id])
-                raise
-
-        # call mincost_path
-        def calculate_ideal_maxcost_path_weight(some_task):
+            for dep_task_item in tasks[task_id]['depends_on']:
+                dep_key = dep_task_item['_id']
+                if dep_key not in tasks and 'display' not in dep_key:
+                    raise ValueError('incomplete task list. Dependency does not appear in task list: {}'.format(dep_key))
+
+        def calculate_ideal_path_weight(some_task):
             ''' helper to pass to graph constructor'''
             timedelta_weight = some_task['finish_time'] - some_task['start_time']
-            seconds =  timedelta_weight.total_seconds()
-            # invert to allow calculation of maxcost path by mincost-path algo
-            return -1 * seconds
-        depgraph = cls(tasks, calculate_ideal_maxcost_path_weight)
-        idealized_latency = depgraph.depends_on_graph.shortest_paths_dijkstra(
-                source=source_vertex_id, target=target_vertex_id, weights='weight')
-        # have to add 1 second to correct for dummy_source second-long runtime,
-        # then multiply by -1 again to make the mincost path positive.
-        idealized_latency_seconds = (idealized_latency[0][0] +1 ) * -1
-
-        def calculate_real_maxcost_path_weight(some_task):
+            return timedelta_weight.total_seconds()
+
+        def calculate_real_path_weight(some_task):
             ''' helper to pass to graph constructor'''
             timedelta_weight = some_task['finish_time'] - some_task['begin_wait']
-            seconds =  timedelta_weight.total_seconds()
-            # invert to allow calculation of maxcost path by mincost-path algo
-            return -1 * seconds
-
-        depgraph = cls(tasks, calculate_real_maxcost_path_weight)
-        real_latency = depgraph.depends_on_graph.shortest_paths_dijkstra(
-                source=source_vertex_id, target=target_vertex_id, weights='weight')
-        # have to add 1 second to correct for dummy_source second-long runtime,
-        # then multiply by -1 again to make the mincost path positive.
-        real_latency_seconds = (real_latency[0][0] +1 ) * -1
-
-        slowdown = real_latency_seconds/idealized_latency_seconds
-        print('{} seconds or {} hours (actual)'.format(
-            real_latency_seconds, real_latency_seconds/60**2))
-
-        print('{} seconds or {} hours (idealized)'.format(
-            idealized_latency_seconds, idealized_latency_seconds/60**2))
-
-        print('{} is slowdown'.format(real_latency_seconds/idealized_latency_seconds))
-
-        return slowdown, depgraph
+            return timedelta_weight.total_seconds()
+
+        depgraph = cls(tasks, calculate_real_path_weight)
+        size = len(depgraph._task_ids)
+        overlay = DAG.OverlayGraph(size, depgraph._edge_sources, depgraph._edge_targets)
+        vertex_weights = [[calculate_ideal_path_weight(tasks[task_id]), calculate_real_path_weight(tasks[task_id])]
+                for task_id in depgraph._task_ids]
+
+        # each generator gets a dummy vertex, a copy of the generator that finishes when it starts,
+        # which the generated tasks depend on
+        generators = list(generator_tasks)
+        dummies = overlay.add_vertices(len(generators)).tolist()
+        extra_edges = {}
+        for generator_id, dummy in zip(generators, dummies):
+            for dependent_id in generator_tasks[generator_id]:
+                if tasks[dependent_id]['depends_on']:
+                    extra_edges.setdefault(depgraph._vertex_ids[dependent_id], []).append(dummy)
+            generator = tasks[generator_id]
+            vertex_weights.append([0.0, (generator['start_time'] - generator['begin_wait']).total_seconds()])
+        in_degree = np.bincount(np.concatenate([depgraph._edge_targets, np.array(
+                [target for targets in extra_edges.values() for target in targets], dtype=np.int64)]),
+                minlength=overlay.size)
+
+        # add dummy tasks as entry points for mincost algorithm,
+        # each takes one second
+        source, target = overlay.add_vertices(2).tolist()
+        vertex_weights += [[1.0, 1.0], [1.0, 1.0]]
+        for task_id, vertex in depgraph._vertex_ids.items():
+            if not tasks[task_id]['depends_on']:
+                extra_edges.setdefault(vertex, []).append(target)
+        for generator_id, dummy in zip(generators, dummies):
+            vertex = depgraph._vertex_ids[generator_id]
+            extra_edges[dummy] = depgraph._edge_targets[depgraph._edge_sources == vertex].tolist() + extra_edges.get(vertex, [])
+        extra_edges[source] = np.flatnonzero(in_degree == 0).tolist()
+        edge_sources = [vertex for vertex, targets in extra_edges.items() for _ in targets]
+        overlay.add_edges(edge_sources, [target for targets in extra_edges.values() for target in targets])
+
+        vertex_weights = np.array(vertex_weights)
+        (idealized_latency, real_latency), (idealized_path, real_path) = DAG.critical_path(overlay.size,
+                overlay.sources, overlay.targets, vertex_weights[overlay.sources], source, target)
+
+        def execution_order(path):
+            ''' drops the dummy source and target and maps generator dummies back to their generator '''
+            path = [depgraph._task_ids[vertex] if vertex < size else generators[vertex - size]
+                    for vertex in path[1:-1]]
+            return path[::-1]
+
+        # have to subtract 1 second to correct for dummy_source second-long runtime
+        latencies = {
+            'idealized_latency': idealized_latency - 1,
+            'real_latency': real_latency - 1,
+            'idealized_path': execution_order(idealized_path),
+            'real_path': execution_order(real_path),
+            }
+        return latencies, depgraph
+
+def _version_slowdown_report(job):
+    ''' process pool worker for DepWaitTaskTimes.slowdown_by_version.
+    job is (version, {task_id:task_dict}, instrument). Returns (report, captured):
+    a report dict, or None if the version can't be analyzed, and if instrument is set
+    the stages and counters recorded for it (see ETA.Instrument.capture), else None.'''
+    version, tasks, instrument = job
+    if not instrument:
+        return _version_slowdown(version, tasks), None
+    with ETA.Instrument.capture() as captured:
+        report = _version_slowdown(version, tasks)
+    return report, captured
+
+def _version_slowdown(version, tasks):
+    try:
+        latencies, _ = DepGraph.version_critical_paths(tasks)
+    except ValueError as e:
+        logging.warning('{}: {}'.format(version, e))
+        ETA.Instrument.count('versions_skipped')
+        return None
+    worst_waits = {}
+    for task_id, task in tasks.items():
+        if 'distro' not in task:
+            continue
+        wait = task['start_time'] - task['begin_wait']
+        if wait > worst_waits.get(task['distro'], (datetime.timedelta(0), None))[0]:
+            worst_waits[task['distro']] = (wait, task_id)
+    return {
+        'version': version,
+        'real_latency': latencies['real_latency'],
+        'idealized_latency': latencies['idealized_latency'],
+        'slowdown': latencies['real_latency'] / latencies['idealized_latency'],
+        'task_count': len(tasks),
+        'worst_waits': dict(sorted(worst_waits.items(), key=lambda item: item[1][0], reverse=True)),
+        }
 
 def main():
     time_fields = [
@@ -1,42 +1,41 @@
 #!/usr/bin/env python3
 ''' fetches recent patches from the evergreen API and passes them on for further processing
 '''
-import requests
-import yaml
 import os
 import logging
 
-# from Sam's evergreen_distro_clone.py 
-def _get_api_info(cred_file):
-    cred_file = os.path.expanduser(cred_file)
+from ETA.Evergreen import EvergreenClient, read_credentials
+import runner
 
-    if not os.path.exists(cred_file):
-        logging.error("credential file does not exist")
-        exit(1)
-
-    with open(cred_file, "r") as f:
-        data = yaml.safe_load(f)
-
-        return {"Api-Key": data["api_key"], "Api-User": data["user"]}
+PROJECT = 'mms'
+MIN_TASKS = 30
 
-def _get_patches(token):
-    response = requests.get('https://evergreen.mongodb.com/rest/v2/projects/mms/patches?limit=3000', headers=token)
-    response.raise_for_status()
-    data = response.json()
+def get_recent_patches(client, project=PROJECT, min_tasks=MIN_TASKS):
+    ''' ids of recent successful patches with at least min_tasks tasks '''
     patch_ids = []
-    for item in data:
+    for item in client.patches(project):
         if item['status'] == 'succeeded':
-            if len(item['tasks']) < 30:
+            if len(item['tasks']) < min_tasks:
                 continue
             patch_ids.append(item['patch_id'])
-    return patch_ids 
-
-def get_recent_patches():
-    
-    token = _get_api_info('~/.evergreen.yml')
-    return _get_patches(token)
+    return patch_ids
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    try:
+        token = read_credentials('~/.evergreen.yml')
+    except ValueError as e:
+        logging.error(e)
+        exit(1)
+    mongo_uri = os.environ.get('ETA_MONGO_URI')
+    if not mongo_uri:
+        logging.error('set ETA_MONGO_URI to a secondary of the evergreen database')
+        exit(1)
+    client = EvergreenClient(token)
+    successful_path_ids = get_recent_patches(client)
 
-successful_path_ids = get_recent_patches()
+    # a patch's version id is its patch id
+    runner.run(successful_path_ids, 'version', mongo_uri=mongo_uri, out_dir='./runs/patches')
 
-for _id in successful_path_ids:
-   os.system('./foobarize.sh {} pipenv run ./DependencyAnalysis.py'.format(_id)) 
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,30 @@
 #!/usr/bin/env python3
 '''
 plots task waits by finish time, and other plots.
+
+    ./plots.py
+    ./plots.py --test
 '''
 import datetime
+import heapq
 import logging
+import sys
+import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
 import pandas as pd
 
 import ETA.Chunks as chunks
+import ETA.Instrument
 import metrics
 
 logging.basicConfig(level=logging.INFO)
 OUT_HTML = './mongodb_mongo_master_enterprise_windows_all_feature_flags_suggested_b46c44c41849606ade03f8a9238aa6ea800bb87a_21_08_06_18_35_46.html'
+TIMELINE_WIDTH_PX = 1600
+WEBGL_THRESHOLD = 5000
+TIMELINE_MAX_LANES = 200
+# main draws larger timelines with generate_lod_timeline
+TIMELINE_LOD_TASKS = 20000
 IN_JSON = './mongodb_mongo_master_enterprise_windows_all_feature_flags_suggested_b46c44c41849606ade03f8a9238aa6ea800bb87a_21_08_06_18_35_46.json'
 
 ##
@@ -52,23 +65,138 @@ def generate_twocolor_timeline(df, start='begin_wait', middle='start_time', end=
     })
     return fig
 
+def generate_lod_timeline(df, start='begin_wait', middle='start_time', end='finish_time', lanes='distro',
+        width_px=TIMELINE_WIDTH_PX, max_lanes=TIMELINE_MAX_LANES, webgl_threshold=WEBGL_THRESHOLD):
+    ''' level-of-detail version of generate_twocolor_timeline for large numbers of tasks.
+    Instead of one row per task, tasks are drawn in lanes: one per value of a field such as 'distro'
+    or 'task_group', or with lanes='packed', as few rows as possible without overlapping tasks,
+    folded together if there would be more than max_lanes of them.
+    Within a lane, waiting (start to middle) and running (middle to end) intervals less than a pixel apart,
+    at width_px pixels across the whole time range, are drawn as one bar, and its hover text
+    gives the exact number of tasks it stands for. The figure therefore holds at most about
+    2 * lanes * width_px bars whatever the number of tasks.
+    If more than webgl_threshold bars remain they are drawn as WebGL line segments instead.
+    '''
+    df = df.dropna(subset=[start, middle, end])
+    if not len(df):
+        raise ValueError('no tasks have {}, {} and {}'.format(start, middle, end))
+    times = {key: df[key].values.astype('datetime64[ms]').astype(np.int64) for key in (start, middle, end)}
+    if lanes == 'packed':
+        lane_of = pack_lanes(times[start], times[end])
+        lane_of //= -(-(lane_of.max() + 1) // max_lanes)
+        lane_labels = np.array(['row {}'.format(i) for i in range(lane_of.max() + 1)])
+    else:
+        lane_of, lane_labels = pd.factorize(df[lanes].fillna('none').astype(str), sort=True)
+        lane_labels = np.asarray(lane_labels)
+    span = times[end].max() - times[start].min()
+    pixel = max(span // width_px, 1)
+
+    phases = [
+        ('Waiting ({} to {})'.format(start, middle), times[start], times[middle]),
+        ('Running ({} to {})'.format(middle, end), times[middle], times[end]),
+        ]
+    collapsed = [(name,) + collapse_intervals(lane_of, begin, finish, pixel) for name, begin, finish in phases]
+    use_webgl = sum(len(counts) for _, _, _, _, counts in collapsed) > webgl_threshold
+
+    fig = go.Figure()
+    for phase, (name, lane, begin, finish, counts) in enumerate(collapsed):
+        if use_webgl:
+            # one line segment per bar, separated by gaps, phases side by side within a lane.
+            # A date axis reads numbers as ms since the epoch.
+            gaps = np.full(len(counts), np.nan)
+            x = np.stack([begin, finish, gaps], axis=-1).ravel()
+            y = np.stack([lane, lane, gaps], axis=-1).ravel() + (phase - 0.5) * 0.4
+            fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', line={'width': 4}, name=name,
+                customdata=np.repeat(counts, 3),
+                hovertemplate='%{customdata} tasks<br>%{x}<extra>' + name + '</extra>'))
+            continue
+        begin_text = np.datetime_as_string(begin.astype('datetime64[ms]'), unit='s')
+        finish_text = np.datetime_as_string(finish.astype('datetime64[ms]'), unit='s')
+        fig.add_trace(go.Bar(base=begin_text, x=finish - begin, y=lane_labels[lane], orientation='h',
+            name=name, customdata=np.stack([counts, begin_text, finish_text], axis=-1),
+            hovertemplate='%{customdata[0]} tasks<br>%{customdata[1]} to %{customdata[2]}<extra>' + name + '</extra>'))
+    if use_webgl:
+        fig.update_yaxes(tickvals=np.arange(len(lane_labels)), ticktext=lane_labels)
+    fig.update_xaxes(type='date')
+    fig.update_yaxes(autorange="reversed", title=lanes)
+    fig.update_layout({
+    'barmode': 'group',
+    'plot_bgcolor': 'rgba(0, 0, 0, 0)',
+    'paper_bgcolor': 'rgba(0, 0, 0, 0)',
+    })
+    return fig
+
+def pack_lanes(begin, finish):
+    ''' greedy interval packing: assigns each [begin, finish] interval a lane number
+    so that intervals in a lane don't overlap, using as few lanes as possible.
+    Intervals are placed in order of begin, each in the lowest-numbered lane free by then.
+
+    >>> pack_lanes(np.array([0, 1, 5, 6]), np.array([5, 3, 7, 8])).tolist()
+    [0, 1, 0, 1]
+    '''
+    lane_of = np.empty(len(begin), dtype=np.int64)
+    # (finish of the last interval in the lane, lane) for lanes in use, and free lane numbers
+    busy = []
+    free = []
+    lanes = 0
+    for i in np.argsort(begin, kind='stable').tolist():
+        while busy and busy[0][0] <= begin[i]:
+            heapq.heappush(free, heapq.heappop(busy)[1])
+        if free:
+            lane = heapq.heappop(free)
+        else:
+            lane = lanes
+            lanes += 1
+        lane_of[i] = lane
+        heapq.heappush(busy, (finish[i], lane))
+    return lane_of
+
+def collapse_intervals(lane_of, begin, finish, pixel):
+    ''' merges intervals in the same lane that overlap or are less than pixel apart.
+    begin and finish are integer arrays (e.g. ms since the epoch).
+    Returns (lane, begin, finish, count) arrays with one entry per merged interval.
+
+    >>> lanes = np.array([0, 0, 0, 1])
+    >>> merged = collapse_intervals(lanes, np.array([0, 2, 20, 0]), np.array([1, 9, 25, 4]), pixel=2)
+    >>> [array.tolist() for array in merged]
+    [[0, 0, 1], [0, 20, 0], [9, 25, 4], [2, 1, 1]]
+    '''
+    order = np.lexsort((begin, lane_of))
+    lane, begin, finish = lane_of[order], begin[order], finish[order]
+    # offset every lane past the previous one, so one running maximum covers all lanes
+    origin = begin.min()
+    stride = max(finish.max(), begin.max()) - origin + 2 * pixel + 1
+    shifted = finish - origin + lane * stride
+    reach = np.maximum.accumulate(shifted)
+    new = np.ones(len(order), dtype=bool)
+    new[1:] = (lane[1:] != lane[:-1]) | (begin[1:] - origin + lane[1:] * stride >= reach[:-1] + pixel)
+    firsts = np.flatnonzero(new)
+    ends = np.maximum.reduceat(shifted, firsts) - lane[firsts] * stride + origin
+    counts = np.diff(np.append(firsts, len(order)))
+    return lane[firsts], begin[firsts], ends, counts
+
 ##
 # line
 
-def generate_chunked_running_task_count(task_list, chunk_times):
+def generate_chunked_running_task_count(task_list, chunk_times, group_by=None):
     ''' task data must be an ETA.TaskTimes object.
     this creates a basic line chart of tasks running per time
     using ETA.Chunks.
+    If group_by is a field name such as 'distro', draws one line per value of that field.
     '''
 
-    count_dict = chunk_times.index_task_on_chunktime_search(task_list)
-    count_list = []
-    for time in count_dict:
-        timepoint_dict = {'time': time, 'active_tasks': count_dict[time] }
-        count_list.append(timepoint_dict)
+    if not group_by:
+        count_dict = chunk_times.index_task_on_chunktime_sweep(task_list)
+        df = pd.DataFrame({'time': list(count_dict), 'active_tasks': list(count_dict.values())})
+        return px.line(df, x="time", y="active_tasks")
 
-    df = pd.DataFrame(count_list)
-    return px.line(df, x="time", y="active_tasks")
+    counts_by_group = chunk_times.index_task_on_chunktime_sweep(task_list, group_by=group_by)
+    frames = []
+    for group, count_dict in counts_by_group.items():
+        frames.append(pd.DataFrame({'time': list(count_dict), 'active_tasks': list(count_dict.values()),
+            group_by: group}))
+    df = pd.concat(frames, ignore_index=True)
+    return px.line(df, x="time", y="active_tasks", color=group_by)
 
 ##
 # histogram
@@ -89,7 +217,7 @@ def generate_hist_blocked_time(task_data, additional_filters = None):
     ''' returns histogram of blocked times'''
     return generate_hist(task_data,'blocked_time','scheduled_time','unblocked_time', additional_filters = additional_filters)
 
-def generate_hist(task_data, title, start_key, end_key, additional_filters= None):
+def generate_hist(task_data, title, start_key, end_key, additional_filters= None, bins='fixed', bin_count=50):
     ''' boilerplate function that generates a histogram of some time interval
     from internal task dict.
     task_data is a task times object.
@@ -99,45 +227,82 @@ def generate_hist(task_data, title, start_key, end_key, additional_filters= None
     (value must be datetime.datetime but key is arbitrary)
     additional_filters is a dict of filters to pass to the generator
     e.g. {'distro':['rhel62-small']}
+    bins is 'fixed' (bin_count equal bins), 'log' (bin_count log-spaced bins, on a log axis)
+    or 'quantile' (bin_count bins with equal numbers of tasks, drawn as tasks per hour of bin width).
+    Durations are binned with numpy, so the figure holds only bin edges and counts.
     '''
-    finish_times = []
-    total = datetime.timedelta(0)
-    total_hours = 0
-    total_count = 0
-    first_time = True
     title = title + '(hours)'
-    over_count = 0
     filter_dict = {start_key:[],end_key:[]}
     if additional_filters:
         filter_dict.update(additional_filters)
-    task_groups = set()
-    for task in task_data.get_tasks(filter_dict):
-        time_delta = task[end_key] - task[start_key]
-        seconds_in_minute = 60
-        minutes_in_hour = 60
-        time_delta_hour = (time_delta.seconds / seconds_in_minute) / minutes_in_hour
-        finish_times.append({title:time_delta_hour})
-        total_hours += time_delta_hour
-        total += time_delta
-        total_count += 1
-        if time_delta_hour >= 1:
-            #logging.info(task["_id"])
-            #logging.info(task["version"])
-            task_groups.add(task["task_group"])
-            over_count +=1
-        if first_time:
-            worst = {time_delta_hour:task}
-            first_time = False
-        if time_delta_hour > next(iter(worst)):
-            worst = {time_delta_hour:task}
-    df = pd.DataFrame(finish_times)
-    fig = px.histogram(df, x=title)
-    logging.info(total_hours/total_count)
-    logging.info(over_count)
-    for group in task_groups:
-        logging.info(group)
+    rows, durations = task_data.interval_durations(start_key, end_key, filter_dict)
+    if not len(rows):
+        raise ValueError('no tasks have both {} and {}'.format(start_key, end_key))
+    hours = durations / np.timedelta64(1, 'h')
+
+    _log_interval_summary(task_data, rows, hours)
+    edges, counts, y_title = bin_durations(hours, bins, bin_count)
+    fig = go.Figure(go.Bar(
+        x=edges[:-1],
+        y=counts,
+        width=np.diff(edges),
+        offset=0,
+        customdata=np.stack([edges[:-1], edges[1:], counts], axis=-1),
+        hovertemplate='%{customdata[0]:.3f} to %{customdata[1]:.3f} hours<br>%{customdata[2]} tasks<extra></extra>',
+        ))
+    fig.update_layout(xaxis_title=title, yaxis_title=y_title, bargap=0)
+    if bins == 'log':
+        fig.update_xaxes(type='log')
     return fig
 
+def bin_durations(hours, bins='fixed', bin_count=50):
+    ''' bins an array of durations in hours, see generate_hist.
+    Returns (edges, counts, y axis title), where the y values are counts except for quantile bins.
+
+    >>> edges, counts, _ = bin_durations(np.array([0.0, 0.5, 1.0, 4.0]), 'fixed', 4)
+    >>> edges.tolist(), counts.tolist()
+    ([0.0, 1.0, 2.0, 3.0, 4.0], [2, 1, 0, 1])
+    >>> edges, counts, _ = bin_durations(np.array([0.0, 0.01, 0.1, 1.0]), 'log', 2)
+    >>> edges.round(3).tolist(), counts.tolist()
+    ([0.01, 0.1, 1.0], [1, 2])
+    '''
+    y_title = 'count'
+    if bins == 'fixed':
+        counts, edges = np.histogram(hours, bins=bin_count)
+    elif bins == 'log':
+        positive = hours[hours > 0]
+        if len(positive) < len(hours):
+            logging.info('{} intervals of zero or less left out of log bins'.format(len(hours) - len(positive)))
+        if not len(positive):
+            raise ValueError('log bins need positive durations')
+        low, high = positive.min(), positive.max()
+        edges = np.geomspace(low, high if high > low else low * 10, bin_count + 1)
+        counts, edges = np.histogram(positive, bins=edges)
+    elif bins == 'quantile':
+        edges = np.unique(np.quantile(hours, np.linspace(0, 1, bin_count + 1)))
+        if len(edges) < 2:
+            edges = np.array([edges[0], edges[0] + 1])
+        counts, edges = np.histogram(hours, bins=edges)
+        counts = counts / np.diff(edges)
+        y_title = 'tasks per hour of bin width'
+    else:
+        raise ValueError('unknown bins {}, allowed values are "fixed", "log", "quantile"'.format(bins))
+    return edges, counts, y_title
+
+def _log_interval_summary(task_data, rows, hours):
+    ''' logs mean interval, how many intervals are an hour or more, their task groups and the worst task '''
+    logging.info(hours.mean())
+    over = hours >= 1
+    logging.info(int(over.sum()))
+    tasks = task_data.tasks
+    if 'task_group' in tasks.columns:
+        over_rows = rows[over]
+        over_rows = over_rows[tasks.present('task_group')[over_rows]]
+        for group in {tasks.get_value(row, 'task_group') for row in over_rows.tolist()}:
+            logging.info(group)
+    worst = int(np.argmax(hours))
+    logging.info('worst: {} hours, {}'.format(hours[worst], tasks.ids[rows[worst]]))
+
 def main():
     time_fields = [ 'create_time',
                     'scheduled_time',
@@ -147,22 +312,35 @@ def main():
     task_data = metrics.DepWaitTaskTimes(IN_JSON,time_fields)
 
     generator = task_data.get_tasks({'begin_wait':[],'start_time':[],'finish_time':[]})
-    task_list = list(generator)
-    for task in task_list:
-        # have to do this here to avoid polluting the unblock calculations
-        # add eleven seconds to avoid plotly wierdness
-        task['start_time'] += datetime.timedelta(0,11)
-        task['finish_time'] += datetime.timedelta(0,22)
+    df = task_data.dataframe(generator)
 
     #generate_hist_corrected_wait_time(task_data, additional_filters={'begin_wait':[],'start_time':[],'finish_time':[],'distro':['rhel76-small']})
-    df = task_data.dataframe(generator)
-    fig = generate_twocolor_timeline(df)
+    if len(df) > TIMELINE_LOD_TASKS:
+        fig = generate_lod_timeline(df)
+    else:
+        # have to do this on the dataframe to avoid polluting the unblock calculations
+        # add eleven seconds to avoid plotly wierdness
+        df['start_time'] += datetime.timedelta(0,11)
+        df['finish_time'] += datetime.timedelta(0,22)
+        fig = generate_twocolor_timeline(df)
     fig.update_layout(title = 'mongodb_mongo_master_enterprise_windows_all_feature_flags_suggested_b46c44c41849606ade03f8a9238aa6ea800bb87a_21_08_06_18_35_46 build')
     fig.show()
     # cdn options reduce the size of the file by a couple of MB.
     out_html = OUT_HTML
-    fig.write_html(out_html,include_plotlyjs='cdn',include_mathjax='cdn')
+    with ETA.Instrument.stage('plot_export'):
+        fig.write_html(out_html,include_plotlyjs='cdn',include_mathjax='cdn')
     print('figure saved at {}'.format(out_html))
 
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
+
 if __name__ == '__main__':
-    main()
+    if sys.argv[1:] == ['--test']:
+        _test()
+    else:
+        main()
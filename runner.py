@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+'''
+runs metrics and plots analyses over many datasets at once, replacing foobarize.sh.
+
+Each key (a distro, a version or patch id, ...) becomes one dataset:
+    - with --json FILE, the tasks in FILE screened to field == key.
+      All workers share FILE's parsed-table cache, which is built once up front.
+    - with --json a path containing {key}, e.g. 'tasks_{key}.json', one file per key.
+    - with --mongo-uri, an ETA.Mongo aggregation filtered to field == key (and --begin/--end).
+slowdown_by_version only runs by default for --field version. Asked for with other fields,
+it analyzes every version that has tasks with field == key, all of their tasks included.
+Datasets are processed on a pool of worker processes, and every analysis writes its output to
+OUT/<field>=<key>/<analysis>.{csv,txt,html}. A summary of all runs goes to OUT/summary.json.
+With --instrument, each dataset also gets an instrument.json report of stage timings and data-quality counters
+(see ETA.Instrument, ETA_INSTRUMENT_PROFILE adds profiles).
+
+    ./runner.py --field distro --keys rhel62-large rhel76-small --json cruisin.json
+    ./runner.py --field version --keys $(cat patch_ids) --mongo-uri "$ETA_MONGO_URI" \\
+            --begin 2021-01-14T23:30 --end 2021-01-15T12:00 --analyses slowdown_by_version
+    ./runner.py --test
+'''
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+
+import ETA.Instrument
+import metrics
+
+TIME_FIELDS = [
+        'scheduled_time',
+        'start_time',
+        'finish_time',
+        ]
+OUT_DIR = './runs'
+
+##
+# analyses, each takes (task_data, out_dir) and writes its own files
+
+def _printed(function):
+    ''' analysis that saves what a display_* method prints '''
+    def analysis(task_data, out_dir, name):
+        with open(os.path.join(out_dir, name + '.txt'), 'w') as f, contextlib.redirect_stdout(f):
+            function(task_data)
+    return analysis
+
+def _figure(function):
+    ''' analysis that saves a plotly figure '''
+    def analysis(task_data, out_dir, name):
+        fig = function(task_data)
+        # cdn options reduce the size of the file by a couple of MB.
+        with ETA.Instrument.stage('plot_export'):
+            fig.write_html(os.path.join(out_dir, name + '.html'), include_plotlyjs='cdn', include_mathjax='cdn')
+    return analysis
+
+def _slowdown_by_version(task_data, out_dir, name):
+    screen_by = task_data.screen_by
+    if not screen_by or set(screen_by) == {'version'}:
+        # already inside a worker process, so no nested pool
+        report = task_data.slowdown_by_version(processes=1)
+    else:
+        # a critical path runs through every task of its version, whatever its distro,
+        # so analyze the whole of each version the screened tasks are in
+        versions = sorted({task['version'] for task in task_data.get_tasks({'version': []})})
+        task_data.screen_by = None
+        try:
+            report = task_data.slowdown_by_version(versions, processes=1)
+        finally:
+            task_data.screen_by = screen_by
+    report.to_csv(os.path.join(out_dir, name + '.csv'), index=False)
+
+def _wait_sketches(task_data, out_dir, name):
+    # saved for merging with other runs, see ETA.Sketch.load_merged
+    import ETA.Sketch
+    ETA.Sketch.save_groups(task_data.quantile_sketches(), os.path.join(out_dir, name + '.json'))
+
+def _corrected_wait_hist(task_data):
+    import plots
+    return plots.generate_hist_corrected_wait_time(task_data)
+
+def _timeline(task_data):
+    import plots
+    df = task_data.dataframe(task_data.get_tasks({'begin_wait':[],'start_time':[],'finish_time':[]}))
+    return plots.generate_lod_timeline(df, lanes='packed')
+
+ANALYSES = {
+    'slowdown_by_version': _slowdown_by_version,
+    'wait_blocked_totals': _printed(lambda task_data: task_data.display_wait_blocked_totals()),
+    'worst_unblocked_wait': _printed(lambda task_data: task_data.display_worst_unblocked_wait_per_field('distro')),
+    'pct_waits_over_thresh': _printed(lambda task_data: task_data.display_pct_waits_over_thresh_per_field()),
+    'wait_percentiles': _printed(lambda task_data: task_data.display_wait_percentiles_per_field()),
+    'wait_sketches': _wait_sketches,
+    'corrected_wait_hist': _figure(_corrected_wait_hist),
+    'timeline': _figure(_timeline),
+    }
+DEFAULT_ANALYSES = ['slowdown_by_version', 'wait_blocked_totals', 'worst_unblocked_wait']
+
+def default_analyses(field):
+    ''' DEFAULT_ANALYSES, less slowdown_by_version unless the keys are versions:
+    it reports whole versions, not the tasks of one distro, say.
+
+    >>> default_analyses('distro')
+    ['wait_blocked_totals', 'worst_unblocked_wait']
+    '''
+    if field == 'version':
+        return list(DEFAULT_ANALYSES)
+    return [name for name in DEFAULT_ANALYSES if name != 'slowdown_by_version']
+
+##
+# datasets
+
+def key_dir(out_dir, field, key):
+    ''' output directory for one key
+
+    >>> key_dir('runs', 'distro', 'rhel62/large')
+    'runs/distro=rhel62_large'
+    '''
+    return os.path.join(out_dir, '{}={}'.format(field, str(key).replace(os.sep, '_')))
+
+def _load_dataset(job):
+    ''' builds the DepWaitTaskTimes for one job '''
+    key, field = job['key'], job['field']
+    if job.get('mongo_uri'):
+        import ETA.Mongo
+        source = ETA.Mongo.connect(job['mongo_uri'], screen_by={field: [key]},
+                begin=job.get('begin'), end=job.get('end'))
+        return metrics.DepWaitTaskTimes(source, job['time_fields'])
+    if '{key}' in job['json']:
+        return metrics.DepWaitTaskTimes(job['json'].format(key=key), job['time_fields'])
+    task_data = metrics.DepWaitTaskTimes(job['json'], job['time_fields'])
+    task_data.screen_by = {field: [key]}
+    return task_data
+
+def run_dataset(job):
+    ''' loads one dataset and runs the requested analyses on it.
+    Returns a summary dict, failures are recorded in it rather than raised.'''
+    started = time.perf_counter()
+    out_dir = key_dir(job['out_dir'], job['field'], job['key'])
+    os.makedirs(out_dir, exist_ok=True)
+    summary = {'key': job['key'], 'out_dir': out_dir, 'errors': {}}
+    if job.get('instrument'):
+        summary['instrument'] = os.path.join(out_dir, 'instrument.json')
+        ETA.Instrument.enable(summary['instrument'], *ETA.Instrument.profile_options())
+    try:
+        with ETA.Instrument.stage('load'):
+            task_data = _load_dataset(job)
+    except Exception as e:
+        logging.exception('could not load dataset {}'.format(job['key']))
+        summary['errors']['load'] = repr(e)
+    else:
+        summary['tasks'] = len(task_data.tasks.select(task_data.screen_by))
+        for name in job['analyses']:
+            try:
+                with ETA.Instrument.stage(name):
+                    ANALYSES[name](task_data, out_dir, name)
+            except Exception as e:
+                logging.exception('{} failed for {}'.format(name, job['key']))
+                summary['errors'][name] = repr(e)
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    if job.get('instrument'):
+        ETA.Instrument.write_report()
+        ETA.Instrument.disable()
+    return summary
+
+def run(keys, field, json_path=None, mongo_uri=None, begin=None, end=None,
+        analyses=None, out_dir=OUT_DIR, processes=None, time_fields=TIME_FIELDS, instrument=False):
+    ''' runs analyses (default_analyses(field) by default) for every key on a process pool,
+    returns the list of per-key summaries.
+    instrument writes an ETA.Instrument report for every key.'''
+    if bool(json_path) == bool(mongo_uri):
+        raise ValueError('exactly one of json_path and mongo_uri is needed')
+    if analyses is None:
+        analyses = default_analyses(field)
+    unknown = [name for name in analyses if name not in ANALYSES]
+    if unknown:
+        raise ValueError('unknown analyses {}, choose from {}'.format(unknown, list(ANALYSES)))
+    if json_path and '{key}' not in json_path:
+        # parse the shared file once, the workers then load it from the cache
+        metrics.DepWaitTaskTimes(json_path, time_fields)
+    jobs = [{'key': key, 'field': field, 'json': json_path, 'mongo_uri': mongo_uri,
+             'begin': begin, 'end': end, 'analyses': list(analyses),
+             'out_dir': out_dir, 'time_fields': list(time_fields), 'instrument': instrument} for key in keys]
+    os.makedirs(out_dir, exist_ok=True)
+    if processes == 1:
+        summaries = [run_dataset(job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            summaries = list(executor.map(run_dataset, jobs))
+    with open(os.path.join(out_dir, 'summary.json'), 'w') as f:
+        json.dump(summaries, f, indent=2)
+    for summary in summaries:
+        status = 'failed: {}'.format(', '.join(summary['errors'])) if summary['errors'] else 'ok'
+        logging.info('{} {} in {}s, {}'.format(field, summary['key'], summary['seconds'], status))
+    return summaries
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--field', default='distro', help='task field the keys are values of')
+    parser.add_argument('--keys', nargs='+', required=True)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--json', help='task dump, or a path template containing {key}')
+    source.add_argument('--mongo-uri')
+    parser.add_argument('--begin', type=datetime.datetime.fromisoformat)
+    parser.add_argument('--end', type=datetime.datetime.fromisoformat)
+    parser.add_argument('--analyses', nargs='+', choices=list(ANALYSES),
+            help='default {}, slowdown_by_version only for --field version'.format(' '.join(DEFAULT_ANALYSES)))
+    parser.add_argument('--out', default=OUT_DIR)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--instrument', action='store_true', help='write stage timings and counters per dataset')
+    parser.add_argument('--test', action='store_true', help='run the doctests instead')
+    if '--test' in sys.argv[1:]:
+        _test()
+        return
+    args = parser.parse_args()
+    run(args.keys, args.field, args.json, args.mongo_uri, args.begin, args.end,
+            args.analyses, args.out, args.processes, instrument=args.instrument)
+
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
+
+if __name__ == '__main__':
+    main()
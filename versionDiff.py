@@ -1,33 +1,165 @@
 #!/usr/bin/env python3
-''' versionDiff.py determines which task types are in one version but not the other,
-after ingesting a specified json for each version.'''
+''' versionDiff.py determines which task types are in one version but not another,
+after ingesting a specified json for each version.
 
-import datetime  
-import json                                                                                                                     
+Any number of dumps can be compared, e.g. dozens of versions of one project:
+
+    ./versionDiff.py task_json/mms_b501148c740bd81c273af3cb3da11ea2b4da69d9.json mms_b2fea32bc34cc0186e3fdd29812aaf6a5b7f7a3a.json
+    ./versionDiff.py --test
+
+A task type is the task _id up to the version hash. The hash is taken from the file name,
+or else from the version field of the first task. Dumps are streamed one task at a time,
+task types are interned as small integers and each version is kept as a bitset over them,
+so memory grows with the number of distinct task types rather than with the number of tasks.
+
+Prints the number of task types added and removed between every pair of versions,
+then the task types added and removed between consecutive versions (or all pairs with --all-pairs).
+
+>>> import os, tempfile
+>>> tmp = tempfile.mkdtemp()
+>>> dumps = []
+>>> for version, names in [('a' * 40, ['compile', 'lint']), ('b' * 40, ['compile', 'test'])]:
+...     dumps.append(os.path.join(tmp, 'mms_{}.json'.format(version)))
+...     with open(dumps[-1], 'w') as f:
+...         _ = f.write(str([{'_id': 'mms_{}_{}_20_01_01'.format(name, version),
+...                          'scheduled_time': '2020-08-05T11:20:03.484Z'} for name in names]).replace("'", '"'))
+>>> index = TaskTypeIndex()
+>>> versions = [read_version(dump, index) for dump in dumps]
+>>> [(version[:4], index.names_of(bits)) for version, bits in versions]
+[('aaaa', ['mms_compile', 'mms_lint']), ('bbbb', ['mms_compile', 'mms_test'])]
+>>> added, removed = diff_matrix([bits for _, bits in versions])
+>>> added, removed
+([[0, 1], [1, 0]], [[0, 1], [1, 0]])
+'''
+
+import argparse
+import datetime
+import itertools
+import os
+import re
 import sys
-import ETA
+
+from ETA.Stream import iter_tasks_from_file
 
 BEGINNING_OF_TIME = datetime.datetime(2000, 1, 1, 0, 0)
-# takes in two json with the version name in title
-json_one = 'task_json/mms_b501148c740bd81c273af3cb3da11ea2b4da69d9.json'
-json_two = 'mms_b2fea32bc34cc0186e3fdd29812aaf6a5b7f7a3a.json'
-
-version_one = 'b501148c740bd81c273af3cb3da11ea2b4da69d9'
-version_two = 'b2fea32bc34cc0186e3fdd29812aaf6a5b7f7a3a'
-
-def json_to_set(json_fname, version):
-    with open(json_fname) as f:
-        j = json.load(f)
-    tasks = set()
-    for item in j:
-        scheduled_time = ETA.convert_ISO_to_datetime(item['scheduled_time'])
-        if scheduled_time < BEGINNING_OF_TIME:
+# ISO strings sort like the times they stand for, so the bad-date check needs no parsing
+_BEGINNING_OF_TIME_ISO = BEGINNING_OF_TIME.isoformat()
+# git revisions, or evergreen patch ids
+VERSION_HASH = re.compile(r'[0-9a-f]{40}|[0-9a-f]{24}')
+
+def version_hash(text):
+    ''' last revision or patch id in text, or None
+
+    >>> version_hash('task_json/mms_b501148c740bd81c273af3cb3da11ea2b4da69d9.json')
+    'b501148c740bd81c273af3cb3da11ea2b4da69d9'
+    '''
+    matches = VERSION_HASH.findall(text)
+    return matches[-1] if matches else None
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+class TaskTypeIndex:
+    ''' interns task type names as integer ids, shared by all versions being compared '''
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def intern(self, name):
+        task_id = self.ids.get(name)
+        if task_id is None:
+            task_id = len(self.names)
+            self.ids[name] = task_id
+            self.names.append(name)
+        return task_id
+
+    def names_of(self, bits):
+        ''' sorted names of the task types in bitset bits '''
+        names = []
+        while bits:
+            lowest = bits & -bits
+            names.append(self.names[lowest.bit_length() - 1])
+            bits ^= lowest
+        return sorted(names)
+
+def read_version(json_fname, index, version=None):
+    ''' streams one version's dump, returns (version hash, bitset of its task types in index).
+    Tasks with a scheduled_time before BEGINNING_OF_TIME are skipped.'''
+    if version is None:
+        version = version_hash(os.path.basename(json_fname))
+    task_ids = set()
+    for item in iter_tasks_from_file(json_fname):
+        scheduled_time = item.get('scheduled_time')
+        if not isinstance(scheduled_time, str) or scheduled_time < _BEGINNING_OF_TIME_ISO:
             continue
-        tasks.add(item['_id'].split(version)[0])
-    return tasks
+        if version is None:
+            version = version_hash(item.get('version', '')) or version_hash(item['_id'])
+            if version is None:
+                raise ValueError('cannot tell the version of {}, pass it explicitly'.format(json_fname))
+        task_ids.add(index.intern(item['_id'].split(version)[0].rstrip('_')))
+    bits = 0
+    for task_id in task_ids:
+        bits |= 1 << task_id
+    return version, bits
+
+def diff_matrix(bitsets):
+    ''' returns (added, removed): added[i][j] is the number of task types in version j but not in i,
+    removed[i][j] the number in i but not in j '''
+    added = [[popcount(other & ~bits) for other in bitsets] for bits in bitsets]
+    removed = [[popcount(bits & ~other) for other in bitsets] for bits in bitsets]
+    return added, removed
+
+def print_matrix(labels, added, removed):
+    ''' one row per base version, each cell +added/-removed going to the column version '''
+    width = max(len(label) for label in labels)
+    cells = [['+{}/-{}'.format(added[i][j], removed[i][j]) for j in range(len(labels))] for i in range(len(labels))]
+    cell_width = max(width, max(len(cell) for row in cells for cell in row))
+    print(' ' * width + ' ' + ' '.join(label.rjust(cell_width) for label in labels))
+    for label, row in zip(labels, cells):
+        print(label.rjust(width) + ' ' + ' '.join(cell.rjust(cell_width) for cell in row))
+
+def main():
+    parser = argparse.ArgumentParser(description='compare the task types of several version dumps')
+    parser.add_argument('dumps', nargs='+', help='one json dump per version, oldest first')
+    parser.add_argument('--versions', nargs='+', help='version hashes, if not in the file names')
+    parser.add_argument('--all-pairs', action='store_true', help='list names for every pair, not just consecutive ones')
+    parser.add_argument('--test', action='store_true', help='run the doctests instead')
+    if '--test' in sys.argv[1:]:
+        _test()
+        return
+    args = parser.parse_args()
+    if args.versions and len(args.versions) != len(args.dumps):
+        parser.error('need one version per dump')
+
+    index = TaskTypeIndex()
+    versions = []
+    for i, json_fname in enumerate(args.dumps):
+        versions.append(read_version(json_fname, index, args.versions[i] if args.versions else None))
+    labels = [version[:10] for version, _ in versions]
+    bitsets = [bits for _, bits in versions]
+    print('{} task types across {} versions'.format(len(index.names), len(versions)))
+    added, removed = diff_matrix(bitsets)
+    print_matrix(labels, added, removed)
+
+    if args.all_pairs:
+        pairs = itertools.combinations(range(len(versions)), 2)
+    else:
+        pairs = zip(range(len(versions) - 1), range(1, len(versions)))
+    for i, j in pairs:
+        print('\n{} -> {}'.format(labels[i], labels[j]))
+        for name in index.names_of(bitsets[i] & ~bitsets[j]):
+            print('- {}'.format(name))
+        for name in index.names_of(bitsets[j] & ~bitsets[i]):
+            print('+ {}'.format(name))
 
-task_set_one = json_to_set(json_one, version_one)
-task_set_two = json_to_set(json_two, version_two)
+def _test():
+    import doctest
+    count, _ = doctest.testmod()
+    if count == 0:
+        print('Doctests passed UwU')
+    else:
+        print('Doctests failed ;_;')
 
-print(task_set_one - task_set_two)
-print(task_set_two - task_set_one)
+if __name__ == '__main__':
+    main()